@@ -7,6 +7,9 @@ A `ServiceManager` object bridges the access to the service providers.
 In the most straightforward cases, getting a service provider is as simple as
 calling `ServiceManager(providerName)` with the name of the service as string
 (e.g. `larProp = ServiceManager('LArProperties')`).
+With `ServiceManager.lazy = True` (or `ServiceManager(providerName, lazy=True)`)
+a proxy is returned instead, and the service provider is loaded only when the
+proxy is first used (see `LArSoftUtils.ServiceProviderProxy`).
 
 
 
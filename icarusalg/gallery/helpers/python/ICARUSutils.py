@@ -10,6 +10,10 @@ This module requires ROOT.
 __all__ = [
   'loadICARUSgeometry',
   'justLoadICARUSgeometry',
+  'channelsToWires',
+  'wiresToChannels',
+  'wireIDdtype',
+  'invalidChannel',
 ]
 
 import galleryUtils
@@ -114,9 +118,8 @@ def loadICARUSchannelMappingClass(
      )
   # try ... except
 
-  # load the libraries
-  for codeObj in mappingInfo.get('load', []):
-    LArSoftUtils.SourceCode.load(codeObj)
+  # load the libraries (and the headers, batched)
+  LArSoftUtils.SourceCode.loadAll(mappingInfo.get('load', []))
 
   # get the class object
   try: mapperClass = ROOTutils.getROOTclass(mappingInfo['mapperClassName'])
@@ -137,7 +140,7 @@ def loadICARUSchannelMappingClass(
 
 
 def loadICARUSgeometry(
-  config = None, registry = None, mappingClass = None,
+  config = None, registry = None, mappingClass = None, snapshotCache = None,
   ):
   """Loads and returns ICARUS geometry with the standard ICARUS channel mapping.
 
@@ -146,8 +149,8 @@ def loadICARUSgeometry(
 
   if mappingClass is None:
     mappingClass = loadICARUSchannelMappingClass(config=config, registry=registry)
-  return LArSoftUtils.loadGeometry \
-    (config=config, registry=registry, mapping=mappingClass)
+  return LArSoftUtils.loadGeometry(config=config, registry=registry,
+    mapping=mappingClass, snapshotCache=snapshotCache)
 # loadICARUSgeometry()
 
 
@@ -160,4 +163,198 @@ def justLoadICARUSgeometry(configFile, mappingClass = None):
 # justLoadICARUSgeometry()
 
 
+################################################################################
+### Channel mapping
+###
+_ChannelMappingCode = """
+#include "larcoreobj/SimpleTypesAndConstants/geo_types.h"
+#include "larcoreobj/SimpleTypesAndConstants/RawTypes.h"
+#include <vector>
+#include <type_traits>
+#include <utility> // std::declval()
+#include <cstddef>
+#include <cstdint>
+
+namespace ICARUSutils_mapping {
+  
+  struct WireIDRecord { unsigned int C, T, P, W; };
+  
+  // wire ID check, if the mapper offers one (e.g. `geo::GeometryCore`)
+  template <typename Mapper, typename = void>
+  struct WireChecker {
+    static bool hasWire(Mapper const&, geo::WireID const&) { return true; }
+  };
+  
+  template <typename Mapper>
+  struct WireChecker<Mapper, std::void_t<decltype(
+    std::declval<Mapper const&>().HasWire(std::declval<geo::WireID const&>())
+    )>>
+  {
+    static bool hasWire(Mapper const& mapper, geo::WireID const& wireID)
+      { return mapper.HasWire(wireID); }
+  };
+  
+  // fills `offsets` (`nChannels + 1` entries) and returns all the wires
+  template <typename Mapper>
+  std::vector<WireIDRecord> channelsToWires(Mapper const& mapper,
+    std::uintptr_t channelBuffer, std::size_t nChannels,
+    std::uintptr_t offsetBuffer
+  ) {
+    auto const* channels = reinterpret_cast<raw::ChannelID_t const*>(channelBuffer);
+    auto* offsets = reinterpret_cast<std::int64_t*>(offsetBuffer);
+    raw::ChannelID_t const nValidChannels = mapper.Nchannels();
+    std::vector<WireIDRecord> wires;
+    wires.reserve(nChannels);
+    *(offsets++) = 0;
+    for (std::size_t i = 0; i < nChannels; ++i) {
+      if (channels[i] < nValidChannels) {
+        for (geo::WireID const& wireID: mapper.ChannelToWire(channels[i])) {
+          wires.push_back
+            ({ wireID.Cryostat, wireID.TPC, wireID.Plane, wireID.Wire });
+        }
+      }
+      *(offsets++) = wires.size();
+    } // for
+    return wires;
+  } // channelsToWires()
+  
+  template <typename Mapper>
+  void wiresToChannels(Mapper const& mapper,
+    std::uintptr_t wireBuffer, std::size_t nWires, std::uintptr_t channelBuffer
+  ) {
+    auto const* wires = reinterpret_cast<WireIDRecord const*>(wireBuffer);
+    auto* channels = reinterpret_cast<raw::ChannelID_t*>(channelBuffer);
+    for (std::size_t i = 0; i < nWires; ++i) {
+      geo::WireID const wireID { wires[i].C, wires[i].T, wires[i].P, wires[i].W };
+      channels[i] = WireChecker<Mapper>::hasWire(mapper, wireID)
+        ? mapper.PlaneWireToChannel(wireID): raw::InvalidChannelID;
+    } // for
+  } // wiresToChannels()
+  
+  inline std::uintptr_t dataAddress(std::vector<WireIDRecord> const& v)
+    { return reinterpret_cast<std::uintptr_t>(v.data()); }
+  
+  std::size_t const wireIDrecordSize = sizeof(WireIDRecord);
+  raw::ChannelID_t const invalidChannel = raw::InvalidChannelID;
+  
+} // namespace ICARUSutils_mapping
+"""
+_ChannelMappingDeclared = False
+
+
+def _channelMappingHelpers():
+  """Returns the C++ helper namespace, compiling it on the first call."""
+  global _ChannelMappingDeclared
+  if not _ChannelMappingDeclared:
+    if not ROOT.gInterpreter.Declare(_ChannelMappingCode):
+      raise RuntimeError("Failed to compile the channel mapping helper code")
+    _ChannelMappingDeclared = True
+  # if
+  return ROOT.ICARUSutils_mapping
+# _channelMappingHelpers()
+
+
+def wireIDdtype() -> "NumPy data type of wire ID records":
+  """Record type `(C, T, P, W)` used for wire IDs (as in `GeometryArrays`)."""
+  import numpy
+  return numpy.dtype([ ( 'C', 'u4' ), ( 'T', 'u4' ), ( 'P', 'u4' ), ( 'W', 'u4' ) ])
+# wireIDdtype()
+
+
+def invalidChannel() -> "the value of an invalid channel ID":
+  return int(_channelMappingHelpers().invalidChannel)
+# invalidChannel()
+
+
+def channelsToWires(
+  mapper: "the geometry (`geo::GeometryCore`) or its channel mapping algorithm",
+  channels: "sequence or NumPy array of channel numbers",
+  ) -> "a pair of NumPy arrays `(offsets, wireIDs)`":
+  """Returns the wires associated to each of the `channels`.
+  
+  The wires of all channels are returned in a single structured array of wire
+  IDs (with fields `C`, `T`, `P` and `W`, see `wireIDdtype()`), where the wires
+  of the channel `channels[i]` are `wireIDs[offsets[i]:offsets[i+1]]`;
+  `offsets` has one entry more than `channels`.
+  Invalid channels are associated to no wire; this includes the values which
+  are not channel IDs at all (negative or too large), which are replaced by
+  `invalidChannel()` before the mapping.
+  
+  The mapping of all channels is performed in a single C++ loop.
+  
+  Example:
+      
+      offsets, wireIDs = channelsToWires(geom, numpy.arange(geom.Nchannels()))
+      nWires = numpy.diff(offsets) # number of wires for each channel
+      
+  """
+  import numpy, ctypes
+  helpers = _channelMappingHelpers()
+  channels = numpy.asarray(channels).ravel()
+  if channels.size and channels.dtype.kind not in 'iu':
+    raise ValueError \
+      ("Channel numbers must be integers ({} found)".format(channels.dtype))
+  # values outside the range of channel IDs would wrap around on conversion
+  outOfRange = (channels < 0) | (channels > numpy.iinfo(numpy.uint32).max) \
+    if channels.size else None
+  channels = numpy.ascontiguousarray(channels, dtype=numpy.uint32)
+  if outOfRange is not None and outOfRange.any():
+    channels[outOfRange] = invalidChannel()
+  offsets = numpy.empty(len(channels) + 1, dtype=numpy.int64)
+  wires = helpers.channelsToWires \
+    (mapper, channels.ctypes.data, len(channels), offsets.ctypes.data)
+  
+  dtype = wireIDdtype()
+  assert dtype.itemsize == helpers.wireIDrecordSize
+  nWires = wires.size()
+  if nWires == 0: return offsets, numpy.zeros(0, dtype=dtype)
+  buffer = (ctypes.c_char * (nWires * dtype.itemsize)) \
+    .from_address(helpers.dataAddress(wires))
+  return offsets, numpy.frombuffer(buffer, dtype=dtype).copy()
+# channelsToWires()
+
+
+def _wireIDarray(wireIDs):
+  """Converts `wireIDs` into a contiguous array of `wireIDdtype()` records."""
+  import numpy
+  dtype = wireIDdtype()
+  wireIDs = numpy.asarray(wireIDs)
+  if wireIDs.dtype.names:
+    if len(wireIDs.dtype.names) != 4:
+      raise ValueError("Wire IDs need 4 fields (cryostat, TPC, plane, wire), {} found"
+        .format(len(wireIDs.dtype.names)))
+    # if
+    import numpy.lib.recfunctions
+    wireIDs = numpy.lib.recfunctions.structured_to_unstructured \
+      (wireIDs, dtype=numpy.uint32)
+  # if
+  wireIDs = numpy.ascontiguousarray(wireIDs, dtype=numpy.uint32)
+  if wireIDs.ndim != 2 or wireIDs.shape[1] != 4:
+    raise ValueError("Wire IDs should be (cryostat, TPC, plane, wire) records")
+  return wireIDs.view(dtype).ravel()
+# _wireIDarray()
+
+
+def wiresToChannels(
+  mapper: "the geometry (`geo::GeometryCore`) or its channel mapping algorithm",
+  wireIDs: "structured array of (cryostat, TPC, plane, wire), or N x 4 array",
+  ) -> "a NumPy array with the channel of each wire":
+  """Returns the channel each of the wires in `wireIDs` is connected to.
+  
+  The wire IDs can be a structured array with four fields (cryostat, TPC,
+  plane and wire, in this order, like `wireIDdtype()`) or a 2D array with
+  four columns. When the geometry is used as `mapper`, nonexistent wires are
+  assigned the invalid channel value (see `invalidChannel()`).
+  The mapping of all wires is performed in a single C++ loop.
+  """
+  import numpy
+  helpers = _channelMappingHelpers()
+  wireIDs = _wireIDarray(wireIDs)
+  channels = numpy.empty(len(wireIDs), dtype=numpy.uint32)
+  helpers.wiresToChannels \
+    (mapper, wireIDs.ctypes.data, len(wireIDs), channels.ctypes.data)
+  return channels
+# wiresToChannels()
+
+
 ################################################################################
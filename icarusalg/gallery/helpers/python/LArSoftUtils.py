@@ -23,7 +23,10 @@ __all__ = [
   'ConfigurationHelper',
   'loadGeometry',
   'justLoadGeometry',
+  'GeometrySnapshotCache',
+  'GeometryArrays',
   'loadSimpleService',
+  'ServiceProviderProxy',
   ]
 
 import sys, os
@@ -47,12 +50,175 @@ readHeader = galleryUtils.readHeader
 ################################################################################
 ### LArSoft
 ################################################################################
-def loadGeometry(config=None, registry=None, mapping=None):
+def _digestFile(digest, path):
+  """Adds the content of the file at `path` to `digest`, and returns it."""
+  with open(path, 'rb') as sourceFile:
+    for block in iter(lambda: sourceFile.read(2**20), b''): digest.update(block)
+  # with
+  return digest
+# _digestFile()
+
+
+class GeometrySnapshotCache:
+  """
+  Cache of geometry descriptions already parsed from GDML.
+  
+  The geometry description (`TGeoManager`) built from a GDML file is exported
+  into a ROOT file in the cache directory; later geometry setups with the
+  same GDML file content, the same geometry configuration and the same
+  versions of the libraries import that file instead of parsing the GDML.
+  The `geo::GeometryCore` object (with the sorting of the geometry elements
+  and the channel mapping) is still set up from the geometry description.
+  
+  If a snapshot can't be exported or used, the failure is recorded in the
+  cache directory (a `.failed` marker, like in `cppUtils.HeaderCache`) and
+  the cache is not used any more for that key.
+  
+  The cache is used by `loadGeometry()` when explicitly requested, or when
+  the environment variable `ICARUSALG_GEOMETRY_CACHE` is set (to `1`, or to
+  the cache directory).
+  """
+  VersionVariables = ( 'LARCOREALG_VERSION', 'ICARUSALG_VERSION', )
+  
+  def __init__(self, cacheDir: "cache directory (default: in cache area)" = None):
+    self.cacheDir = cacheDir if cacheDir else ROOTutils.cacheDirectory('geometry')
+    os.makedirs(self.cacheDir, exist_ok=True)
+  # __init__()
+  
+  @staticmethod
+  def geometrySourcePath(geometryConfig) -> "path of the geometry description, or `None`":
+    """Locates the geometry description file (`ROOT` parameter) like LArSoft."""
+    return GeometrySnapshotCache.findGeometryFile(geometryConfig, 'ROOT')
+  
+  @staticmethod
+  def findGeometryFile(geometryConfig, parameter) -> "full path, or `None`":
+    """Locates the file in the `parameter` of configuration like LArSoft."""
+    name = galleryUtils.getTableIfPresent(geometryConfig, parameter, type_=ROOT.std.string)
+    if not name: return None
+    relPath = galleryUtils.getTableIfPresent \
+      (geometryConfig, 'RelativePath', defValue='', type_=ROOT.std.string)
+    path = os.path.join(str(relPath), str(name))
+    if os.path.isabs(path): return path if os.path.isfile(path) else None
+    for searchDir in os.environ.get('FW_SEARCH_PATH', '').split(':'):
+      candidate = os.path.join(searchDir, path)
+      if searchDir and os.path.isfile(candidate): return candidate
+    # for
+    return None
+  # findGeometryFile()
+  
+  def key(self, geometryConfig) -> "the cache key, or `None` if not cacheable":
+    import hashlib
+    sourcePath = self.geometrySourcePath(geometryConfig)
+    if sourcePath is None: return None
+    digest = _digestFile(hashlib.sha1(), sourcePath)
+    digest.update(str(geometryConfig.to_string()).encode('utf-8'))
+    digest.update(repr([
+      os.environ.get(varName, '') for varName in self.VersionVariables
+      ] + [ str(ROOT.gROOT.GetVersion()) ]).encode('utf-8'))
+    return digest.hexdigest()[:20]
+  # key()
+  
+  def snapshotPath(self, key): return os.path.join(self.cacheDir, "geometry_%s.root" % key)
+  
+  def failedPath(self, key): return os.path.join(self.cacheDir, "geometry_%s.failed" % key)
+  
+  def hasFailed(self, key) -> "whether the snapshot is known not to work":
+    return os.path.exists(self.failedPath(key))
+  
+  def markFailed(self, key):
+    """Records that the snapshot for `key` is not to be used (and removes it)."""
+    open(self.failedPath(key), 'w').close()
+    try: os.unlink(self.snapshotPath(key))
+    except FileNotFoundError: pass
+  # markFailed()
+  
+  def snapshotConfig(self, geometryConfig, snapshotPath):
+    """Returns a copy of the configuration reading the geometry from `snapshotPath`.
+    
+    LArSoft prepends `RelativePath` to both the `ROOT` and the `GDML` file
+    names; so the latter is replaced by its full path, found via
+    `RelativePath` as LArSoft would, and `RelativePath` is then cleared.
+    """
+    snapshotConfig = ROOT.fhicl.ParameterSet(geometryConfig)
+    if snapshotConfig.has_key('RelativePath'):
+      GDMLpath = self.findGeometryFile(geometryConfig, 'GDML')
+      if GDMLpath: snapshotConfig.put_or_replace('GDML', GDMLpath)
+      snapshotConfig.put_or_replace('RelativePath', '')
+    # if
+    snapshotConfig.put_or_replace('ROOT', snapshotPath)
+    return snapshotConfig
+  # snapshotConfig()
+  
+  def save(self, key):
+    """Exports the current geometry description (`gGeoManager`) as snapshot."""
+    import tempfile, logging
+    fd, tempPath = tempfile.mkstemp(dir=self.cacheDir, suffix='.root')
+    os.close(fd)
+    try:
+      if ROOT.gGeoManager.Export(tempPath) <= 0:
+        raise RuntimeError("TGeoManager::Export() failed")
+      os.replace(tempPath, self.snapshotPath(key))
+    except Exception as e:
+      logging.warning("Geometry snapshot not saved: %s", e)
+      os.unlink(tempPath)
+      self.markFailed(key)
+    # try ... except
+  # save()
+  
+# class GeometrySnapshotCache
+
+
+def _makeGeometrySnapshotCache(snapshotCache):
+  """Returns the snapshot cache to use (see `loadGeometry()`), or `None`."""
+  if snapshotCache is None:
+    setting = os.environ.get('ICARUSALG_GEOMETRY_CACHE', '')
+    if setting in ( '', '0' ): return None
+    return GeometrySnapshotCache(None if setting == '1' else setting)
+  # if
+  if snapshotCache is True: return GeometrySnapshotCache()
+  return snapshotCache or None
+# _makeGeometrySnapshotCache()
+
+
+def _setupGeometry(mapping, geometryConfig, snapshotCache):
+  """Sets up the geometry, via the snapshot cache if possible."""
+  import logging
+  if snapshotCache:
+    key = snapshotCache.key(geometryConfig)
+    if key and snapshotCache.hasFailed(key): key = None
+    snapshotPath = snapshotCache.snapshotPath(key) if key else None
+    if snapshotPath and os.path.exists(snapshotPath):
+      try:
+        return ROOT.lar.standalone.SetupGeometry[mapping](
+          snapshotCache.snapshotConfig(geometryConfig, snapshotPath)
+          )
+      except Exception as e:
+        logging.warning(
+          "Geometry snapshot '%s' could not be used (%s): rebuilding geometry"
+          " (and not using the snapshot cache for it any more).",
+          snapshotPath, e)
+        snapshotCache.markFailed(key)
+        key = None
+      # try ... except
+    # if snapshot available
+  else: key = None
+  service = ROOT.lar.standalone.SetupGeometry[mapping](geometryConfig)
+  if key: snapshotCache.save(key)
+  return service
+# _setupGeometry()
+
+
+def loadGeometry(config=None, registry=None, mapping=None, snapshotCache=None):
   """The argument `config` is an instance of `ConfigurationClass`.
 
   If a config object is provided, configurations will be read from there.
   Otherwise, they will be read from the registry.
   If a registry is provided, the services will be registered in there.
+  
+  If `snapshotCache` is `True` (or a `GeometrySnapshotCache` object), the
+  geometry description is read from a snapshot of a previous setup, when
+  available (see `GeometrySnapshotCache`); if it is `None`, the cache is used
+  only if enabled via the environment; if `False`, it is not used.
   """
   assert(config or registry)
   serviceName = 'Geometry'
@@ -69,11 +235,14 @@ def loadGeometry(config=None, registry=None, mapping=None):
     raise RuntimeError("Failed to retrieve the configuration for %s service" % serviceName)
 
   if not mapping:
-    SourceCode.loadHeaderFromUPS('larcorealg/Geometry/ChannelMapStandardAlg.h')
+    SourceCode.loadHeaderFromUPS('larcorealg/Geometry/ChannelMapStandardAlg.h',
+      lookups=[ 'geo::ChannelMapStandardAlg' ])
     mapping = ROOT.geo.ChannelMapStandardAlg
+  # (function templates are not served by the header cache: no lookups)
   SourceCode.loadHeaderFromUPS("larcorealg/Geometry/StandaloneGeometrySetup.h")
   SourceCode.loadLibrary("larcorealg_Geometry")
-  service = ROOT.lar.standalone.SetupGeometry[mapping](geometryConfig)
+  service = _setupGeometry \
+    (mapping, geometryConfig, _makeGeometrySnapshotCache(snapshotCache))
   if registry: registry.register(serviceName, service)
 
   # make it easy to print points and vectors in python
@@ -113,6 +282,428 @@ def justLoadGeometry(configFile, mapping=None):
 # justLoadGeometry()
 
 
+################################################################################
+_GeometryArraysCode = """
+#include "larcorealg/Geometry/GeometryCore.h"
+#include <vector>
+#include <cstddef>
+#include <cstdint>
+
+namespace LArSoftUtils_geometry {
+  
+  struct CryostatRecord {
+    unsigned int C;
+    double min[3], max[3], center[3];
+    unsigned int nTPCs;
+  };
+  
+  struct TPCRecord {
+    unsigned int C, T;
+    double min[3], max[3], activeMin[3], activeMax[3], center[3];
+    double driftDir[3];
+    unsigned int nPlanes;
+  };
+  
+  struct PlaneRecord {
+    unsigned int C, T, P;
+    int view;
+    double min[3], max[3], center[3];
+    double wirePitch, thetaZ;
+    double wireOrigin[3], wireCoordDir[3];
+    unsigned int nWires, firstWire;
+  };
+  
+  struct WireRecord {
+    unsigned int C, T, P, W;
+    unsigned int plane;
+    double start[3], end[3], center[3];
+    double length, thetaZ;
+  };
+  
+  std::vector<std::size_t> const recordSizes {
+    sizeof(CryostatRecord), sizeof(TPCRecord),
+    sizeof(PlaneRecord), sizeof(WireRecord)
+  };
+  
+  template <typename Point>
+  void copyPoint(Point const& point, double* out)
+    { out[0] = point.X(); out[1] = point.Y(); out[2] = point.Z(); }
+  
+  template <typename Box>
+  void copyBox(Box const& box, double* min, double* max) {
+    min[0] = box.MinX(); min[1] = box.MinY(); min[2] = box.MinZ();
+    max[0] = box.MaxX(); max[1] = box.MaxY(); max[2] = box.MaxZ();
+  }
+  
+  // number of cryostats, TPCs, planes and wires
+  std::vector<std::size_t> counts(geo::GeometryCore const& geom) {
+    std::vector<std::size_t> n(4, 0);
+    for (geo::CryostatGeo const& cryo: geom.IterateCryostats()) {
+      ++n[0];
+      for (unsigned int t = 0; t < cryo.NTPC(); ++t) {
+        geo::TPCGeo const& tpc = cryo.TPC(t);
+        ++n[1];
+        for (unsigned int p = 0; p < tpc.Nplanes(); ++p) {
+          ++n[2];
+          n[3] += tpc.Plane(p).Nwires();
+        }
+      }
+    }
+    return n;
+  } // counts()
+  
+  // fills all the tables in a single pass; returns the number of wires
+  std::size_t fill(geo::GeometryCore const& geom,
+    std::uintptr_t cryostatBuffer, std::uintptr_t TPCbuffer,
+    std::uintptr_t planeBuffer, std::uintptr_t wireBuffer
+  ) {
+    auto* cryoOut = reinterpret_cast<CryostatRecord*>(cryostatBuffer);
+    auto* tpcOut = reinterpret_cast<TPCRecord*>(TPCbuffer);
+    auto* planeOut = reinterpret_cast<PlaneRecord*>(planeBuffer);
+    auto* wireOut = reinterpret_cast<WireRecord*>(wireBuffer);
+    unsigned int iPlane = 0, iWire = 0;
+    for (geo::CryostatGeo const& cryo: geom.IterateCryostats()) {
+      cryoOut->C = cryo.ID().Cryostat;
+      copyBox(cryo.BoundingBox(), cryoOut->min, cryoOut->max);
+      copyPoint(cryo.GetCenter(), cryoOut->center);
+      cryoOut->nTPCs = cryo.NTPC();
+      ++cryoOut;
+      for (unsigned int t = 0; t < cryo.NTPC(); ++t) {
+        geo::TPCGeo const& tpc = cryo.TPC(t);
+        tpcOut->C = tpc.ID().Cryostat;
+        tpcOut->T = tpc.ID().TPC;
+        copyBox(tpc.BoundingBox(), tpcOut->min, tpcOut->max);
+        copyBox(tpc.ActiveBoundingBox(), tpcOut->activeMin, tpcOut->activeMax);
+        copyPoint(tpc.GetCenter(), tpcOut->center);
+        copyPoint(tpc.DriftDir(), tpcOut->driftDir);
+        tpcOut->nPlanes = tpc.Nplanes();
+        ++tpcOut;
+        for (unsigned int p = 0; p < tpc.Nplanes(); ++p) {
+          geo::PlaneGeo const& plane = tpc.Plane(p);
+          geo::PlaneID const& planeID = plane.ID();
+          planeOut->C = planeID.Cryostat;
+          planeOut->T = planeID.TPC;
+          planeOut->P = planeID.Plane;
+          planeOut->view = static_cast<int>(plane.View());
+          copyBox(plane.BoundingBox(), planeOut->min, planeOut->max);
+          copyPoint(plane.GetCenter(), planeOut->center);
+          planeOut->wirePitch = plane.WirePitch();
+          planeOut->thetaZ = plane.ThetaZ();
+          copyPoint(plane.FirstWire().GetCenter(), planeOut->wireOrigin);
+          copyPoint(plane.GetIncreasingWireDirection(), planeOut->wireCoordDir);
+          planeOut->nWires = plane.Nwires();
+          planeOut->firstWire = iWire;
+          ++planeOut;
+          for (unsigned int w = 0; w < plane.Nwires(); ++w) {
+            geo::WireGeo const& wire = plane.Wire(w);
+            wireOut->C = planeID.Cryostat;
+            wireOut->T = planeID.TPC;
+            wireOut->P = planeID.Plane;
+            wireOut->W = w;
+            wireOut->plane = iPlane;
+            copyPoint(wire.GetStart(), wireOut->start);
+            copyPoint(wire.GetEnd(), wireOut->end);
+            copyPoint(wire.GetCenter(), wireOut->center);
+            wireOut->length = wire.Length();
+            wireOut->thetaZ = wire.ThetaZ();
+            ++wireOut;
+            ++iWire;
+          } // for wires
+          ++iPlane;
+        } // for planes
+      } // for TPCs
+    } // for cryostats
+    return iWire;
+  } // fill()
+  
+} // namespace LArSoftUtils_geometry
+"""
+
+
+class GeometryArrays:
+  """
+  NumPy tables of the geometry elements (cryostats, TPCs, planes and wires).
+  
+  The tables are filled from a `geo::GeometryCore` object in a single pass
+  by C++ code, so that their content can be queried in a vectorized way
+  instead of calling the geometry interface one element at a time.
+  Each table is a NumPy structured array with a record per element, in the
+  same order as the geometry iteration, and with the fields:
+  
+  * `cryostats`: `C`, `min`, `max` and `center` (3D points), `nTPCs`
+  * `TPCs`: `C`, `T`, `min`, `max`, `activeMin`, `activeMax`, `center`,
+    `driftDir` (3D vectors), `nPlanes`
+  * `planes`: `C`, `T`, `P`, `view` (`geo::View_t` value), `min`, `max`,
+    `center`, `wirePitch`, `thetaZ`, `wireOrigin` (center of the first wire),
+    `wireCoordDir` (direction of increasing wire number), `nWires`,
+    `firstWire` (index of the first wire of the plane in the `wires` table)
+  * `wires`: `C`, `T`, `P`, `W`, `plane` (index in the `planes` table),
+    `start`, `end`, `center` (3D points), `length`, `thetaZ`
+  
+  For example, `arrays.wires['start'][:, 1]` are the _y_ coordinates of the
+  start of all the wires in the detector.
+  
+  The tables can be saved to and loaded from a NumPy file (`save()`, `load()`);
+  `cached()` takes care of reusing the tables saved for the same geometry.
+  
+  Some queries on many points at once are also provided: `findTPCs()` and
+  `projectPoints()` (wire coordinates and nearest wires).
+  """
+  TablesVersion = 2
+  Tables = ( 'cryostats', 'TPCs', 'planes', 'wires', )
+  HelpersDeclared = False
+  
+  @staticmethod
+  def dtypes() -> "a dictionary: table name -> NumPy record data type":
+    import numpy
+    point = ( 'f8', (3,) )
+    makeType = lambda fields: numpy.dtype(fields, align=True)
+    return {
+      'cryostats': makeType([
+        ( 'C', 'u4' ),
+        ( 'min', ) + point, ( 'max', ) + point, ( 'center', ) + point,
+        ( 'nTPCs', 'u4' ),
+        ]),
+      'TPCs': makeType([
+        ( 'C', 'u4' ), ( 'T', 'u4' ),
+        ( 'min', ) + point, ( 'max', ) + point,
+        ( 'activeMin', ) + point, ( 'activeMax', ) + point,
+        ( 'center', ) + point, ( 'driftDir', ) + point,
+        ( 'nPlanes', 'u4' ),
+        ]),
+      'planes': makeType([
+        ( 'C', 'u4' ), ( 'T', 'u4' ), ( 'P', 'u4' ), ( 'view', 'i4' ),
+        ( 'min', ) + point, ( 'max', ) + point, ( 'center', ) + point,
+        ( 'wirePitch', 'f8' ), ( 'thetaZ', 'f8' ),
+        ( 'wireOrigin', ) + point, ( 'wireCoordDir', ) + point,
+        ( 'nWires', 'u4' ), ( 'firstWire', 'u4' ),
+        ]),
+      'wires': makeType([
+        ( 'C', 'u4' ), ( 'T', 'u4' ), ( 'P', 'u4' ), ( 'W', 'u4' ),
+        ( 'plane', 'u4' ),
+        ( 'start', ) + point, ( 'end', ) + point, ( 'center', ) + point,
+        ( 'length', 'f8' ), ( 'thetaZ', 'f8' ),
+        ]),
+      }
+  # dtypes()
+  
+  def __init__(self,
+   geom: "the `geo::GeometryCore` object to extract the tables from" = None,
+   tables: "(alternative to `geom`) dictionary of already filled tables" = None,
+   ):
+    assert (geom is None) != (tables is None)
+    if tables is None: tables = self._extract(geom)
+    for name in self.Tables: setattr(self, name, tables[name])
+    self._planeIndex = dict(
+      ( ( int(plane['C']), int(plane['T']), int(plane['P']) ), iPlane )
+      for iPlane, plane in enumerate(self.planes)
+      )
+  # __init__()
+  
+  @staticmethod
+  def _helpers():
+    if not GeometryArrays.HelpersDeclared:
+      SourceCode.loadHeaderFromUPS \
+        ("larcorealg/Geometry/GeometryCore.h", lookups=[ 'geo::GeometryCore' ])
+      if not ROOT.gInterpreter.Declare(_GeometryArraysCode):
+        raise RuntimeError("Failed to compile the geometry table extraction code")
+      GeometryArrays.HelpersDeclared = True
+    # if
+    return ROOT.LArSoftUtils_geometry
+  # _helpers()
+  
+  @classmethod
+  def _extract(cls, geom):
+    import numpy
+    helpers = cls._helpers()
+    dtypes = cls.dtypes()
+    for name, recordSize in zip(cls.Tables, helpers.recordSizes):
+      if dtypes[name].itemsize != recordSize:
+        raise RuntimeError(
+          "Geometry table '{}' layout mismatch: {} bytes in NumPy, {} in C++"
+          .format(name, dtypes[name].itemsize, recordSize)
+          )
+      # if
+    # for
+    counts = helpers.counts(geom)
+    tables = dict(
+      ( name, numpy.zeros(n, dtype=dtypes[name]) )
+      for name, n in zip(cls.Tables, counts)
+      )
+    nWires = helpers.fill(geom, *( tables[name].ctypes.data for name in cls.Tables ))
+    assert nWires == len(tables['wires'])
+    return tables
+  # _extract()
+  
+  def planeIndex(self,
+   planeID: "a `geo::PlaneID` or a `(C, T, P)` tuple",
+   ) -> "index of the plane in the `planes` table":
+    if not isinstance(planeID, tuple):
+      planeID = ( planeID.Cryostat, planeID.TPC, planeID.Plane )
+    return self._planeIndex[tuple(map(int, planeID))]
+  # planeIndex()
+  
+  def planeWires(self,
+   planeID: "a `geo::PlaneID` or a `(C, T, P)` tuple",
+   ) -> "the part of the `wires` table with the wires of the plane (a view)":
+    plane = self.planes[self.planeIndex(planeID)]
+    first = int(plane['firstWire'])
+    return self.wires[first:first + int(plane['nWires'])]
+  # planeWires()
+  
+  @staticmethod
+  def _pointArray(points):
+    """Returns `points` as a N x 3 array of coordinates."""
+    import numpy
+    points = numpy.asarray(points, dtype=numpy.float64)
+    if points.ndim == 1: points = points.reshape(1, -1)
+    if points.ndim != 2 or points.shape[1] != 3:
+      raise ValueError("Points must be a N x 3 array (found shape {})"
+        .format(points.shape))
+    # if
+    return points
+  # _pointArray()
+  
+  def _planeRows(self, where):
+    """Returns the indices of the planes in `where` (a plane or a TPC), and
+    whether `where` is a single plane."""
+    import numpy
+    if not isinstance(where, tuple):
+      where = ( where.Cryostat, where.TPC, where.Plane ) \
+        if hasattr(where, 'Plane') else ( where.Cryostat, where.TPC )
+    # if
+    if len(where) == 3: return [ self.planeIndex(where) ], True
+    C, T = map(int, where)
+    rows = numpy.flatnonzero((self.planes['C'] == C) & (self.planes['T'] == T))
+    if len(rows) == 0: raise KeyError("No planes in C:{} T:{}".format(C, T))
+    return list(rows), False
+  # _planeRows()
+  
+  def findTPCs(self,
+   points: "N x 3 array of positions",
+   active: "whether to use the active volume instead of the whole TPC" = False,
+   ) -> "array with the index in `TPCs` table of the TPC of each point (or -1)":
+    """Returns which TPC each of the points is in.
+    
+    The result is an index in the `TPCs` table, e.g. the TPC number of the
+    points is `arrays.TPCs['T'][indices]` (for those with valid indices).
+    Points not in any TPC are assigned index `-1`. The boundaries of the TPC
+    volumes are included.
+    """
+    import numpy
+    points = self._pointArray(points)
+    minField, maxField = ( 'activeMin', 'activeMax' ) if active else ( 'min', 'max' )
+    indices = numpy.full(len(points), -1, dtype=numpy.int64)
+    for iTPC, ( lower, upper ) \
+     in enumerate(zip(self.TPCs[minField], self.TPCs[maxField])):
+      inside = numpy.all((points >= lower) & (points <= upper), axis=1)
+      indices[inside & (indices < 0)] = iTPC
+    # for
+    return indices
+  # findTPCs()
+  
+  def projectPoints(self,
+   points: "N x 3 array of positions",
+   where: "a plane (`geo::PlaneID` or `(C, T, P)`) or a TPC (`(C, T)`)",
+   ) -> "a tuple of arrays: `(wireCoordinates, nearestWires, valid)`":
+    """Projects `points` on the wires of a plane, or of all planes of a TPC.
+    
+    This is the equivalent of `geo::PlaneGeo::WireCoordinate()` and
+    `geo::PlaneGeo::NearestWireID()` for all the points at once.
+    The three returned arrays are:
+    * the wire coordinate (in wire pitch units) of each point
+    * the number of the wire nearest to each point
+    * whether that wire exists (when not, `NearestWireID()` would throw)
+    
+    If `where` is a plane, each array has one entry per point; if it is a TPC,
+    each array has a row per point and a column per plane (in plane order).
+    """
+    import numpy
+    points = self._pointArray(points)
+    rows, singlePlane = self._planeRows(where)
+    planes = self.planes[rows]
+    # N x nPlanes: (point - wire origin) . wire coordinate direction / pitch
+    coordinates = (
+      numpy.einsum('ik,jk->ij', points, planes['wireCoordDir'])
+      - numpy.einsum('jk,jk->j', planes['wireOrigin'], planes['wireCoordDir'])
+      ) / planes['wirePitch']
+    # rounding half away from zero, like `std::lround()`
+    nearest = numpy.copysign(numpy.floor(numpy.abs(coordinates) + 0.5), coordinates)
+    valid = (nearest >= 0) & (nearest < planes['nWires'])
+    nearest = nearest.astype(numpy.int64)
+    if singlePlane:
+      coordinates, nearest, valid = coordinates[:, 0], nearest[:, 0], valid[:, 0]
+    return coordinates, nearest, valid
+  # projectPoints()
+  
+  def save(self, path: "path of the NumPy (`.npz`) file to be written"):
+    """Writes all the tables into a NumPy file."""
+    import numpy
+    galleryUtils._atomicWrite(path, lambda outFile: numpy.savez(outFile,
+      version=numpy.array(self.TablesVersion),
+      **dict(( name, getattr(self, name) ) for name in self.Tables)
+      ))
+  # save()
+  
+  @classmethod
+  def load(cls, path: "path of a NumPy file written by `save()`"):
+    """Returns a `GeometryArrays` object with the tables read from `path`."""
+    import numpy
+    with numpy.load(path) as data:
+      if int(data['version']) != cls.TablesVersion:
+        raise RuntimeError("Geometry tables in '{}' have version {} (not {})"
+          .format(path, int(data['version']), cls.TablesVersion))
+      # if
+      return cls(tables=dict(( name, data[name] ) for name in cls.Tables))
+    # with
+  # load()
+  
+  @classmethod
+  def cacheKey(cls, geom) -> "a string identifying the geometry tables":
+    import hashlib
+    digest = hashlib.sha1()
+    digest.update(repr([
+      cls.TablesVersion, str(geom.DetectorName()), int(geom.Nchannels()),
+      ] + [
+      os.environ.get(varName, '')
+      for varName in GeometrySnapshotCache.VersionVariables
+      ]).encode('utf-8'))
+    geometryFile = str(geom.GDMLFile())
+    if os.path.isfile(geometryFile): _digestFile(digest, geometryFile)
+    else: digest.update(geometryFile.encode('utf-8'))
+    return digest.hexdigest()[:20]
+  # cacheKey()
+  
+  @classmethod
+  def cached(cls,
+   geom: "the `geo::GeometryCore` object to extract the tables from",
+   cacheDir: "directory of the cached tables (default: in cache area)" = None,
+   ):
+    """Returns the tables of `geom`, reading them from the cache if available.
+    
+    The tables are stored in the same cache directory as the geometry
+    snapshots (see `GeometrySnapshotCache`), keyed on the geometry description
+    file, the detector name, the number of channels and the software versions.
+    """
+    import logging
+    if not cacheDir: cacheDir = ROOTutils.cacheDirectory('geometry')
+    cachePath \
+      = os.path.join(cacheDir, "geometryArrays_%s.npz" % cls.cacheKey(geom))
+    if os.path.exists(cachePath):
+      try: return cls.load(cachePath)
+      except Exception as e:
+        logging.warning("Geometry tables in '%s' not usable (%s): rebuilding.",
+          cachePath, e)
+      # try ... except
+    # if
+    arrays = cls(geom)
+    arrays.save(cachePath)
+    return arrays
+  # cached()
+  
+# class GeometryArrays
+
+
 ################################################################################
 def loadSimpleService \
   (serviceClass, config=None, registry=None, interfaceClass=None, args = []):
@@ -219,12 +810,12 @@ class SimpleServiceLoader:
   def load(self, manager):
     # load the required service dependencies
     dependencies = [
-      manager(dependency) for dependency in self.serviceDependencies
+      ServiceProviderProxy.resolve(manager(dependency))
+      for dependency in self.serviceDependencies
       ]
 
-    # load the required headers and libraries
-    for header in self.headers:
-      galleryUtils.SourceCode.loadHeaderFromUPS(header)
+    # load the required headers (all together) and libraries
+    galleryUtils.SourceCode.loadHeadersFromUPS(self.headers)
     for library in self.libraries:
       galleryUtils.SourceCode.loadLibrary(library)
 
@@ -276,6 +867,61 @@ class GeometryServiceGetter:
 
 
 
+class ServiceProviderProxy:
+  """Stand-in for a service provider, which is loaded only on first use.
+
+  The proxy records which service it stands for and the manager to get it
+  from. The actual loading of the provider (headers, libraries, construction
+  and its dependencies) happens the first time an attribute of the proxy is
+  accessed, or when `load()` is explicitly called; after that, all attribute
+  access is forwarded to the provider.
+
+  The proxy itself can't be passed to C++ code: use `load()` (or
+  `ServiceProviderProxy.resolve()`) to get the actual provider in that case.
+  """
+  __slots__ = ( 'manager_', 'serviceKey_', 'interfaceClass_', 'provider_', )
+
+  def __init__(self, manager, serviceKey, interfaceClass = None):
+    self.manager_ = manager
+    self.serviceKey_ = serviceKey
+    self.interfaceClass_ = interfaceClass
+    self.provider_ = None
+  # __init__()
+
+  def serviceKey(self): return self.serviceKey_
+
+  def isLoaded(self): return self.provider_ is not None
+
+  def load(self):
+    """Returns the service provider, loading it if needed."""
+    if self.provider_ is None:
+      self.provider_ = self.manager_.get \
+        (self.serviceKey_, interfaceClass=self.interfaceClass_, lazy=False)
+    # if
+    return self.provider_
+  # load()
+
+  @staticmethod
+  def resolve(provider):
+    """Returns the actual provider, loading it if `provider` is a proxy."""
+    return provider.load() if isinstance(provider, ServiceProviderProxy) else provider
+
+  def __getattr__(self, name):
+    # protect against lookups on a (copied) proxy not initialized yet
+    if name.startswith('__') or name.endswith('_'): raise AttributeError(name)
+    return getattr(self.load(), name)
+  # __getattr__()
+
+  def __repr__(self):
+    return "<{} service provider proxy ({})>".format(
+      self.serviceKey_, "loaded" if self.isLoaded() else "not loaded yet"
+      )
+  # __repr__()
+
+# class ServiceProviderProxy
+
+
+
 class ServiceManagerInterface:
   """The interface of a service manager implementation."""
 
@@ -311,18 +957,30 @@ class ServiceManagerInterface:
   # registerLoader()
 
 
-  def get(self, serviceName, interfaceClass = None):
+  def get(self, serviceName, interfaceClass = None, lazy = None):
     """Return (and load first when needed) the specified service.
 
     The service can be specified by name or by class.
     In the former case, if the service is not already configured, an exception
     will be raised.
+    If `lazy` is `True`, a service not loaded yet is returned as a proxy
+    (`ServiceProviderProxy`) which loads it on first use.
     """
     return NotImplementedError
   # get()
 
-  def __call__(self, serviceName, interfaceClass = None):
-    return self.get(serviceName, interfaceClass=interfaceClass)
+  def proxy(self, serviceName, interfaceClass = None):
+    """Returns a proxy for the specified service, loading it on first use."""
+    proxies = self.__dict__.setdefault('proxies_', {})
+    try: return proxies[serviceName]
+    except KeyError: pass
+    proxy = ServiceProviderProxy(self, serviceName, interfaceClass=interfaceClass)
+    proxies[serviceName] = proxy
+    return proxy
+  # proxy()
+
+  def __call__(self, serviceName, interfaceClass = None, lazy = None):
+    return self.get(serviceName, interfaceClass=interfaceClass, lazy=lazy)
 
 
 # class ServiceManagerInterface
@@ -330,7 +988,7 @@ class ServiceManagerInterface:
 
 class ServiceManagerClass(ServiceManagerInterface):
 
-  def __init__(self, config, loadingTable = {}, preload = []):
+  def __init__(self, config, loadingTable = {}, preload = [], lazy = False):
 
     #
     # prepare the service registry
@@ -342,6 +1000,11 @@ class ServiceManagerClass(ServiceManagerInterface):
     #
     self.loadingTable = loadingTable.copy()
 
+    #
+    # whether to return service provider proxies by default
+    #
+    self.lazy = lazy
+
     #
     # message facility
     #
@@ -351,7 +1014,7 @@ class ServiceManagerClass(ServiceManagerInterface):
     #
     # preload services
     #
-    for serviceKey in preload: self.get(serviceKey)
+    for serviceKey in preload: self.get(serviceKey, lazy=False)
 
   # __init__()
 
@@ -360,7 +1023,7 @@ class ServiceManagerClass(ServiceManagerInterface):
   def loaders(self): return self.loadingTable
 
 
-  def get(self, serviceKey, interfaceClass = None):
+  def get(self, serviceKey, interfaceClass = None, lazy = None):
     """Return the specified service.
 
     The service can be specified by name or by class.
@@ -370,12 +1033,18 @@ class ServiceManagerClass(ServiceManagerInterface):
     in which case `interfaceClass` is also passed to
     `LArSoftUtils.loadSimpleService()`.
 
+    If the service is not loaded yet and `lazy` is `True` (or it is `None` and
+    the manager was created `lazy`), a `ServiceProviderProxy` is returned
+    instead, and the loading is postponed to the first use of the proxy.
     """
 
     # if it is already cached, let's use it
     try: return self.registry().get(serviceKey)
     except KeyError: pass
 
+    if self.lazy if lazy is None else lazy:
+      return self.proxy(serviceKey, interfaceClass=interfaceClass)
+
     # first try to see if there is a loader available for this service
     try:
       loader = self.loadingTable[serviceKey]
@@ -446,6 +1115,7 @@ class ServiceManagerInstance(ServiceManagerInterface):
   def __init__(self):
     self.manager = None
     self.configuration = None
+    self.lazy = False # whether `get()` returns service provider proxies
 
   def registry(self):
     """Returns the service registry."""
@@ -462,15 +1132,21 @@ class ServiceManagerInstance(ServiceManagerInterface):
   # registerLoader()
 
 
-  def get(self, serviceKey, interfaceClass = None):
+  def get(self, serviceKey, interfaceClass = None, lazy = None):
     """Return (and load first when needed) the specified service.
 
     The service can be specified by name or by class.
     In the former case, if the service is not already configured, an exception
     will be raised.
+    If `lazy` is `True` (or it is `None` and `lazy` attribute is set), a service
+    not loaded yet is returned as a `ServiceProviderProxy`, and neither the
+    service nor the service manager are set up until the proxy is used.
     """
+    if lazy is None: lazy = self.lazy
+    if lazy and (not self.manager or serviceKey not in self.manager.loaded()):
+      return self.proxy(serviceKey, interfaceClass=interfaceClass)
     if not self.manager: self.setup()
-    return self.manager(serviceKey)
+    return self.manager.get(serviceKey, interfaceClass=interfaceClass, lazy=False)
   # get()
 
 
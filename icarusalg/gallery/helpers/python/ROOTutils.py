@@ -8,8 +8,13 @@ Unsurprisingly, this module requires ROOT.
 """
 
 __all__ = [
-  "splitROOTpath", "createROOTpath", "getROOTclass",
+  "splitROOTpath", "createROOTpath", "createROOTdirectory", "getROOTclass",
+  "AsyncROOTwriter",
   "activateDirectory",
+  "cacheDirectory",
+  "histogramArrays", "histogramValues", "histogramErrors",
+  "readBranches", "iterBranchChunks",
+  "expandFileList", "iterFileList",
   "ROOT",
   ]
 
@@ -36,28 +41,25 @@ def ROOTloader():
   command line options, and finally restores them (we use a context manager to
   show that we know Python). The loaded module is returned.
   
-  This function is called as soon as this module is imported. It is important
-  that this happens as early as possible, possibly as a replacement of ROOT
-  import, as:
+  This function is called the first time anything is read out of the `ROOT`
+  object of this module (see `LazyROOTmodule`). It is important that ROOT is
+  always used via that object, possibly as a replacement of ROOT import, as:
       
       from ROOTutils import ROOT
       
       from ROOTutils import *
       
-      import ROOTutils
-      import ROOT
-      
-  or equivalent.
+  or equivalent. If the `ROOT` module has been imported directly before that
+  (e.g. `import ROOT` ahead of `import ROOTutils`), its interpreter may have
+  already been initialized with the command line arguments, and a warning
+  is emitted.
   """
   import sys, logging
-  try:              alreadyLoaded = 'gInterpreter' in dir(ROOT)
-  except NameError: alreadyLoaded = False
-  if alreadyLoaded:
+  if 'ROOT' in sys.modules:
     logging.warning(
       "ROOT module was loaded before ROOTutils.py: command line arguments may be garbled"
       )
-    return sys.modules['ROOT']
-  # if already loaded 
+  # if already loaded
   
   class EmptyArgs:
     def __enter__(self):
@@ -80,8 +82,77 @@ def ROOTloader():
   
 # ROOTloader()
 
-ROOT = ROOTloader() # import ROOT...
-del ROOTloader
+
+class LazyROOTmodule:
+  """
+  Stand-in for the `ROOT` module, which is loaded only on its first use.
+  
+  Initializing the ROOT interpreter takes seconds, which scripts that end
+  early (e.g. on `--help`) or do not need ROOT at all don't need to pay.
+  This object loads ROOT (via `ROOTloader()`, hence protecting the command
+  line arguments) the first time any attribute is read from or written into
+  it, and from then on it forwards everything to the actual module.
+  
+  Code that needs to modify ROOT (for example to add Python methods to its
+  classes) should register a function with `onLoad()` instead of doing so
+  directly: the function is called with the `ROOT` module as argument as soon
+  as the module is loaded (immediately, if it is already).
+  """
+  def __init__(self):
+    object.__setattr__(self, '_module', None)
+    object.__setattr__(self, '_loadHooks', [])
+  # __init__()
+  
+  def isLoaded(self) -> "whether ROOT has been loaded already":
+    return self._module is not None
+  
+  def load(self) -> "the `ROOT` module":
+    """Loads ROOT (if not yet) and returns the module."""
+    if self._module is None:
+      object.__setattr__(self, '_module', ROOTloader())
+      for hook in self._loadHooks: self._runHook(hook)
+      del self._loadHooks[:]
+    # if
+    return self._module
+  # load()
+  
+  def onLoad(self, hook: "callable with the `ROOT` module as argument"):
+    """Has `hook` called as soon as ROOT is loaded."""
+    if self._module is None: self._loadHooks.append(hook)
+    else: self._runHook(hook)
+    return hook
+  # onLoad()
+  
+  def __getattr__(self, name):
+    # own attributes are missing only on an object not initialized yet (e.g. copy)
+    if name in ( '_module', '_loadHooks' ): raise AttributeError(name)
+    # probes of special attributes (e.g. by `inspect` or `pickle`) don't load ROOT
+    if self._module is None and name.startswith('__') and name.endswith('__'):
+      raise AttributeError(name)
+    return getattr(self.load(), name)
+  # __getattr__()
+  
+  def __setattr__(self, name, value): setattr(self.load(), name, value)
+  
+  def __delattr__(self, name): delattr(self.load(), name)
+  
+  def __dir__(self): return dir(self.load())
+  
+  def __repr__(self):
+    return repr(self._module) if self._module is not None \
+      else "<ROOT module (not loaded yet)>"
+  # __repr__()
+  
+  def _runHook(self, hook):
+    import logging
+    try: hook(self._module)
+    except Exception as e:
+      logging.warning("Setup of ROOT module by %s failed: %s", hook, e)
+  # _runHook()
+  
+# class LazyROOTmodule
+
+ROOT = LazyROOTmodule() # import ROOT... when needed
 
 ################################################################################
 ### Print vectors easily
@@ -92,9 +163,12 @@ def TVector3ToString(v):
 def TLorentzVectorToString(v):
   return "( %g, %g, %g; %g )" % (v.X(), v.Y(), v.Z(), v.T())
 
-ROOT.TVector2.__str__ = TVector2ToString
-ROOT.TVector3.__str__ = TVector3ToString
-ROOT.TLorentzVector.__str__ = TLorentzVectorToString
+@ROOT.onLoad
+def _setVectorPrinting(ROOT):
+  ROOT.TVector2.__str__ = TVector2ToString
+  ROOT.TVector3.__str__ = TVector3ToString
+  ROOT.TLorentzVector.__str__ = TLorentzVectorToString
+# _setVectorPrinting()
 
 
 ################################################################################
@@ -119,8 +193,7 @@ def splitROOTpath(path):
   except ValueError:
     raise RuntimeError("Path '{}' does not include a ROOT file.".format(path))
   filePath += '.root'
-  ROOTpath.lstrip(':')
-  ROOTpath.lstrip('/')
+  ROOTpath = ROOTpath.lstrip(':').lstrip('/')
   return filePath, ROOTpath
   
 # splitROOTpath()
@@ -150,9 +223,20 @@ def createROOTpath(path, fileMode = "UPDATE"):
     raise RuntimeError \
       ("Can't open ROOT file '{}' in '{}' mode".format(filePath, fileMode))
   
+  return ROOTfile, createROOTdirectory(ROOTfile, ROOTpath)
+  
+# createROOTpath()
+
+
+def createROOTdirectory(baseDir, ROOTpath):
+  """
+  Creates the `TDirectoryFile` hierarchy `ROOTpath` under `baseDir`.
+  
+  Directories already existing are reused. The innermost one is returned.
+  """
   # instead of using `TDirectory.mkdir()`, we do that manually
   ROOTpathElements = ROOTpath.split('/')
-  ROOTdir = ROOTfile
+  ROOTdir = baseDir
   for ROOTdirName in ROOTpathElements:
     if not ROOTdirName: continue # empty name does nothing
     daughterDir = ROOTdir.GetDirectory(ROOTdirName)
@@ -163,10 +247,250 @@ def createROOTpath(path, fileMode = "UPDATE"):
        (ROOTdirName, ROOTdir.GetPath()))
     ROOTdir = daughterDir
   # for
+  return ROOTdir
+# createROOTdirectory()
+
+
+_WriterHelperCode = """
+#include "TDirectory.h"
+#include "TFile.h"
+#include "TObject.h"
+
+namespace ROOTutils_writer {
   
-  return ROOTfile, ROOTdir
+  inline int writeObject(TDirectory* dir, TObject const* obj, char const* name)
+    { return dir->WriteTObject(obj, name, "Overwrite"); }
   
-# createROOTpath()
+  inline void flushFile(TFile* file) { file->SaveSelf(); file->Flush(); }
+  
+  inline void closeFile(TFile* file) { file->Close(); }
+  
+} // namespace ROOTutils_writer
+"""
+_WriterHelpers = None
+
+
+def _writerHelpers():
+  """Returns the C++ writing functions, which release the Python GIL."""
+  global _WriterHelpers
+  if _WriterHelpers is None:
+    if not ROOT.gInterpreter.Declare(_WriterHelperCode):
+      raise RuntimeError("Failed to compile the ROOT writer helper code")
+    helpers = ROOT.ROOTutils_writer
+    # without this, cppyy keeps the GIL (and the caller thread stalls)
+    # during the whole writing and compression
+    for function in ( helpers.writeObject, helpers.flushFile, helpers.closeFile ):
+      function.__release_gil__ = True
+    _WriterHelpers = helpers
+  # if
+  return _WriterHelpers
+# _writerHelpers()
+
+
+class AsyncROOTwriter:
+  """
+  Writes ROOT objects into ROOT files from a dedicated thread.
+  
+  Objects are handed to `write()` together with their destination, in the
+  form `"file.root:directory/path"` (see `createROOTpath()`), and they are
+  written (and compressed) by a separate thread, so that the caller can go on
+  with its processing. By default a copy of the object is queued, so the
+  original can be further modified; with `clone=False` the object is queued
+  as is, and it must not be touched any more. Objects that need to stay
+  attached to their own directory (like `TTree`) are not supported.
+  
+  Each file is opened (with `fileMode`) and each directory hierarchy is
+  created only once. If specified, `compressionAlgorithm` (a
+  `ROOT.RCompressionSetting.EAlgorithm` value or a name like `"ZSTD"` or
+  `"LZ4"`) and `compressionLevel` are set on each file. The files are
+  flushed every `flushInterval` seconds if specified, and closed by `close()`.
+  At that point, the throughput statistics (see `stats()`) are logged too
+  (at `INFO` level), unless `report` is `False`. Errors in the writing thread
+  are raised by the next `write()` or by `close()`.
+  
+  Writing from a separate thread requires ROOT thread safety, which changes
+  ROOT behaviour for the whole process (for example, `gDirectory` becomes
+  specific to each thread). The writer enables it only on request
+  (`enableThreadSafety`); otherwise the caller must have already called
+  `ROOT.EnableThreadSafety()`.
+  
+  Writing, flushing and closing are performed by C++ functions releasing the
+  Python global interpreter lock, so that the caller thread keeps running
+  meanwhile (`asyncWriterBenchmark()` in `test/gallery/ROOTutils_benchmarks.py`
+  measures how much).
+  
+  Example:
+      
+      ROOT.EnableThreadSafety()
+      with AsyncROOTwriter(compressionAlgorithm="ZSTD", compressionLevel=5) as writer:
+        for iEvent, event in enumerate(forEach(event)):
+          ...
+          if iEvent % 1000 == 0: writer.write("plots.root:hits/snapshots", hHits)
+        # for
+      # with
+      
+  """
+  def __init__(self,
+   compressionAlgorithm: "compression algorithm (default: ROOT default)" = None,
+   compressionLevel: "compression level (default: ROOT default)" = None,
+   flushInterval: "seconds between file flushes (default: only on close)" = None,
+   fileMode: "mode for opening the files" = "UPDATE",
+   maxQueued: "maximum number of objects waiting to be written" = 1000,
+   report: "whether to log statistics when closing" = True,
+   enableThreadSafety: "whether to call `ROOT.EnableThreadSafety()`" = False,
+   ):
+    import threading, queue
+    if enableThreadSafety: ROOT.EnableThreadSafety()
+    self.helpers = _writerHelpers()
+    self.compressionAlgorithm = compressionAlgorithm
+    self.compressionLevel = compressionLevel
+    self.flushInterval = flushInterval
+    self.fileMode = fileMode
+    self.report = report
+    self.files = {} # file path -> TFile
+    self.directories = {} # ( file path, ROOT path ) -> TDirectory
+    self.queue = queue.Queue(maxQueued)
+    self.error = None
+    self.nFiles = 0
+    self.nObjects = 0
+    self.nBytes = 0
+    self.writeTime = 0.0
+    self.waitTime = 0.0
+    self.thread = threading.Thread(target=self._writingLoop, daemon=True)
+    self.thread.start()
+  # __init__()
+  
+  def write(self,
+   path: "destination, as `file.root:directory/path`",
+   obj: "the ROOT object to be written",
+   name: "name of the object in the file (default: its own)" = None,
+   clone: "whether to queue a copy of the object" = True,
+   ):
+    """Queues `obj` to be written into `path`."""
+    import time
+    self._checkError()
+    if self.thread is None: raise RuntimeError("AsyncROOTwriter already closed")
+    if name is None: name = obj.GetName()
+    if clone:
+      obj = obj.Clone(name)
+      if hasattr(obj, 'SetDirectory'): obj.SetDirectory(ROOT.nullptr)
+    # if
+    start = time.perf_counter()
+    self.queue.put(( path, name, obj ))
+    self.waitTime += time.perf_counter() - start
+  # write()
+  
+  def close(self) -> "dictionary with the statistics (see `stats()`)":
+    """Writes all the queued objects and closes the files."""
+    if self.thread is not None:
+      self.queue.put(None)
+      self.thread.join()
+      self.thread = None
+    # if
+    self._checkError()
+    if self.report:
+      import logging
+      logging.info(self.summary())
+    # if
+    return self.stats()
+  # close()
+  
+  def stats(self) -> "dictionary with the statistics of the writing":
+    return {
+      'objects': self.nObjects,
+      'bytes': self.nBytes,
+      'writeTime': self.writeTime,
+      'throughput': self.nBytes / self.writeTime if self.writeTime > 0.0 else 0.0,
+      'waitTime': self.waitTime,
+      'files': self.nFiles,
+      }
+  # stats()
+  
+  def summary(self) -> "a string with the statistics":
+    stats = self.stats()
+    return ("Written %d objects (%.1f MiB) into %d files in %.3f s (%.1f MiB/s);"
+      " %.3f s spent waiting for the writer") % (
+        stats['objects'], stats['bytes'] / 2**20, stats['files'],
+        stats['writeTime'], stats['throughput'] / 2**20, stats['waitTime'],
+      )
+  # summary()
+  
+  def __enter__(self): return self
+  
+  def __exit__(self, exc_type, exc_value, traceback): self.close()
+  
+  def _checkError(self):
+    if self.error is None: return
+    error, self.error = self.error, None
+    raise error
+  # _checkError()
+  
+  def _directory(self, path):
+    filePath, ROOTpath = splitROOTpath(path)
+    key = ( filePath, ROOTpath )
+    try: return self.directories[key]
+    except KeyError: pass
+    try: ROOTfile = self.files[filePath]
+    except KeyError:
+      ROOTfile, ROOTdir = createROOTpath(path, fileMode=self.fileMode)
+      self._configureFile(ROOTfile)
+      self.files[filePath] = ROOTfile
+      self.nFiles += 1
+    else: ROOTdir = createROOTdirectory(ROOTfile, ROOTpath)
+    return self.directories.setdefault(key, ROOTdir)
+  # _directory()
+  
+  def _configureFile(self, ROOTfile):
+    algorithm = self.compressionAlgorithm
+    if isinstance(algorithm, str):
+      algorithm = getattr(ROOT.RCompressionSetting.EAlgorithm, 'k' + algorithm)
+    if algorithm is not None: ROOTfile.SetCompressionAlgorithm(algorithm)
+    if self.compressionLevel is not None:
+      ROOTfile.SetCompressionLevel(self.compressionLevel)
+  # _configureFile()
+  
+  def _flush(self):
+    for ROOTfile in self.files.values(): self.helpers.flushFile(ROOTfile)
+  # _flush()
+  
+  def _writingLoop(self):
+    import time, queue
+    lastFlush = time.monotonic()
+    while True:
+      timeout = None if self.flushInterval is None \
+        else max(0.0, lastFlush + self.flushInterval - time.monotonic())
+      try: item = self.queue.get(timeout=timeout)
+      except queue.Empty: item = ()
+      if item is None: break
+      try:
+        if item:
+          path, name, obj = item
+          start = time.perf_counter()
+          nBytes = self.helpers.writeObject(self._directory(path), obj, name)
+          self.writeTime += time.perf_counter() - start
+          self.nObjects += 1
+          self.nBytes += max(nBytes, 0)
+        # if
+        if self.flushInterval is not None \
+         and time.monotonic() >= lastFlush + self.flushInterval:
+          self._flush()
+          lastFlush = time.monotonic()
+        # if
+      except Exception as e:
+        if self.error is None: self.error = e
+    # while
+    try:
+      start = time.perf_counter()
+      for ROOTfile in self.files.values(): self.helpers.closeFile(ROOTfile)
+      self.writeTime += time.perf_counter() - start
+    except Exception as e:
+      if self.error is None: self.error = e
+    # try ... except
+    self.files.clear()
+    self.directories.clear()
+  # _writingLoop()
+  
+# class AsyncROOTwriter
 
 
 class DirectoryChanger:
@@ -257,10 +581,146 @@ def getROOTclass(classPath):
 
 ################################################################################
 # this is not really specific to ROOT, but we often have ROOT file lists
+def _commentPattern(comment):
+  """Returns a regular expression matching a comment after a blank."""
+  import re
+  try: return _commentPattern.patterns[comment]
+  except KeyError:
+    return _commentPattern.patterns.setdefault \
+      (comment, re.compile(r'\s' + re.escape(comment)))
+  # try ... except
+# _commentPattern()
+_commentPattern.patterns = {}
+
+
+def _readFileListLines(fileListPath, comment):
+  """Yields the non-empty lines of a file list, stripped of the comments."""
+  import logging
+  commentPattern = _commentPattern(comment) if comment else None
+  with open(fileListPath, 'r') as fileList:
+    for iLine, line in enumerate(fileList):
+      line = line.strip()
+      if not line: continue
+      if commentPattern:
+        if line.startswith(comment): continue
+        match = commentPattern.search(line)
+        if match:
+          logging.debug("Comment starting at line %d", iLine)
+          line = line[:match.start()].rstrip()
+        # if
+      # if comment
+      yield line
+    # for line in list
+  # with
+# _readFileListLines()
+
+
+class FileListCache:
+  """Cache of the content of file lists, keyed by path, modification time and size.
+  
+  Lists are stored as they are read: lists read only partially are not cached.
+  The cache is bounded by the total size (on disk) of the lists it holds,
+  `maxBytes`: lists larger than that are not cached at all, and the least
+  recently used lists are dropped to make room.
+  """
+  def __init__(self,
+   maxBytes: "maximum total size of the cached lists [bytes]" = 2**28,
+   ):
+    import collections
+    self.maxBytes = maxBytes
+    # ( path, comment ) -> ( (mtime, size), lines ), least recently used first
+    self.lists = collections.OrderedDict()
+    self.nBytes = 0
+  # __init__()
+  
+  def lines(self, fileListPath, comment):
+    """Yields the lines of `fileListPath` (see `_readFileListLines()`)."""
+    import os
+    key = ( os.path.abspath(fileListPath), comment )
+    stat = os.stat(fileListPath)
+    mtime = ( stat.st_mtime_ns, stat.st_size )
+    try:
+      cachedTime, lines = self.lists[key]
+      if cachedTime == mtime:
+        self.lists.move_to_end(key)
+        yield from lines
+        return
+    except KeyError: pass
+    lines = [] if stat.st_size <= self.maxBytes else None # too large to be cached
+    for line in _readFileListLines(fileListPath, comment):
+      if lines is not None: lines.append(line)
+      yield line
+    # for
+    if lines is not None: self._store(key, mtime, tuple(lines))
+  # lines()
+  
+  def _store(self, key, mtime, lines):
+    old = self.lists.pop(key, None)
+    if old: self.nBytes -= old[0][1]
+    size = mtime[1]
+    while self.lists and self.nBytes + size > self.maxBytes:
+      _, ( ( _, droppedSize ), _ ) = self.lists.popitem(last=False)
+      self.nBytes -= droppedSize
+    # while
+    self.lists[key] = ( mtime, lines )
+    self.nBytes += size
+  # _store()
+  
+  def clear(self):
+    self.lists.clear()
+    self.nBytes = 0
+  # clear()
+  
+# class FileListCache
+fileListCache = FileListCache()
+
+
+def iterFileList(
+ fileListPath: "path of the file list",
+ comment: "(default: '#') character used to introduce a comment" = '#',
+ fileListSuffixes: "suffix of entries to recursively add file lists" = [],
+ cache: "whether to use the cache of file list content" = False,
+ _including: "(internal) real paths of the lists being expanded" = (),
+ ) -> "a generator of file names":
+  """Yields the file names found in the specified file list, one by one.
+  
+  The format of the list is described in `expandFileList()`.
+  If `cache` is `True`, the content of each file list is cached (in
+  `fileListCache`) after it has been fully read, and reused as long as the
+  file is not modified; the cache has a limited size (see `FileListCache`).
+  A file list including itself (directly or not) raises `RuntimeError`.
+  
+  If `fileListPath` can't be read, an exception is raised.
+  """
+  
+  import os, logging
+  
+  realPath = os.path.realpath(fileListPath)
+  if realPath in _including:
+    raise RuntimeError("File list '%s' includes itself (%s)" % (
+      fileListPath, " -> ".join(_including + ( realPath, ))
+      ))
+  # if
+  _including = _including + ( realPath, )
+  
+  lines = fileListCache.lines(fileListPath, comment) if cache \
+    else _readFileListLines(fileListPath, comment)
+  for line in lines:
+    if fileListSuffixes and line.endswith(tuple(fileListSuffixes)):
+      logging.debug("Adding content of file list '%s'", line)
+      yield from iterFileList(line, comment=comment,
+        fileListSuffixes=fileListSuffixes, cache=cache, _including=_including,
+        )
+    else: yield line
+  # for
+# iterFileList()
+
+
 def expandFileList(
  fileListPath: "path of the file list",
  comment: "(default: '#') character used to introduce a comment" = '#',
  fileListSuffixes: "suffix of entries to recursively add file lists" = [],
+ cache: "whether to use the cache of file list content" = False,
  ) -> "a list of file names":
   """Returns a list of file names as found in the specified file list.
   
@@ -275,46 +735,371 @@ def expandFileList(
   will be considered a file list itself, and recursively expanded.
   
   If `fileListPath` can't be read, an exception is raised.
+  See `iterFileList()` for a version not holding the whole list in memory,
+  and for the meaning of `cache`.
+  """
+  return list(iterFileList(fileListPath,
+    comment=comment, fileListSuffixes=fileListSuffixes, cache=cache,
+    ))
+# expandFileList()
+
+
+################################################################################
+# this is not really specific to ROOT either, but it serves our ROOT file caches
+def cacheDirectory(
+ subdir: "(optional) subdirectory of the cache area" = None,
+ ) -> "path of the (existing) cache directory":
+  """Returns the path of the directory where to keep local cache files.
+  
+  The cache area is taken from `ICARUSALG_CACHE_DIR` environment variable
+  if defined, or it is a `icarusalg` directory in the standard user cache area
+  (`XDG_CACHE_HOME`, defaulting to `~/.cache`).
+  If `subdir` is specified, that subdirectory of the cache area is returned
+  instead. The directory is created if it does not exist yet.
   """
+  import os
+  cacheDir = os.environ.get('ICARUSALG_CACHE_DIR', None)
+  if not cacheDir:
+    cacheDir = os.path.join(
+      os.environ.get('XDG_CACHE_HOME', None) or os.path.expanduser('~/.cache'),
+      'icarusalg',
+      )
+  # if
+  if subdir: cacheDir = os.path.join(cacheDir, subdir)
+  os.makedirs(cacheDir, exist_ok=True)
+  return cacheDir
+# cacheDirectory()
+
+
+################################################################################
+###  NumPy interface
+###
+_NumPyHelperCode = """
+#include "TArrayC.h"
+#include "TArrayS.h"
+#include "TArrayI.h"
+#include "TArrayF.h"
+#include "TArrayD.h"
+#include "TProfile.h"
+#include "TProfile2D.h"
+#include "TProfile3D.h"
+#include <cstdint>
+
+namespace ROOTutils_details {
   
-  import logging
+  template <typename Array>
+  std::uintptr_t arrayAddress(Array const& array)
+    { return reinterpret_cast<std::uintptr_t>(array.GetArray()); }
   
-  l = []
-  with open(fileListPath, 'r') as fileList:
+  // copies the bin entries of a profile (all cells) into the buffer at `address`
+  template <typename Profile>
+  void copyBinEntries(Profile const& profile, std::uintptr_t address) {
+    auto* entries = reinterpret_cast<double*>(address);
+    int const nCells = profile.GetNcells();
+    for (int bin = 0; bin < nCells; ++bin) entries[bin] = profile.GetBinEntries(bin);
+  }
+  
+} // namespace ROOTutils_details
+"""
+_NumPyHelpersDeclared = False
+
+
+def _numpyHelpers():
+  """Returns the C++ helper namespace, compiling it on the first call."""
+  global _NumPyHelpersDeclared
+  if not _NumPyHelpersDeclared:
+    if not ROOT.gInterpreter.Declare(_NumPyHelperCode):
+      raise RuntimeError("Failed to compile the NumPy helper code")
+    _NumPyHelpersDeclared = True
+  # if
+  return ROOT.ROOTutils_details
+# _numpyHelpers()
+
+
+def _arrayView(array, arrayClass = None):
+  """Returns a NumPy view of the buffer of a `TArray` (no copy)."""
+  import numpy, ctypes
+  for klassName, ctype in (
+    ( 'TArrayD', ctypes.c_double ), ( 'TArrayF', ctypes.c_float ),
+    ( 'TArrayI', ctypes.c_int32 ), ( 'TArrayS', ctypes.c_int16 ),
+    ( 'TArrayC', ctypes.c_int8 ),
+   ):
+    klass = getattr(ROOT, klassName)
+    if (arrayClass == klassName) \
+     or (arrayClass is None and isinstance(array, klass)):
+      break
+  else: raise TypeError("Unsupported array type: '{}'".format(type(array)))
+  size = array.GetSize()
+  if size == 0: return numpy.zeros(0, dtype=ctype)
+  address = _numpyHelpers().arrayAddress[klass](array)
+  return numpy.ctypeslib.as_array((ctype * size).from_address(address))
+# _arrayView()
+
+
+def _histogramShape(hist):
+  """Returns the number of bins on each axis, including flow bins."""
+  nBins = [ hist.GetNbinsX() + 2 ]
+  if hist.GetDimension() > 1: nBins.append(hist.GetNbinsY() + 2)
+  if hist.GetDimension() > 2: nBins.append(hist.GetNbinsZ() + 2)
+  return nBins
+# _histogramShape()
+
+
+def _binView(hist, buffer, flow):
+  """Reshapes a linear bin buffer into an array indexed `[x, y, z]`."""
+  # ROOT global bin index is x + nx * (y + ny * z): last axis runs slowest
+  nBins = _histogramShape(hist)
+  view = buffer.reshape(nBins[::-1]).T
+  return view if flow else view[(slice(1, -1),) * len(nBins)]
+# _binView()
+
+
+def _binEdges(axis) -> "NumPy array with the bin edges of `axis`":
+  import numpy
+  if axis.IsVariableBinSize(): return _arrayView(axis.GetXbins(), 'TArrayD').copy()
+  return numpy.linspace(axis.GetXmin(), axis.GetXmax(), axis.GetNbins() + 1)
+# _binEdges()
+
+
+def histogramArrays(
+ hist: "a ROOT histogram (`TH1`, `TH2`, `TH3` or profile)",
+ flow: "whether to include underflow and overflow bins" = False,
+ ) -> "a dictionary of NumPy arrays":
+  """
+  Returns NumPy views of the bin buffers of `hist`, without copying them.
+  
+  The arrays are indexed `[x]`, `[x, y]` or `[x, y, z]` like the bins;
+  with `flow` the index of the first bin is `1`, otherwise `0`.
+  The dictionary contains:
+  - `content`: the bin content (for profiles, the sum of the weighted values)
+  - `sumw2`: the sum of the squared weights (`None` if not stored)
+  - `entries`: (profiles only) the sum of weights in each bin (this is a copy)
+  - `edges`: a list with the bin edges along each axis (these are copies)
+  
+  The views share the memory of the histogram: changes to either are seen
+  by the other, and the views become invalid if the histogram is deleted or
+  its binning is changed.
+  """
+  import numpy
+  content = _binView(hist, _arrayView(hist), flow)
+  sumw2 = _binView(hist, _arrayView(hist.GetSumw2(), 'TArrayD'), flow) \
+    if hist.GetSumw2N() > 0 else None
+  axes = [ hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis() ]
+  arrays = {
+    'content': content,
+    'sumw2': sumw2,
+    'edges': list(map(_binEdges, axes[:hist.GetDimension()])),
+    }
+  for profileClass in ( ROOT.TProfile, ROOT.TProfile2D, ROOT.TProfile3D ):
+    if not isinstance(hist, profileClass): continue
+    binEntries = numpy.empty(hist.GetNcells())
+    _numpyHelpers().copyBinEntries[profileClass](hist, binEntries.ctypes.data)
+    arrays['entries'] = _binView(hist, binEntries, flow)
+    break
+  # for
+  return arrays
+# histogramArrays()
+
+
+def histogramValues(hist, flow = False) -> "NumPy array of the bin values":
+  """Returns the bin values of `hist` (see `histogramArrays()`).
+  
+  For histograms this is a view of the bin content; for profiles, the means
+  in each bin are computed (empty bins are `0`).
+  """
+  import numpy
+  arrays = histogramArrays(hist, flow=flow)
+  if 'entries' not in arrays: return arrays['content']
+  entries = arrays['entries']
+  return numpy.divide(arrays['content'], entries,
+    out=numpy.zeros(entries.shape), where=entries != 0)
+# histogramValues()
+
+
+def histogramErrors(hist, flow = False) -> "NumPy array of the bin errors":
+  """Returns the bin errors of a (non-profile) histogram `hist`.
+  
+  They are the square root of `sumw2` if stored, of the content otherwise.
+  """
+  import numpy
+  arrays = histogramArrays(hist, flow=flow)
+  if 'entries' in arrays:
+    raise TypeError("histogramErrors() does not support profiles")
+  sumw2 = arrays['sumw2']
+  return numpy.sqrt(sumw2 if sumw2 is not None else numpy.abs(arrays['content']))
+# histogramErrors()
+
+
+_BranchTypes = {
+  'Bool_t': '?', 'bool': '?',
+  'Char_t': 'i1', 'UChar_t': 'u1',
+  'Short_t': 'i2', 'UShort_t': 'u2', 'short': 'i2', 'unsigned short': 'u2',
+  'Int_t': 'i4', 'UInt_t': 'u4', 'int': 'i4', 'unsigned int': 'u4',
+  'Long_t': 'i8', 'ULong_t': 'u8', 'long': 'i8', 'unsigned long': 'u8',
+  'Long64_t': 'i8', 'ULong64_t': 'u8',
+  'long long': 'i8', 'unsigned long long': 'u8',
+  'Float_t': 'f4', 'Double_t': 'f8', 'float': 'f4', 'double': 'f8',
+  } # _BranchTypes
+
+
+class _BranchReader:
+  """
+  Reads scalar branches of a tree into NumPy arrays, in chunks.
+  
+  The reading is performed by a `TTreeReader` loop compiled on the first use
+  of each combination of branch types, and it proceeds through the tree
+  in a single pass: each `read()` call continues from where the previous
+  one stopped.
+  """
+  ReaderClasses = {} # ( C++ types ) -> C++ reader class
+  
+  def __init__(self, tree, branches, start = 0, stop = None):
+    import numpy
+    self.branches = list(branches)
+    types = tuple(map(lambda branch: self._branchType(tree, branch), self.branches))
+    self.dtypes = [ numpy.dtype(_BranchTypes[klass]) for klass in types ]
+    nEntries = tree.GetEntries()
+    self.stop = nEntries if stop is None else min(stop, nEntries)
+    self.start = min(start, self.stop)
+    names = ROOT.std.vector[ROOT.std.string]()
+    for branch in self.branches: names.push_back(branch)
+    self.reader = self._readerClass(types)(tree, names, self.start, self.stop)
+    self.nRead = 0
+    self.exhausted = self.start >= self.stop # no more entries to read
+  # __init__()
+  
+  @staticmethod
+  def _branchType(tree, branch):
+    leaf = tree.GetLeaf(branch)
+    if not leaf:
+      raise RuntimeError("Branch '{}' not found in tree '{}'"
+        .format(branch, tree.GetName()))
+    # if
+    klass = str(leaf.GetTypeName())
+    if klass not in _BranchTypes or leaf.GetLenStatic() != 1 or leaf.GetLeafCount():
+      raise RuntimeError("Branch '{}' is not a supported scalar ({})"
+        .format(branch, klass))
+    # if
+    return klass
+  # _branchType()
+  
+  @staticmethod
+  def _readerClass(types):
+    try: return _BranchReader.ReaderClasses[types]
+    except KeyError: pass
+    namespace = "ROOTutils_branches_%d" % len(_BranchReader.ReaderClasses)
+    indices = range(len(types))
+    members = "\n".join(
+      "    TTreeReaderValue<{klass}> v{i};".format(klass=klass, i=i)
+      for i, klass in enumerate(types)
+      )
+    code = """
+#include "TTreeReader.h"
+#include "TTreeReaderValue.h"
+#include "TTree.h"
+#include <vector>
+#include <string>
+#include <cstddef>
+#include <cstdint>
+
+namespace {namespace} {{
+  struct Reader {{
+    TTreeReader reader;
+{members}
     
-    for iLine, line in enumerate(fileList):
-      line = line.strip()
-      if not line: continue
-      if comment:
-        if line.startswith(comment): continue
-        
-        words = line.split(comment)
-        line = words[0]
-        for left, right in zip(words[:-1], words[1:]):
-          if left and left[-1].isspace():
-            logging.debug("Comment starting at line %d between '%s' and '%s'", iLine, left, right)
-            break
-          line += comment + right
-        # for
-        line = line.rstrip()
-      # if comment
-      
-      for suffix in fileListSuffixes:
-        if not line.endswith(suffix): continue
-        logging.debug("Adding content of file list from line %d ('%s')", iLine, line)
-        extra = expandFileList(line, comment=comment, fileListSuffixes=fileListSuffixes)
-        logging.debug("%d entries collected under file list '%s'", len(extra), line)
-        l.extend(extra)
-        break
-      else:
-        logging.debug("Line %d added to the list", iLine)
-        l.append(line)
-      # for suffix... else
-    # for line in list
+    Reader(TTree* tree, std::vector<std::string> const& names,
+      Long64_t start, Long64_t stop)
+      : reader(tree)
+      {init}
+      {{ reader.SetEntriesRange(start, stop); }}
     
-  # with
-  return l
-# expandFileList()
+    std::size_t fill(std::size_t n, std::vector<std::uintptr_t> const& buffers) {{
+{pointers}
+      std::size_t i = 0;
+      while ((i < n) && reader.Next()) {{
+{copies}
+        ++i;
+      }}
+      return i;
+    }}
+    
+    bool isValid() const {{ return {valid}; }}
+  }};
+}} // namespace {namespace}
+""".format(
+      namespace=namespace, members=members,
+      init="".join(", v{i}(reader, names[{i}].c_str())".format(i=i) for i in indices),
+      pointers="\n".join(
+        "      auto* out{i} = reinterpret_cast<{klass}*>(buffers[{i}]);"
+          .format(klass=klass, i=i)
+        for i, klass in enumerate(types)
+        ),
+      copies="\n".join("        out{i}[i] = *v{i};".format(i=i) for i in indices),
+      valid=" && ".join("v{i}.IsValid()".format(i=i) for i in indices) or "true",
+      )
+    if not ROOT.gInterpreter.Declare(code):
+      raise RuntimeError("Failed to compile the reader of branches of types: {}"
+        .format(", ".join(types)))
+    # if
+    return _BranchReader.ReaderClasses.setdefault \
+      (types, getattr(ROOT, namespace).Reader)
+  # _readerClass()
+  
+  def read(self,
+   n: "maximum number of entries to read",
+   ) -> "a dictionary: branch name -> NumPy array":
+    """Reads the next `n` entries (or less, if the range is over)."""
+    import numpy
+    n = max(0, min(n, self.stop - self.start - self.nRead))
+    arrays = [ numpy.empty(n, dtype=dtype) for dtype in self.dtypes ]
+    buffers = ROOT.std.vector['std::uintptr_t']()
+    for array in arrays: buffers.push_back(array.ctypes.data)
+    nRead = self.reader.fill(n, buffers) if n > 0 else 0
+    if nRead > 0 and not self.reader.isValid():
+      raise RuntimeError("Failed to read branches: {}".format(", ".join(self.branches)))
+    self.nRead += nRead
+    if nRead < n or self.start + self.nRead >= self.stop: self.exhausted = True
+    return dict(zip(self.branches, ( array[:nRead] for array in arrays )))
+  
+# class _BranchReader
+
+
+def readBranches(
+ tree: "the `TTree` to read",
+ branches: "names of the branches (scalar values) to read",
+ start: "first entry to read" = 0,
+ stop: "entry after the last one to read (default: all)" = None,
+ ) -> "a dictionary: branch name -> NumPy array":
+  """Reads the entries [`start`, `stop`[ of the specified branches in bulk.
+  
+  The reading is performed by a compiled `TTreeReader` loop, in C++.
+  """
+  reader = _BranchReader(tree, branches, start=start, stop=stop)
+  return reader.read(reader.stop - reader.start)
+# readBranches()
+
+
+def iterBranchChunks(
+ tree: "the `TTree` to read",
+ branches: "names of the branches (scalar values) to read",
+ chunkSize: "number of entries in each chunk" = 100000,
+ start: "first entry to read" = 0,
+ stop: "entry after the last one to read (default: all)" = None,
+ ) -> "a generator of dictionaries: branch name -> NumPy array":
+  """Reads the specified branches in chunks of `chunkSize` entries.
+  
+  All the chunks are read in a single pass through the tree, by the same
+  compiled `TTreeReader` loop as `readBranches()`.
+  
+  Example:
+      
+      totalCharge = sum(chunk['charge'].sum()
+        for chunk in iterBranchChunks(tree, [ 'charge' ], chunkSize=10**6))
+      
+  """
+  reader = _BranchReader(tree, branches, start=start, stop=stop)
+  while not reader.exhausted: yield reader.read(chunkSize)
+# iterBranchChunks()
 
 
 ################################################################################
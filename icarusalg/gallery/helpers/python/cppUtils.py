@@ -10,11 +10,13 @@ This module requires ROOT.
 
 __all__ = [
   'readHeader',
+  'readHeaders',
   'SourceCode',
+  'HeaderCache',
   ]
 
 import sys, os
-from ROOTutils import ROOT
+from ROOTutils import ROOT, cacheDirectory
 
 
 ################################################################################
@@ -24,6 +26,295 @@ def readHeader(headerPath):
 # readHeader()
 
 
+def readHeaders(headerPaths):
+  """Make the ROOT C++ jit compiler read all the specified headers at once.
+  
+  The headers are included in a single translation unit, in a single
+  interpreter transaction. Returns whether the interpreter succeeded.
+  """
+  import logging
+  code = "".join('#include "%s"\n' % headerPath for headerPath in headerPaths)
+  success = bool(ROOT.gInterpreter.Declare(code))
+  if not success:
+    logging.warning("Errors while reading headers: %s", ", ".join(headerPaths))
+  return success
+# readHeaders()
+
+
+################################################################################
+class HeaderCache:
+  """
+  On-disk cache of compiled header sets, sparing Cling their parsing.
+  
+  A set of headers is compiled once by ACLiC into a library with its
+  dictionary (and, where ROOT supports it, its C++ module), which later
+  processes load instead of parsing the headers anew. The cache entry is
+  identified by the header paths and modification times, the include
+  directories of all UPS products (`*_INC` environment variables, which
+  include their versions) and the ROOT version: any change of those leads to
+  a new entry. The headers included (directly or not) from the include
+  directories are recorded when the library is built, and if any of them has
+  changed since (e.g. an in-place rebuild of a product), the library is
+  built again. If the compilation or the loading fails, `load()` returns
+  `False` and the caller is expected to fall back to parse the headers;
+  failed compilations are remembered and not attempted again.
+  
+  The dictionary of the library carries the classes of the headers, but not
+  free functions, function templates nor template specializations: the cache
+  is suitable only for headers whose users need just classes. It is used only
+  when the caller specifies the names of these classes (`lookups`), which are
+  checked after loading; if any of them is not available, the cache entry is
+  marked as failed, and the headers are parsed.
+  
+  The cache is enabled in `SourceCode` by setting the environment variable
+  `ICARUSALG_HEADER_CACHE` (to `1`, or to the cache directory), or by calling
+  `SourceCode.enableHeaderCache()`.
+  """
+  AddedIncludePaths = set() # include paths already added to ROOT (global)
+  
+  def __init__(self, cacheDir: "cache directory (default: in cache area)" = None):
+    self.cacheDir = cacheDir if cacheDir else cacheDirectory('headers')
+    os.makedirs(self.cacheDir, exist_ok=True)
+  # __init__()
+  
+  @staticmethod
+  def productVersions() -> "sorted list of `(variable, value)` of `*_INC` variables":
+    return sorted(
+      ( varName, value ) for varName, value in os.environ.items()
+      if varName.endswith('_INC')
+      )
+  # productVersions()
+  
+  def key(self, headerPaths: "list of full paths of the headers") -> "a string":
+    import hashlib
+    headers = [ ( path, os.stat(path).st_mtime_ns ) for path in headerPaths ]
+    content = repr(
+      ( headers, self.productVersions(), str(ROOT.gROOT.GetVersion()) )
+      )
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:20]
+  # key()
+  
+  @staticmethod
+  def includedFiles(
+   headerPaths: "list of full paths of the headers",
+   includePaths: "include directories",
+   ) -> "sorted list of the full paths of the headers and all they include":
+    """Returns the headers included from `includePaths`, recursively.
+    
+    The scan is not aware of the preprocessor conditions, and the headers not
+    found in the include directories (e.g. system ones) are skipped.
+    """
+    import re
+    includePattern = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+    found = set()
+    toScan = list(headerPaths)
+    while toScan:
+      path = toScan.pop()
+      if path in found: continue
+      found.add(path)
+      try:
+        with open(path, errors='replace') as headerFile: text = headerFile.read()
+      except OSError: continue
+      for relPath in includePattern.findall(text):
+        for includeDir in [ os.path.dirname(path) ] + list(includePaths):
+          candidate = os.path.normpath(os.path.join(includeDir, relPath))
+          if os.path.isfile(candidate):
+            toScan.append(candidate)
+            break
+        # for include directories
+      # for included headers
+    # while
+    return sorted(found)
+  # includedFiles()
+  
+  @staticmethod
+  def readDependencies(base) -> "list of `(path, modification time)`, or `None`":
+    try:
+      with open(base + '.deps') as depFile:
+        return [
+          ( path, int(mtime) ) for mtime, path
+          in ( line.rstrip('\n').split(' ', 1) for line in depFile )
+          ]
+      # with
+    except (OSError, ValueError): return None
+  # readDependencies()
+  
+  @staticmethod
+  def writeDependencies(base, paths):
+    with open(base + '.deps', 'w') as depFile:
+      for path in paths:
+        depFile.write("%d %s\n" % ( os.stat(path).st_mtime_ns, path ))
+    # with
+  # writeDependencies()
+  
+  @staticmethod
+  def dependenciesChanged(base) -> "whether any dependency changed since the build":
+    dependencies = HeaderCache.readDependencies(base)
+    if dependencies is None: return True
+    try:
+      return any(os.stat(path).st_mtime_ns != mtime for path, mtime in dependencies)
+    except OSError: return True
+  # dependenciesChanged()
+  
+  @staticmethod
+  def isDeclared(name: "C++ name, like `lar::standalone::SetupGeometry`"):
+    """Returns whether the interpreter knows about `name`."""
+    scope = ROOT
+    try:
+      for element in name.split('::'): scope = getattr(scope, element)
+    except AttributeError: return False
+    return True
+  # isDeclared()
+  
+  def load(self,
+   headerPaths: "list of full paths of the headers",
+   includePaths: "additional include directories" = [],
+   lookups: "C++ names that must be available after loading" = (),
+   ) -> "whether the headers were loaded from the cache":
+    import logging
+    if not lookups: return False # no way to tell if the cache is enough
+    try: base = os.path.join(self.cacheDir, 'headers_' + self.key(headerPaths))
+    except OSError: return False
+    libPath = base + SourceCentral.PlatformInfo['LibSuffix']
+    failedPath = base + '.failed'
+    with self._lock(base):
+      if os.path.exists(failedPath): return False
+      upToDate = os.path.exists(libPath) and not self.dependenciesChanged(base)
+      if not upToDate and not self.build(base, libPath, headerPaths, includePaths):
+        logging.warning("Compilation of headers %s failed: they will be parsed.",
+          ", ".join(headerPaths))
+        open(failedPath, 'w').close()
+        return False
+      # if
+    # with
+    if ROOT.gSystem.Load(libPath) < 0:
+      logging.warning("Loading of compiled headers '%s' failed.", libPath)
+      return False
+    # if
+    missing = [ name for name in lookups if not self.isDeclared(name) ]
+    if missing:
+      logging.warning(
+        "Compiled headers '%s' do not provide %s: headers will be parsed.",
+        libPath, ", ".join(missing))
+      with self._lock(base): open(failedPath, 'w').close()
+      return False
+    # if
+    logging.debug("Headers %s loaded from '%s'", ", ".join(headerPaths), libPath)
+    return True
+  # load()
+  
+  def build(self, base, libPath, headerPaths, includePaths) -> "whether successful":
+    """Compiles the headers into a library via ACLiC."""
+    with open(base + '.C', 'w') as sourceFile:
+      sourceFile.write("// headers cached by cppUtils.HeaderCache\n")
+      for path in headerPaths: sourceFile.write('#include "%s"\n' % path)
+    # with
+    with open(base + '_linkdef.h', 'w') as linkDefFile:
+      linkDefFile.write("#ifdef __CLING__\n")
+      for path in headerPaths:
+        linkDefFile.write('#pragma link C++ defined_in "%s";\n' % path)
+      linkDefFile.write("#endif\n")
+    # with
+    for path in includePaths:
+      if path in HeaderCache.AddedIncludePaths: continue
+      ROOT.gSystem.AddIncludePath('-I"%s"' % path)
+      HeaderCache.AddedIncludePaths.add(path)
+    # for
+    if not ROOT.gSystem.CompileMacro(base + '.C', 'kf', libPath, self.cacheDir):
+      return False
+    self.writeDependencies(base, self.includedFiles(headerPaths, includePaths))
+    return True
+  # build()
+  
+  @staticmethod
+  def _lock(base):
+    """Returns a context manager holding an exclusive lock for `base` entry."""
+    import fcntl, contextlib
+    @contextlib.contextmanager
+    def lock():
+      with open(base + '.lock', 'w') as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(lockFile, fcntl.LOCK_UN)
+      # with
+    # lock()
+    return lock()
+  # _lock()
+  
+# class HeaderCache
+
+
+################################################################################
+class PathIndex:
+  """
+  Index of the content of search directories, for fast file lookup.
+  
+  The content of each directory is listed once, and later existence checks
+  are answered from that listing; the results of the lookups are cached too,
+  keyed by the searched path and the list of search directories (so that a
+  change of the latter leads to a new lookup).
+  Changes in the content of the directories are not noticed: `invalidate()`
+  clears the index.
+  
+  `stats()` reports how many directory listings were performed, and how many
+  existence checks a plain search would have performed instead.
+  """
+  def __init__(self):
+    self.invalidate()
+    self.listCalls = 0 # directory listings performed
+    self.plainCalls = 0 # existence checks a plain search would have performed
+  # __init__()
+  
+  def invalidate(self):
+    self.listings = {} # directory -> set of its entries
+    self.results = {} # ( relative path, search directories ) -> ( path, cost )
+  # invalidate()
+  
+  def listing(self, directory: "path of the directory") -> "set of entry names":
+    try: return self.listings[directory]
+    except KeyError: pass
+    self.listCalls += 1
+    try: entries = frozenset(os.listdir(directory))
+    except OSError: entries = frozenset()
+    return self.listings.setdefault(directory, entries)
+  # listing()
+  
+  def exists(self, path: "path of the file") -> "whether the file exists":
+    dirName, name = os.path.split(os.path.normpath(path))
+    return name in self.listing(dirName)
+  
+  def find(self,
+   relPath: "path to look for, relative to the search directories",
+   searchPaths: "search directories, the first has the highest priority",
+   ) -> "the full path of the first match, `None` if none":
+    if os.path.isabs(relPath): searchPaths = ( '', )
+    key = ( relPath, tuple(searchPaths) )
+    try: found, cost = self.results[key]
+    except KeyError:
+      found, cost = None, 0
+      for cost, path in enumerate(key[1], 1):
+        candidate = os.path.join(path, relPath)
+        if self.exists(candidate):
+          found = candidate
+          break
+      # for
+      self.results[key] = ( found, cost )
+    # try ... except
+    self.plainCalls += cost
+    return found
+  # find()
+  
+  def stats(self) -> "dictionary with the filesystem call counters":
+    return {
+      'listings': self.listCalls,
+      'plainChecks': self.plainCalls,
+      'saved': self.plainCalls - self.listCalls,
+      }
+  # stats()
+  
+# class PathIndex
+
+
 ################################################################################
 class SourceCentral:
   """
@@ -43,14 +334,29 @@ class SourceCentral:
   } # AllPlatformInfo
   PlatformInfo = AllPlatformInfo[os.uname()[0]]
   
+  pathIndex = PathIndex() # shared index of search directory content
+  libraryPathCache = ( None, [] ) # ( environment value, list of paths )
+  
   def __init__(self, *includePaths):
     self.headers = {}
     self.libraries = {}
     self.includePaths = []
     self.addIncPaths(*includePaths)
     # for
+    self.headerLoadingStats = [] # one entry per batch of headers loaded
+    self.headerCache = None
+    cacheSetting = os.environ.get('ICARUSALG_HEADER_CACHE', '')
+    if cacheSetting not in ( '', '0' ):
+      self.enableHeaderCache(None if cacheSetting == '1' else cacheSetting)
+    # if
   # __init__()
   
+  def enableHeaderCache(self, cacheDir = None):
+    """Loads headers from compiled `HeaderCache` in `cacheDir` when possible."""
+    self.headerCache = HeaderCache(cacheDir)
+  
+  def disableHeaderCache(self): self.headerCache = None
+  
   def addIncPath(self, path, force=False):
     expPath = os.path.expandvars(path)
     if not os.path.isdir(expPath):
@@ -79,22 +385,26 @@ class SourceCentral:
   # find()
   
   def findLibrary(self, libName, extraPaths = []):
-    expLibName = SourceCentral.expandLibraryName(libName)
-    for path in reversed(
-     SourceCentral.LibraryPaths() + list(map(os.path.expandvars, extraPaths))
-     ):
-      candidate = os.path.join(path, expLibName)
-      if os.path.exists(candidate): return candidate
-    else: return None
+    expLibName = self.expandLibraryName(libName)
+    return self.pathIndex.find(expLibName, reversed(
+      SourceCentral.LibraryPaths() + list(map(os.path.expandvars, extraPaths))
+      ))
   # findLibrary()
   
   def findHeader(self, relPath, extraPaths = []):
-    for path in reversed(self.includePaths + list(map(os.path.expandvars, extraPaths))):
-      candidate = os.path.join(path, relPath)
-      if os.path.exists(candidate): return candidate
-    else: return None
+    return self.pathIndex.find(relPath,
+      reversed(self.includePaths + list(map(os.path.expandvars, extraPaths)))
+      )
   # findHeader()
   
+  def pathLookupStats(self):
+    """Returns the counters of filesystem calls of the lookups (`PathIndex`)."""
+    return self.pathIndex.stats()
+  
+  def invalidatePathIndex(self):
+    """Forgets the content of the search directories, e.g. after it changed."""
+    self.pathIndex.invalidate()
+  
   def loadLibrary(self, relPath, extraPaths = [], force = False):
     expandedName = self.expandLibraryName(relPath)
     res = ROOT.gSystem.Load(expandedName)
@@ -102,18 +412,88 @@ class SourceCentral:
     return res
   # loadLibrary()
   
-  def loadHeader(self, headerRelPath, extraPaths = [], force = False):
-    try: return self.headers[headerRelPath]
-    except KeyError: pass
-    headerPath = self.findHeader(headerRelPath, extraPaths=extraPaths)
-    if not headerPath: raise RuntimeError("Can't locate header file '%s'" % headerRelPath)
-    readHeader(headerPath)
-    self.headers[headerRelPath] = headerPath
-    return headerPath
+  def loadHeader(self, headerRelPath, extraPaths = [], force = False,
+   lookups = (),
+   ):
+    return self.loadHeaders \
+      ([ headerRelPath ], extraPaths=extraPaths, force=force, lookups=lookups)[0]
   # loadHeader()
   
+  def loadHeaders(self, headerRelPaths, extraPaths = [], force = False,
+   fromUPS = False, lookups = (),
+   ):
+    """
+    Loads all the specified headers with a single interpreter call.
+    
+    All the header paths are resolved first (`RuntimeError` is raised if any
+    of them can't be found), and then the ones not loaded yet are all included
+    together (see `readHeaders()`), or loaded together from the header cache
+    if enabled and if `lookups`, the C++ names needed from these headers, are
+    specified (see `HeaderCache`). If `fromUPS` is set, each header is looked
+    for also in its UPS product (see `loadHeaderFromUPS()`).
+    If the interpreter fails on the batch, the headers are read again one by
+    one, and those which still fail are not recorded as loaded (a later call
+    will try them again).
+    The headers, the time spent and whether the cache was used are recorded
+    for each batch in `headerLoadingStats`.
+    Returns the list of the full paths of the headers.
+    """
+    import time, logging
+    headerPaths = []
+    newHeaders = {} # relative path -> full path
+    searchPaths = list(map(os.path.expandvars, extraPaths))
+    for headerRelPath in headerRelPaths:
+      headerPath \
+        = self.headers.get(headerRelPath, None) or newHeaders.get(headerRelPath, None)
+      if not headerPath:
+        paths = ([ '$' + self.packageVarNameFromHeaderPath('INC', headerRelPath) ]
+          if fromUPS else []) + extraPaths
+        headerPath = self.findHeader(headerRelPath, extraPaths=paths)
+        if not headerPath:
+          raise RuntimeError("Can't locate header file '%s'" % headerRelPath)
+        newHeaders[headerRelPath] = headerPath
+        searchPaths.extend(map(os.path.expandvars, paths[:1] if fromUPS else []))
+      # if
+      headerPaths.append(headerPath)
+    # for
+    if not newHeaders: return headerPaths
+    
+    start = time.perf_counter()
+    fullPaths = list(newHeaders.values())
+    cached = bool(self.headerCache) \
+      and self.headerCache.load \
+        (fullPaths, self.includePaths + searchPaths, lookups=lookups)
+    if not cached and not readHeaders(fullPaths):
+      # the failed transaction is rolled back: read the headers one by one
+      # (if more than one), so that only the failing ones are left out
+      for headerRelPath, headerPath in list(newHeaders.items()):
+        if len(fullPaths) == 1 or not readHeaders([ headerPath ]):
+          del newHeaders[headerRelPath]
+      # for
+    # if
+    elapsed = time.perf_counter() - start
+    self.headerLoadingStats.append(
+      { 'headers': fullPaths, 'time': elapsed, 'cached': cached, }
+      )
+    logging.debug("Loaded %d headers in %.3f s%s", len(fullPaths), elapsed,
+      " (from cache)" if cached else "")
+    self.headers.update(newHeaders)
+    return headerPaths
+  # loadHeaders()
+  
+  def loadHeadersFromUPS(self, headerRelPaths, extraPaths = [], force = False,
+   lookups = (),
+   ):
+    """Loads headers from UPS products together (see `loadHeaders()`)."""
+    return self.loadHeaders(headerRelPaths,
+      extraPaths=extraPaths, force=force, fromUPS=True, lookups=lookups,
+      )
+  # loadHeadersFromUPS()
+  
   
-  def loadHeaderFromUPS(self, headerRelPath, extraPaths = [], force = False):
+  def loadHeaderFromUPS(self, headerRelPath, extraPaths = [], force = False,
+   lookups = (),
+   ):
     """
     Loads a C++ header from a UPS product.
     
@@ -135,7 +515,7 @@ class SourceCentral:
       headerRelPath,
       extraPaths
         =([ '$' + self.packageVarNameFromHeaderPath('INC', headerRelPath) ] + extraPaths),
-      force=force
+      force=force, lookups=lookups,
       )
   # loadHeaderFromUPS()
 
@@ -143,6 +523,29 @@ class SourceCentral:
     return (self.loadLibrary if self.isLibrary(relPath) else self.loadHeaderFromUPS)(relPath, extraPaths=extraPaths, force=force)
   # load()
   
+  def loadAll(self, relPaths, extraPaths = [], force = False, lookups = ()):
+    """Loads libraries and headers in order, with headers loaded in batches.
+    
+    Each sequence of consecutive headers in `relPaths` is loaded with
+    `loadHeadersFromUPS()`, and libraries with `loadLibrary()`.
+    The names in `lookups` are required to be available after each header
+    batch (see `loadHeaders()`).
+    """
+    headers = []
+    for relPath in list(relPaths) + [ None ]:
+      if relPath is not None and not self.isLibrary(relPath):
+        headers.append(relPath)
+        continue
+      if headers:
+        self.loadHeadersFromUPS \
+          (headers, extraPaths=extraPaths, force=force, lookups=lookups)
+        headers = []
+      # if
+      if relPath is not None:
+        self.loadLibrary(relPath, extraPaths=extraPaths, force=force)
+    # for
+  # loadAll()
+  
   def isLibrary(self, path):
     return os.path.splitext(path)[-1] in [ self.PlatformInfo['LibSuffix'], '' ]
   
@@ -163,8 +566,13 @@ class SourceCentral:
   
   @staticmethod
   def LibraryPaths():
-    return os.getenv(SourceCentral.PlatformInfo['LibEnvPath']) \
-     .split(SourceCentral.PlatformInfo.get('LibEnvPathSep', ':'))
+    value = os.getenv(SourceCentral.PlatformInfo['LibEnvPath'])
+    cachedValue, paths = SourceCentral.libraryPathCache
+    if value != cachedValue:
+      paths = value.split(SourceCentral.PlatformInfo.get('LibEnvPathSep', ':'))
+      SourceCentral.libraryPathCache = ( value, paths )
+    # if
+    return list(paths)
   # LibraryPaths()
   
 # class SourceCentral
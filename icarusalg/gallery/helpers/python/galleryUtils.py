@@ -34,7 +34,26 @@ __all__ = [
   'make_getValidHandle',
   'makeFileList',
   'forEach',
+  'forEachEntry',
+  'skipEvents',
   'eventLoop',
+  'parallelEventLoop',
+  'countEvents',
+  'ProgressReporter',
+  'EventLoopProfiler',
+  'EventLoopCheckpoint',
+  'EventBatch',
+  'ProductBatch',
+  'FileStager',
+  'Pipeline',
+  'WorkerUtilization',
+  'EventMemo',
+  'memoizeEvents',
+  'PipelineEvent',
+  'EventIndex',
+  'RunRange',
+  'toArrays',
+  'ProductArrayConverter',
   'findFHiCL',
   'loadConfiguration',
   'ConfigurationClass',
@@ -44,7 +63,7 @@ __all__ = [
   ]
 
 import sys, os
-from ROOTutils import ROOT, expandFileList
+from ROOTutils import ROOT, expandFileList, iterFileList, cacheDirectory
 import cppUtils
 import warnings
 
@@ -61,8 +80,11 @@ readHeader = cppUtils.readHeader
 ################################################################################
 
 # override conversion of art::EventID into a string (used by `print()`)
-ROOT.art.EventID.__str__ \
-  = lambda self: "R:%d S:%d E:%d" % (self.run(), self.subRun(), self.event())
+@ROOT.onLoad
+def _setEventIDprinting(ROOT):
+  ROOT.art.EventID.__str__ \
+    = lambda self: "R:%d S:%d E:%d" % (self.run(), self.subRun(), self.event())
+# _setEventIDprinting()
 
 
 class HandleMaker:
@@ -71,41 +93,128 @@ class HandleMaker:
   
   Needs to keep track of what was done already, because Cling will protest if
   the same class is asked twice.
+  The template instantiations are looked up only once per class, and the
+  getter bound to an event is also reused as long as the same event is used;
+  only the getter bound to the most recent event is kept for each class, so
+  that events (and their files) are not kept alive by the cache
+  (`clearCache()` releases them all).
+  
+  While an `EventLoopProfiler` is installed in `HandleMaker.profiler`, the
+  calls of bound getters and of `manyByType()` getters are timed.
   
   See the documentation of `__call__` for examples of usage of instances of
   this class.
   
   """
+  class ValidHandleProc:
+    """Getter of valid handles of a fixed class from a fixed event.
+    
+    Input tags specified as strings are converted only once.
+    """
+    def __init__(self, getHandle, event, klass = None):
+      self.getHandle = getHandle
+      self.event = event
+      self.klass = klass
+      self.tags = {}
+    def inputTag(self, tag):
+      if not isinstance(tag, str): return tag
+      try: return self.tags[tag]
+      except KeyError:
+        return self.tags.setdefault(tag, ROOT.art.InputTag(tag))
+    # inputTag()
+    def __call__(self, tag):
+      if HandleMaker.profiler:
+        return HandleMaker.profiler.call(
+          ( 'getValidHandle', self.klass, _inputTagString(tag) ),
+          self.getHandle, self.event, self.inputTag(tag),
+          )
+      # if profiling
+      return self.getHandle(self.event, self.inputTag(tag))
+  # ValidHandleProc
+  
   class ManyByTypeProc:
+    """Getter of all the handles of a fixed class.
+    
+    Unless a `handles` list is passed, the same handle list is returned
+    (refilled) on each call: its content is valid only until the next call.
+    """
     def __init__(self, klass):
+      self.klass = klass
       self.handleVectorClass = ROOT.std.vector[f'gallery::Handle<{klass}>']
       self.getHandles = ROOT.gallery.Event.getManyByType[klass]
-    def __call__(self, event):
-      handles = self.handleVectorClass()
-      self.getHandles(event, handles)
+      self.handles = self.handleVectorClass()
+    def __call__(self, event, handles = None):
+      # `gallery::Event::getManyByType()` replaces the content of `handles`
+      if handles is None: handles = self.handles
+      if HandleMaker.profiler:
+        HandleMaker.profiler.call(( 'getManyByType', self.klass ),
+          self.getHandles, event, handles)
+      else: self.getHandles(event, handles)
       return handles
   # ManyByTypeProc
   
+  profiler = None # `EventLoopProfiler` timing the data product access
+  
+  
+  def __init__(self):
+    self.validHandleGetters = {} # klass -> getValidHandle<klass>
+    self.boundValidHandleGetters = {} # klass -> ValidHandleProc (latest event)
+    self.manyByTypeGetters = {} # klass -> ManyByTypeProc
+  # __init__()
+  
+  def getValidHandle(self,
+    klass: "data product class to prepare for (as a C++ class name string)",
+    ) -> "unbound `gallery::Event::getValidHandle<klass>`":
+    try: return self.validHandleGetters[klass]
+    except KeyError: pass
+    # this has been tested with ROOT 6.22;
+    # big improvements in cppyy make this **way** simpler than it used to be
+    return self.validHandleGetters.setdefault \
+      (klass, ROOT.gallery.Event.getValidHandle[klass])
+  # getValidHandle()
   
   def validHandle(self,
     klass: "data product class to prepare for (as a C++ class name string)",
     event: "(optional) the event object to retrieve the data products from " = None,
     ) -> "if `event` is specified, bound `getValidHandle<klass>`, unbound otherwise":
-    # this has been tested with ROOT 6.22;
-    # big improvements in cppyy make this **way** simpler than it used to be
-    getHandle = ROOT.gallery.Event.getValidHandle[klass]
-    return (lambda tag: getHandle(event, tag)) if event else getHandle
+    if not event: return self.getValidHandle(klass)
+    getter = self.boundValidHandleGetters.get(klass, None)
+    if getter is not None and getter.event is event: return getter
+    newGetter \
+      = HandleMaker.ValidHandleProc(self.getValidHandle(klass), event, klass)
+    if getter is not None: newGetter.tags = getter.tags # reuse converted tags
+    self.boundValidHandleGetters[klass] = newGetter
+    return newGetter
   # validHandle()
   
   def manyByType(self,
     klass: "data product class to prepare for (as a C++ class name string)",
     event: "(optional) the event object to retrieve the data products from " = None,
+    copy: "whether to return a new list rather than the reused one" = True,
     ) -> """if `event` is specified, a list (std::vector) of handles,
             otherwise a callable that when called on an event returns such list""":
-    getManyByType = HandleMaker.ManyByTypeProc(klass)
-    return getManyByType(event) if event else (lambda event: getManyByType(event))
+    """Returns the handles to all data products of type `klass`, or a getter.
+    
+    The getter returned when no `event` is specified refills and returns the
+    same list on each call (see `HandleMaker.ManyByTypeProc`): the list is
+    valid only until the next call of the getter, from anywhere.
+    With an `event`, a new list is returned unless `copy` is `False`, in which
+    case the list of the shared getter is returned, with the same caveat.
+    """
+    try: getManyByType = self.manyByTypeGetters[klass]
+    except KeyError:
+      getManyByType = self.manyByTypeGetters.setdefault \
+        (klass, HandleMaker.ManyByTypeProc(klass))
+    # try ... except
+    if not event: return getManyByType
+    return getManyByType(event, getManyByType.handleVectorClass() if copy else None)
   # manyByType()
   
+  def clearCache(self):
+    """Forgets all the getters bound to events."""
+    self.boundValidHandleGetters.clear()
+  # clearCache()
+  
   def __call__(self,
     klass: "data product class to prepare for (as a C++ class name string)",
     event: "(optional) the event object to retrieve the data products from " = None,
@@ -150,14 +259,21 @@ def makeFileList(
   
   If a file ends with `.root`, it is added directly to the list.
   Otherwise, it is interpreted as a file list and treated as such
-  (see `ROOTutils.expandFileList()`).
+  (see `ROOTutils.expandFileList()`); the content of file lists is cached
+  (see `ROOTutils.FileListCache`).
   File list recursion is disabled.
   """
-  files = ROOT.vector(ROOT.string)()
+  entries = []
   for path in filePaths:
-    entries = [ path ] if path.endswith('.root') else expandFileList(path)
-    for entry in entries: files.push_back(entry)
+    if path.endswith('.root'): entries.append(path)
+    else: entries.extend(iterFileList(path, cache=True))
   # for
+  # the vector is filled in one call rather than with a `push_back()` per entry
+  try: return ROOT.vector(ROOT.string)(entries)
+  except TypeError: pass
+  files = ROOT.vector(ROOT.string)()
+  files.reserve(len(entries))
+  for entry in entries: files.push_back(entry)
   return files
 # makeFileList()
 
@@ -195,6 +311,85 @@ def forEach(event):
 # forEach()
 
 
+def skipEvents(
+ event: "the `gallery::Event` to be moved forward",
+ nSkip: "number of events to be skipped",
+ ) -> "the number of events actually skipped":
+  """
+  Moves `event` forward by `nSkip` events without reading them.
+  
+  Instead of calling `event.next()` for each skipped event, the entries of each
+  file are jumped over with `event.goToEntry()`.
+  Fewer than `nSkip` events are skipped only if the end of the input is reached.
+  """
+  nSkipped = 0
+  while (nSkipped < nSkip) and not event.atEnd():
+    entry = event.eventEntry()
+    nLeftInFile = event.numberOfEventsInFile() - entry # including this one
+    if nSkip - nSkipped < nLeftInFile:
+      event.goToEntry(entry + nSkip - nSkipped)
+      nSkipped = nSkip
+    else:
+      event.goToEntry(entry + nLeftInFile - 1) # last event in file...
+      event.next()                             # ... and on to the next file
+      nSkipped += nLeftInFile
+    # if ... else
+  # while
+  return nSkipped
+# skipEvents()
+
+
+def forEachEntry(
+ inputFiles: "list of input files, as supported by `eventLoop()`",
+ positions: "sequence of `(file index, entry)` pairs",
+ stager: "(optional) `FileStager` providing local copies of the files" = None,
+ ):
+  """
+  Visits the specified entries of the input files.
+  
+  For each position in `positions` the event at the specified entry of the
+  file at the specified index in `inputFiles` is loaded and yielded.
+  Positions in the same file should be contiguous in `positions`, as each
+  change of file opens it anew. Files without requested entries are not opened.
+  If a `stager` is specified, each file is read from its local copy.
+  
+  This function is a generator, and like `forEach()` it yields the same
+  `gallery::Event` object each time, only moved to the new entry.
+  
+  Example selecting events via an `EventIndex`:
+      
+      index = EventIndex(inputFiles)
+      for event in forEachEntry(index.files, index.positions(eventIDs)):
+        ...
+      
+  """
+  inputFiles = _makeFileVector(inputFiles)
+  event = None
+  iFile = None
+  path = None
+  try:
+    for iPosFile, entry in positions:
+      if iPosFile != iFile:
+        if stager and path is not None: stager.release(path)
+        iFile = iPosFile
+        path = str(inputFiles[iFile])
+        event = ROOT.gallery.Event(
+          _makeFileVector([ stager.get(path) if stager else path ])
+          )
+      elif event.eventEntry() + 1 == entry:
+        event.next()
+        yield event
+        continue
+      # if ... elif
+      event.goToEntry(entry)
+      yield event
+    # for
+  finally:
+    if stager and path is not None: stager.release(path)
+  # try ... finally
+# forEachEntry()
+
+
 class EventIterator:
   """
   Iterator for an event sequence.
@@ -249,19 +444,180 @@ def eventLoop(inputFiles,
   Options:
   - 'nEvents': number of events to be processed (does not include skipped ones)
   - 'nSkip': number of events from the beginning of the sample to be skipped
+  - 'select': process only the selected events, in the order they are stored
+    in the input files; the selection may be a list of event IDs (either
+    `art::EventID` objects or `(run, subrun, event)` tuples), a run range
+    specification (see `EventIndex.select()`) or a predicate on the
+    `EventAuxiliary` of the event; `nSkip` and `nEvents` apply to this
+    selection, and the event index passed to `process` is the one in it;
+    the selection is resolved via an `EventIndex` before any event is read,
+    and files with no selected events are not opened at all
+  - 'events': same as 'select', for a list of event IDs
+  - 'eventIndex': an `EventIndex` object for the input files, used instead of
+    building one (and its list of files is used instead of `inputFiles`)
+  - 'indexDir': the directory of the records of the `EventIndex` to be built
+  - 'nWorkers': if larger than `1`, the events are split in as many contiguous
+    shards and each shard is processed by `process` in a separate process
+    (see `parallelEventLoop()`)
+  - 'chunkSize': (parallel mode only) the events are split instead in chunks
+    of at most this many events, never across files, which the workers pull
+    one after the other as they become idle
+  - 'collect': (parallel mode only) callable with no arguments, executed in
+    each worker at the end of each shard or chunk; its return value must be
+    picklable and it is handed to the `reduce` callable; since a worker may
+    process many chunks, it should return only what was accumulated since
+    its previous call
+  - 'reduce': (parallel mode only) callable executed in this process once for
+    each shard, in shard order, with the result of `collect` as argument
+  - 'workerStats': (parallel mode only) if true, the utilization of each
+    worker is printed at the end (see `WorkerUtilization`), as it is when
+    `chunkSize` is specified; it can also be a `WorkerUtilization` object,
+    which will collect the statistics
+  - 'progress': if not `None`, progress (with throughput and estimated time to
+    completion) is printed every this many seconds; the number of events in
+    the input files is read first (see `countEvents()`)
+  - 'profile': if true, the time spent loading each event, in `process` and
+    in each data product access via `make_getValidHandle` bound getters and
+    `manyByType()` is measured and the memory usage sampled, and a summary is
+    printed at the end of the loop (see `EventLoopProfiler`); if the value is
+    a string, it is the path of a JSON file where the full report is written;
+    it can also be an `EventLoopProfiler` object, which will collect the data
+  - 'checkpoint': path of a checkpoint file, where the position in the input,
+    the event and error counts and the user state are regularly saved
+    (see `EventLoopCheckpoint`); not supported in parallel mode
+  - 'checkpointEvents', 'checkpointInterval': the checkpoint is saved every
+    this many processed events, and every this many seconds (default: 60)
+  - 'saveState': callable with no arguments returning the (picklable) state
+    of the user processing, to be saved into the checkpoint
+  - 'restoreState': callable restoring the user processing state from the
+    one returned by 'saveState', called when resuming
+  - 'resume': if true and the checkpoint file exists, the loop resumes from
+    the event after the last one saved in the checkpoint, jumping there
+    directly; the input files and the options `nSkip`, `nEvents` and
+    selection must be the same as in the original job
+  - 'batchSize': if specified, `process` is called once every this many
+    events, with an `EventBatch` holding the data products declared in the
+    'products' option from all those events, and the index of the first event
+    of the batch; a `False` return value counts as one error; checkpointing
+    is not supported in this mode
+  - 'products': (batch mode only) dictionary of the data products to be read:
+    the key is the name of the product in the batch, the value a tuple
+    `(class, input tag, fields)` with the arguments for `toArrays()`
+  - 'staging': if true, each input file is copied into a local scratch area
+    while the previous ones are processed, and read from there (see
+    `FileStager`); the value may be a `FileStager` object, or a dictionary
+    with the arguments to construct one
   """
   
+  nWorkers = options.get('nWorkers', 1)
+  if nWorkers is not None and nWorkers > 1:
+    return parallelEventLoop(inputFiles, process, options=options)
+  
   # option reading
   nSkip = options.get('nSkip', 0)
   nEvents = options.get('nEvents', None)
   
-  # make sure the input file list is in the right format
+  progressInterval = options.get('progress', None)
+  profiler = _makeProfiler(options)
+  batcher = _makeBatcher(process, options)
+  if batcher:
+    if options.get('checkpoint', None):
+      raise RuntimeError("Checkpointing is not supported in batch mode.")
+    process = batcher
+  # if
+  
+  selection = _selectionOption(options)
+  if selection is None:
+    files = list(map(str, _makeFileVector(inputFiles)))
+  else:
+    files, positions = _selectedPositions(inputFiles, options)
+    positions = positions[nSkip:_sliceEnd(nSkip, nEvents)]
+  # if ... else
+  
+  checkpoint, resumePoint = _setupCheckpoint(files, options)
+  if resumePoint and resumePoint['completed']:
+    print("Event loop already completed according to checkpoint '%s'."
+      % checkpoint.path)
+    return resumePoint['nErrors']
+  # if
+  
+  stager = _makeStager(options)
+  
+  if selection is None:
+    if resumePoint:
+      iFirstFile = resumePoint['iFile']
+      nSkipInFile = resumePoint['entry'] + 1
+      iFirstEvent = resumePoint['iEvent'] - resumePoint['entry']
+      nLeft = None if nEvents is None else nEvents - resumePoint['nProcessed']
+    else:
+      iFirstFile, nSkipInFile, iFirstEvent, nLeft = 0, nSkip, 0, nEvents
+    # if ... else
+    if checkpoint: checkpoint.iFirstFile = iFirstFile
+    progress = None if progressInterval is None else ProgressReporter(
+      _clippedCount(sum(countEvents(files[iFirstFile:])), nSkipInFile, nLeft),
+      interval=progressInterval,
+      )
+    with profiling(profiler), staging(stager):
+      nErrors, nProcessedEvents = _sequentialEventLoop(
+        files[iFirstFile:], process, nSkip=nSkipInFile, nEvents=nLeft,
+        iFirstEvent=iFirstEvent, progress=progress, profiler=profiler,
+        checkpoint=checkpoint, stager=stager,
+        )
+    # with
+  else:
+    iFirstEvent = resumePoint['iEvent'] + 1 if resumePoint else nSkip
+    positions = positions[iFirstEvent - nSkip:]
+    progress = None if progressInterval is None \
+      else ProgressReporter(len(positions), interval=progressInterval)
+    with profiling(profiler), staging(stager):
+      nErrors, nProcessedEvents = _entryListEventLoop(
+        files, process, positions, iFirstEvent=iFirstEvent, progress=progress,
+        profiler=profiler, checkpoint=checkpoint, stager=stager,
+        )
+    # with
+  # if ... else
+  if batcher:
+    with profiling(profiler):
+      if batcher.flush() is False: nErrors += 1
+  # if
+  if checkpoint:
+    nErrors, nProcessedEvents = checkpoint.finish()
+  if progress: progress.finish()
+  if profiler: _reportProfile(profiler, options)
+  
+  if nErrors > 0:
+    print("Encountered %d/%d errors." % (nErrors, nProcessedEvents),file=sys.stderr)
+  return nErrors
+# eventLoop()
+
+
+def _makeFileVector(inputFiles):
+  """Returns `inputFiles` as a `std::vector<std::string>` (see `eventLoop()`)."""
   if not isinstance(inputFiles, ROOT.vector(ROOT.string)):
     if isinstance(inputFiles, str): inputFiles = [ inputFiles, ]
     inputFiles = makeFileList(*inputFiles)
   # if
+  return inputFiles
+# _makeFileVector()
+
+
+def _sequentialEventLoop(inputFiles, process, nSkip = 0, nEvents = None,
+ iFirstEvent = 0, progress = None, profiler = None, checkpoint = None,
+ stager = None,
+ ):
+  """Runs `process` on the events of `inputFiles` in a single `gallery::Event`.
   
-  event = ROOT.gallery.Event(inputFiles)
+  The event index passed to `process` is offset by `iFirstEvent`.
+  If specified, the `progress` reporter is updated after each event, and
+  the `profiler` records the loading and processing time of each event.
+  The `checkpoint`, if any, is updated after each event.
+  If a `stager` is specified, each file is read from its local copy instead
+  (with a `gallery::Event` per file).
+  Returns the number of errors and the number of processed events.
+  """
+  
+  # make sure the input file list is in the right format
+  inputFiles = _makeFileVector(inputFiles)
   
   # ROOT.gStyle.SetOptStat(0)
   
@@ -269,41 +625,2366 @@ def eventLoop(inputFiles,
   nProcessedEvents = 0
   nErrors = 0
   
+  if profiler: profiler.startLoading()
   iFile = None
-  for iEvent, event in enumerate(forEach(event)):
+  for iEvent, iEventFile, event in _eventSequence(inputFiles, nSkip, stager):
+    if profiler: profiler.stopLoading()
     
-    if iFile != event.fileEntry():
-      iFile = event.fileEntry()
+    if iFile != iEventFile:
+      iFile = iEventFile
       print("Opening: '%s'" % inputFiles[iFile])
     # if new file
     
     # event flow control
-    if iEvent < nSkip: continue
     if (nEvents is not None) and (nProcessedEvents >= nEvents): break
     nProcessedEvents += 1
     
     ###
     ###
     ###
-    res = process(event, iEvent)
+    res = profiler.call('process', process, event, iFirstEvent + iEvent) \
+      if profiler else process(event, iFirstEvent + iEvent)
     if isinstance(res, bool) and not res: nErrors += 1
     
     ###
     ### all done
     ###
+    if progress: progress.update(nProcessedEvents)
+    if checkpoint:
+      checkpoint.update(iFile, event.eventEntry(), iFirstEvent + iEvent,
+        nProcessedEvents, nErrors)
+    # if
+    if profiler: profiler.startLoading()
+    
+  # for
+  return nErrors, nProcessedEvents
+# _sequentialEventLoop()
+
+
+def _eventSequence(inputFiles, nSkip, stager = None):
+  """Yields index, file index and event, after skipping `nSkip` events.
+  
+  The skipped events are jumped over without loading them.
+  If a `stager` is specified, each file is read from its local copy.
+  """
+  if not stager:
+    event = ROOT.gallery.Event(inputFiles)
+    nSkipped = skipEvents(event, nSkip)
+    for iEvent, event in enumerate(forEach(event), start=nSkipped):
+      yield iEvent, event.fileEntry(), event
+    return
+  # if no stager
+  
+  files = list(map(str, inputFiles))
+  stager.start(files)
+  iEvent = 0
+  for iFile, path in enumerate(files):
+    event = ROOT.gallery.Event(_makeFileVector([ stager.get(path) ]))
+    iEvent += skipEvents(event, nSkip - iEvent)
+    for event in forEach(event):
+      yield iEvent, iFile, event
+      iEvent += 1
+    # for events in file
+    stager.release(path)
+  # for files
+# _eventSequence()
+
+
+def _entryListEventLoop(inputFiles, process, positions, iFirstEvent = 0,
+ progress = None, profiler = None, checkpoint = None, stager = None,
+ ):
+  """Runs `process` on the events at the specified `(file, entry)` positions.
+  
+  The event index passed to `process` is the index in `positions`, offset by
+  `iFirstEvent`.
+  If specified, the `progress` reporter is updated after each event, and
+  the `profiler` records the loading and processing time of each event.
+  The `checkpoint`, if any, is updated after each event.
+  If a `stager` is specified, each file is read from its local copy.
+  Returns the number of errors and the number of processed events.
+  """
+  
+  inputFiles = _makeFileVector(inputFiles)
+  if stager:
+    stager.start([ str(inputFiles[iFile]) for iFile, _ in positions ])
+  
+  nProcessedEvents = 0
+  nErrors = 0
+  
+  if profiler: profiler.startLoading()
+  iFile = None
+  for iEvent, event \
+   in enumerate(forEachEntry(inputFiles, positions, stager=stager),
+     start=iFirstEvent):
+    if profiler: profiler.stopLoading()
+    
+    if iFile != positions[iEvent - iFirstEvent][0]:
+      iFile = positions[iEvent - iFirstEvent][0]
+      print("Opening: '%s'" % inputFiles[iFile])
+    # if new file
+    
+    nProcessedEvents += 1
+    res = profiler.call('process', process, event, iEvent) \
+      if profiler else process(event, iEvent)
+    if isinstance(res, bool) and not res: nErrors += 1
+    if progress: progress.update(nProcessedEvents)
+    if checkpoint:
+      checkpoint.update(
+        iFile, positions[iEvent - iFirstEvent][1], iEvent,
+        nProcessedEvents, nErrors,
+        )
+    # if
+    if profiler: profiler.startLoading()
     
   # for
+  return nErrors, nProcessedEvents
+# _entryListEventLoop()
+
+
+def _sliceEnd(begin, n):
+  """Returns the end of a slice starting at `begin` with `n` elements (if any)."""
+  return None if n is None else begin + n
+
+
+def _clippedCount(total, nSkip, nEvents):
+  """Returns how many of `total` events are left after `nSkip` and `nEvents`."""
+  left = max(total - nSkip, 0)
+  return left if nEvents is None else min(left, nEvents)
+# _clippedCount()
+
+
+def _selectedPositions(inputFiles, options):
+  """Returns the input files and the positions of the selected events in them.
+  
+  The selection is from the `eventLoop()` options.
+  """
+  index = options.get('eventIndex', None)
+  if index is None:
+    index = EventIndex(inputFiles, indexDir=options.get('indexDir', None))
+  return index.files, index.select(_selectionOption(options))
+# _selectedPositions()
+
+
+def _selectionOption(options):
+  """Returns the event selection from `eventLoop()` options (`None` if none)."""
+  selection = options.get('select', None)
+  return options.get('events', None) if selection is None else selection
+# _selectionOption()
+
+
+################################################################################
+### event counting and progress
+###
+def _countFileEvents(path: "path of the art ROOT file") -> "number of events":
+  """Returns the number of entries in the `Events` tree of the specified file."""
+  ROOTfile = ROOT.TFile.Open(path, "READ")
+  if not ROOTfile or ROOTfile.IsZombie():
+    raise RuntimeError("Can't open ROOT file '{}'".format(path))
+  try:
+    tree = ROOTfile.Get("Events")
+    return tree.GetEntries() if tree else 0
+  finally:
+    ROOTfile.Close()
+# _countFileEvents()
+
+
+def countEvents(
+ inputFiles: "input files, as supported by `eventLoop()`",
+ nWorkers: "number of processes counting in parallel (default: all CPU)" = None,
+ cachePath: "path of the count cache file (default: in the cache area)" = None,
+ ) -> "list with the number of events in each of the input files":
+  """Returns the number of events in each of the input files.
+  
+  Only the number of entries of the `Events` tree of each file is read.
+  The counts are stored into a cache file and reused as long as the size and
+  modification time of the files are unchanged (files which can't be checked
+  this way, e.g. remote ones, are always read). Files not in the cache are
+  read by up to `nWorkers` processes in parallel.
+  """
+  import multiprocessing
+  
+  files = list(map(str, _makeFileVector(inputFiles)))
+  if cachePath is None:
+    cachePath = os.path.join(cacheDirectory(), 'eventcounts.pickle')
+  cache = _loadPickle(cachePath, default={})
+  
+  signatures = list(map(_fileSignature, files))
+  counts = [ None ] * len(files)
+  toBeCounted = []
+  for iFile, ( path, signature ) in enumerate(zip(files, signatures)):
+    cached = cache.get(os.path.abspath(path), None) \
+      if signature is not None else None
+    if cached is not None and cached[0] == signature: counts[iFile] = cached[1]
+    else: toBeCounted.append(iFile)
+  # for
+  
+  if not toBeCounted: return counts
+  
+  if nWorkers is None: nWorkers = multiprocessing.cpu_count()
+  nWorkers = min(nWorkers, len(toBeCounted))
+  paths = [ files[iFile] for iFile in toBeCounted ]
+  if nWorkers > 1:
+    with multiprocessing.get_context('fork').Pool(nWorkers) as pool:
+      newCounts = pool.map(_countFileEvents, paths)
+  else: newCounts = list(map(_countFileEvents, paths))
+  
+  for iFile, count in zip(toBeCounted, newCounts):
+    counts[iFile] = count
+    if signatures[iFile] is not None:
+      cache[os.path.abspath(files[iFile])] = ( signatures[iFile], count )
+  # for
+  _atomicPickleDump(cache, cachePath)
+  return counts
+# countEvents()
+
+
+class ProgressReporter:
+  """
+  Prints the progress of an event loop at regular time intervals.
+  
+  Call `update()` with the number of processed events after each event (or
+  batch of events); every `interval` seconds a line is printed with the number
+  of processed events out of the `total`, the throughput and an estimation of
+  the time left. `report()` prints a line right away, and `finish()` prints
+  the final one unless already done.
+  """
+  def __init__(self,
+   total: "number of events expected to be processed",
+   interval: "seconds between two reports" = 10.0,
+   stream: "where to print the reports (default: `sys.stderr`)" = None,
+   ):
+    import time
+    self.total = total
+    self.interval = interval
+    self.stream = stream
+    self.nProcessed = 0
+    self.nReported = None
+    self.startTime = time.monotonic()
+    self.nextReportTime = self.startTime + interval
+  # __init__()
+  
+  def update(self, nProcessed):
+    import time
+    self.nProcessed = nProcessed
+    now = time.monotonic()
+    if now >= self.nextReportTime:
+      self.report(now)
+      self.nextReportTime = now + self.interval
+    # if
+  # update()
+  
+  def report(self, now = None):
+    import time, datetime
+    if now is None: now = time.monotonic()
+    elapsed = now - self.startTime
+    rate = self.nProcessed / elapsed if elapsed > 0.0 else 0.0
+    msg = "Processed %d/%d events" % (self.nProcessed, self.total)
+    if self.total > 0:
+      msg += " (%.1f%%)" % (100.0 * self.nProcessed / self.total)
+    msg += ", %.1f events/s" % rate
+    if rate > 0.0 and self.nProcessed < self.total:
+      ETA = datetime.timedelta(seconds=round((self.total - self.nProcessed) / rate))
+      msg += ", ETA %s" % ETA
+    # if
+    print(msg, file=(self.stream if self.stream else sys.stderr))
+    self.nReported = self.nProcessed
+  # report()
+  
+  def finish(self):
+    if self.nReported != self.nProcessed: self.report()
+  
+# class ProgressReporter
+
+
+################################################################################
+### profiling
+###
+def _currentRSS() -> "resident memory of this process [bytes]":
+  try:
+    with open('/proc/self/statm', 'r') as statm:
+      return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError, IndexError):
+    import resource # peak memory is the best we can do here
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+# _currentRSS()
+
+
+def _inputTagString(tag):
+  """Returns a string representation of the input tag (or string) `tag`."""
+  return tag if isinstance(tag, str) else str(tag.encode())
+
+
+def _percentile(sortedValues, fraction):
+  """Returns the `fraction` percentile of the sorted values (nearest rank)."""
+  if not sortedValues: return None
+  rank = max(int(-(-fraction * len(sortedValues) // 1)) - 1, 0)
+  return sortedValues[min(rank, len(sortedValues) - 1)]
+# _percentile()
+
+
+class EventLoopProfiler:
+  """
+  Collects timing and memory information from an event loop.
+  
+  The time of each measured call is recorded under a key: `'loading'` for
+  moving to the next event (including opening files), `'process'` for the
+  user processing function (including the data product access within it),
+  and `( 'getValidHandle', klass, tag )` and `( 'getManyByType', klass )` for
+  the data product access via `HandleMaker` (while the profiler is installed
+  by `profiling()`). The resident memory is sampled every `RSSsamplingPeriod`
+  events.
+  
+  `summary()` returns a table with count, total, mean and percentiles of each
+  key, and `report()` the same information as a dictionary (suitable for
+  JSON output via `writeJSON()`).
+  """
+  Percentiles = ( 0.50, 0.90, 0.99 )
+  
+  def __init__(self, RSSsamplingPeriod = 100):
+    import array
+    self.timings = {}
+    self.RSS = array.array('d')
+    self.RSSsamplingPeriod = RSSsamplingPeriod
+    self.nEvents = 0
+    self.loadingStart = None
+  # __init__()
+  
+  def record(self, key, seconds):
+    import array
+    try: self.timings[key].append(seconds)
+    except KeyError: self.timings[key] = array.array('d', [ seconds ])
+  # record()
+  
+  def call(self, key, func, *args):
+    """Calls `func(*args)` and records the time it takes under `key`."""
+    import time
+    start = time.perf_counter()
+    try: return func(*args)
+    finally: self.record(key, time.perf_counter() - start)
+  # call()
+  
+  def startLoading(self):
+    import time
+    self.loadingStart = time.perf_counter()
+  # startLoading()
+  
+  def stopLoading(self):
+    """Records the time since `startLoading()`, and marks a new event."""
+    import time
+    if self.loadingStart is not None:
+      self.record('loading', time.perf_counter() - self.loadingStart)
+      self.loadingStart = None
+    # if
+    if self.nEvents % self.RSSsamplingPeriod == 0:
+      self.RSS.append(_currentRSS())
+    self.nEvents += 1
+  # stopLoading()
+  
+  def merge(self, other):
+    """Adds to this profiler all the data from the `other` one."""
+    import array
+    for key, values in other.timings.items():
+      self.timings.setdefault(key, array.array('d')).extend(values)
+    self.RSS.extend(other.RSS)
+    self.nEvents += other.nEvents
+  # merge()
+  
+  @staticmethod
+  def keyName(key):
+    if isinstance(key, str): return key
+    if key[0] == 'getValidHandle': return "getValidHandle<%s>(%s)" % key[1:]
+    return "%s<%s>" % key
+  # keyName()
+  
+  def report(self) -> "dictionary with the statistics of all timings":
+    timings = {}
+    for key, values in self.timings.items():
+      values = sorted(values)
+      stats = {
+        'count': len(values),
+        'total': sum(values),
+        'mean': sum(values) / len(values),
+        'min': values[0],
+        'max': values[-1],
+        }
+      for fraction in EventLoopProfiler.Percentiles:
+        stats['p%d' % round(100 * fraction)] = _percentile(values, fraction)
+      timings[EventLoopProfiler.keyName(key)] = stats
+    # for
+    RSS = {
+      'samples': len(self.RSS),
+      'max': max(self.RSS) if self.RSS else None,
+      'last': self.RSS[-1] if self.RSS else None,
+      }
+    return { 'events': self.nEvents, 'timings': timings, 'RSS': RSS, }
+  # report()
+  
+  def writeJSON(self, path):
+    import json
+    with open(path, 'w') as outFile: json.dump(self.report(), outFile, indent=2)
+  
+  def summary(self) -> "a string with a table of the statistics":
+    report = self.report()
+    percentiles \
+      = [ 'p%d' % round(100 * fraction) for fraction in self.Percentiles ]
+    header = [ 'key', 'count', 'total [s]', 'mean [ms]' ] \
+      + [ p + ' [ms]' for p in percentiles ] + [ 'max [ms]' ]
+    rows = [ header ]
+    for name, stats in sorted(report['timings'].items(),
+     key=lambda item: -item[1]['total']):
+      rows.append([ name, str(stats['count']), "%.3f" % stats['total'] ]
+        + [ "%.3f" % (stats[k] * 1000.0) for k in [ 'mean' ] + percentiles + [ 'max' ] ]
+        )
+    # for
+    widths = [ max(len(row[i]) for row in rows) for i in range(len(header)) ]
+    lines = [
+      "  ".join([ row[0].ljust(widths[0]) ]
+        + [ cell.rjust(width) for cell, width in zip(row[1:], widths[1:]) ])
+      for row in rows
+      ]
+    lines.append("%d events" % report['events'])
+    if report['RSS']['samples']:
+      lines[-1] += "; resident memory: %.1f MiB (max %.1f MiB)" % (
+        report['RSS']['last'] / 2**20, report['RSS']['max'] / 2**20,
+        )
+    # if
+    return "\n".join(lines)
+  # summary()
+  
+# class EventLoopProfiler
+
+
+class profiling:
+  """Context manager installing a profiler for the data product access.
+  
+  A `None` profiler is accepted, and it does nothing.
+  """
+  def __init__(self, profiler): self.profiler = profiler
+  def __enter__(self):
+    if self.profiler:
+      self.oldProfiler = HandleMaker.profiler
+      HandleMaker.profiler = self.profiler
+    return self.profiler
+  # __enter__()
+  def __exit__(self, exc_type, exc_value, traceback):
+    if self.profiler: HandleMaker.profiler = self.oldProfiler
+# class profiling
+
+
+def _makeProfiler(options):
+  """Returns the profiler requested by `eventLoop()` options (or `None`)."""
+  profile = options.get('profile', None)
+  if not profile: return None
+  return profile if isinstance(profile, EventLoopProfiler) else EventLoopProfiler()
+# _makeProfiler()
+
+
+def _reportProfile(profiler, options):
+  """Prints the summary and writes the report requested by the options."""
+  print(profiler.summary())
+  reportPath = options.get('profile', None)
+  if isinstance(reportPath, str):
+    profiler.writeJSON(reportPath)
+    print("Profiling report written into '%s'." % reportPath)
+  # if
+# _reportProfile()
+
+
+################################################################################
+### checkpointing
+###
+class EventLoopCheckpoint:
+  """
+  Keeps a checkpoint file with the progress of an event loop.
+  
+  The checkpoint records the position `(file index, entry)` and the index of
+  the last processed event, the number of processed events and errors, and
+  the user state returned by the `saveState` callable.
+  It is written every `everyEvents` events and every `everySeconds` seconds
+  (`None` disables either), and at the end of the loop (`finish()`).
+  The `signature` identifies the job configuration, and a checkpoint with a
+  different one is not accepted for resuming (see `load()`).
+  
+  The counts passed to `update()` are relative to the current run of the loop;
+  `baseProcessed` and `baseErrors` (from the resumed checkpoint) are added.
+  Likewise, `iFirstFile` is added to the file index.
+  """
+  Version = 1
+  
+  def __init__(self,
+   path: "path of the checkpoint file",
+   signature: "identifier of the job configuration",
+   everyEvents: "events between checkpoints" = None,
+   everySeconds: "seconds between checkpoints" = 60.0,
+   saveState: "callable returning the picklable user state" = None,
+   ):
+    import time
+    self.path = path
+    self.signature = signature
+    self.everyEvents = everyEvents
+    self.everySeconds = everySeconds
+    self.saveState = saveState
+    self.iFirstFile = 0
+    self.baseProcessed = 0
+    self.baseErrors = 0
+    self.position = None # ( iFile, entry, iEvent )
+    self.nProcessed = 0
+    self.nErrors = 0
+    self.nLastWritten = 0
+    self.lastWriteTime = time.monotonic()
+  # __init__()
+  
+  def update(self, iFile, entry, iEvent, nProcessed, nErrors):
+    """Records a processed event, and writes the checkpoint if it is time."""
+    import time
+    self.position = ( self.iFirstFile + iFile, entry, iEvent )
+    self.nProcessed = nProcessed
+    self.nErrors = nErrors
+    if self.everyEvents and nProcessed - self.nLastWritten >= self.everyEvents:
+      self.write()
+    elif self.everySeconds is not None \
+     and time.monotonic() - self.lastWriteTime >= self.everySeconds:
+      self.write()
+  # update()
+  
+  def write(self, completed = False):
+    import time
+    iFile, entry, iEvent = self.position if self.position else ( None, ) * 3
+    _atomicPickleDump({
+        'version': EventLoopCheckpoint.Version,
+        'signature': self.signature,
+        'completed': completed,
+        'iFile': iFile,
+        'entry': entry,
+        'iEvent': iEvent,
+        'nProcessed': self.baseProcessed + self.nProcessed,
+        'nErrors': self.baseErrors + self.nErrors,
+        'state': self.saveState() if self.saveState else None,
+      },
+      self.path
+      )
+    self.nLastWritten = self.nProcessed
+    self.lastWriteTime = time.monotonic()
+  # write()
+  
+  def finish(self) -> "total number of errors and of processed events":
+    """Writes the final checkpoint, and returns the total counts."""
+    self.write(completed=True)
+    return self.baseErrors + self.nErrors, self.baseProcessed + self.nProcessed
+  # finish()
+  
+  def load(self) -> "the checkpoint content, or `None` if not present":
+    """Reads the checkpoint and sets the base counts from it."""
+    checkpoint = _loadPickle(self.path, default=None)
+    if checkpoint is None: return None
+    if checkpoint.get('version', None) != EventLoopCheckpoint.Version \
+     or checkpoint.get('signature', None) != self.signature:
+      raise RuntimeError(
+        "Checkpoint '{}' was written by a different job configuration."
+        .format(self.path))
+    # if
+    self.baseProcessed = checkpoint['nProcessed']
+    self.baseErrors = checkpoint['nErrors']
+    return checkpoint
+  # load()
+  
+# class EventLoopCheckpoint
+
+
+def _selectionSignature(selection) -> "a representation of `selection` stable across jobs":
+  """Returns the event selection (see `eventLoop()`) in terms of plain values.
+  
+  Event IDs are turned into `(run, subrun, event)` tuples and run ranges into
+  their boundaries, so that the result does not depend on object addresses.
+  Selections that can't be described (predicates, iterators) are represented
+  only by their kind.
+  """
+  if selection is None: return None
+  if callable(selection): return 'predicate'
+  if isinstance(selection, str): return selection
+  if isinstance(selection, RunRange):
+    return ( 'RunRange', selection.first, selection.last )
+  if hasattr(selection, 'tolist'): selection = selection.tolist() # NumPy
+  if not hasattr(selection, '__len__'): return 'iterable' # can't consume it
+  return [
+    _selectionSignature(element) if isinstance(element, RunRange)
+      else tuple(map(int, _eventIDkey(element)))
+    for element in selection
+    ]
+# _selectionSignature()
+
+
+def _setupCheckpoint(files, options):
+  """Returns the checkpoint and the resume point from `eventLoop()` options.
+  
+  Both are `None` if not requested; the resume point is the content of the
+  checkpoint, or `None` if there is nothing to resume from.
+  """
+  import hashlib, logging
+  path = options.get('checkpoint', None)
+  if not path:
+    if options.get('resume', False):
+      raise RuntimeError("Resuming an event loop requires a 'checkpoint' file.")
+    return None, None
+  # if no checkpoint
+  
+  signature = hashlib.sha1(repr((
+    files, options.get('nSkip', 0), options.get('nEvents', None),
+    _selectionSignature(_selectionOption(options)),
+    )).encode('utf-8')).hexdigest()
+  checkpoint = EventLoopCheckpoint(path, signature,
+    everyEvents=options.get('checkpointEvents', None),
+    everySeconds=options.get('checkpointInterval', 60.0),
+    saveState=options.get('saveState', None),
+    )
+  if not options.get('resume', False): return checkpoint, None
+  
+  resumePoint = checkpoint.load()
+  if resumePoint is None:
+    logging.info("No checkpoint in '%s': starting from the beginning.", path)
+    return checkpoint, None
+  # if
+  restoreState = options.get('restoreState', None)
+  if restoreState: restoreState(resumePoint['state'])
+  if resumePoint['iEvent'] is None: # nothing had been processed yet
+    resumePoint = None if not resumePoint['completed'] else resumePoint
+  else:
+    print("Resuming after event #%d (entry %d of '%s'), %d events processed."
+      % (resumePoint['iEvent'], resumePoint['entry'], files[resumePoint['iFile']],
+      resumePoint['nProcessed']))
+  # if ... else
+  return checkpoint, resumePoint
+# _setupCheckpoint()
+
+
+################################################################################
+### batch processing
+###
+class ProductBatch:
+  """
+  The content of a data product from all the events of a batch.
+  
+  The elements of the product from all events are concatenated in `data`,
+  a NumPy structured array (see `toArrays()`); the elements of event `i` of
+  the batch are `data[offsets[i]:offsets[i+1]]` (also as `event(i)`).
+  """
+  def __init__(self, data, counts):
+    import numpy
+    self.data = data
+    self.counts = numpy.asarray(counts, dtype=numpy.int64)
+    self.offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+    numpy.cumsum(self.counts, out=self.offsets[1:])
+  # __init__()
+  
+  def __len__(self): return len(self.data)
+  
+  def __getitem__(self, field): return self.data[field]
+  
+  def event(self, i): return self.data[self.offsets[i]:self.offsets[i+1]]
+  
+  def eventIndex(self) -> "index in the batch of the event of each element":
+    import numpy
+    return numpy.repeat(numpy.arange(len(self.counts)), self.counts)
+  
+# class ProductBatch
+
+
+class EventBatch:
+  """
+  Data products from a batch of consecutive events.
+  
+  `eventIDs` is a NumPy structured array with `run`, `subRun` and `event`
+  fields, one record per event; each product is a `ProductBatch` accessible
+  with the name it was declared with (`batch["hits"]`).
+  """
+  def __init__(self, eventIDs, products):
+    self.eventIDs = eventIDs
+    self.products = products
+  # __init__()
+  
+  def __len__(self): return len(self.eventIDs)
+  
+  def __getitem__(self, name): return self.products[name]
+  
+  def __contains__(self, name): return name in self.products
+  
+# class EventBatch
+
+
+class _EventBatcher:
+  """Event processor collecting data products and handing over batches.
+  
+  It acts as an event processing function for the event loops, and it calls
+  `process(batch, iFirstEvent)` every `batchSize` events, and on `flush()`.
+  """
+  def __init__(self, process, products, batchSize):
+    self.process = process
+    self.batchSize = batchSize
+    self.products = [
+      ( name, make_getValidHandle.getValidHandle(klass), klass,
+        ROOT.art.InputTag(tag) if isinstance(tag, str) else tag, list(fields),
+      )
+      for name, ( klass, tag, fields ) in products.items()
+      ]
+    self.reset()
+  # __init__()
+  
+  def reset(self):
+    self.iFirstEvent = None
+    self.eventKeys = []
+    self.buffers = { name: [] for name, *_ in self.products }
+  # reset()
+  
+  def __call__(self, event, iEvent):
+    if self.iFirstEvent is None: self.iFirstEvent = iEvent
+    self.eventKeys.append(_eventIDkey(event.eventAuxiliary().id()))
+    for name, getHandle, klass, tag, fields in self.products:
+      self.buffers[name].append(
+        toArrays(getHandle(event, tag), fields, klass=klass)
+        )
+    # for
+    return self.flush() if len(self.eventKeys) >= self.batchSize else None
+  # __call__()
+  
+  def flush(self) -> "the result of the processing, `None` if no events":
+    import numpy
+    if not self.eventKeys: return None
+    eventIDs = numpy.array(self.eventKeys, dtype=[
+      ( 'run', numpy.uint32 ), ( 'subRun', numpy.uint32 ),
+      ( 'event', numpy.uint32 ),
+      ])
+    batch = EventBatch(eventIDs, {
+      name: ProductBatch(numpy.concatenate(arrays), list(map(len, arrays)))
+      for name, arrays in self.buffers.items()
+      })
+    iFirstEvent = self.iFirstEvent
+    self.reset()
+    return self.process(batch, iFirstEvent)
+  # flush()
+  
+# class _EventBatcher
+
+
+def _makeBatcher(process, options):
+  """Returns the batch processor requested by `eventLoop()` options, if any."""
+  batchSize = options.get('batchSize', None)
+  if not batchSize: return None
+  return _EventBatcher(process, options.get('products', {}), batchSize)
+# _makeBatcher()
+
+
+################################################################################
+### input file staging
+###
+class FileStager:
+  """
+  Copies input files into a local scratch directory ahead of their use.
+  
+  The files are expected to be used in the order given to `start()`. When a
+  file is requested with `get()`, a background thread is asked to copy it and
+  the next `readAhead` ones into `scratchDir`, and the path of the local copy
+  is returned as soon as it is complete. The local copies are kept as a cache
+  (also across jobs), and the least recently used ones are removed to keep
+  the total size of the scratch directory within `maxSize` bytes (if
+  specified); files being used or staged ahead are never removed.
+  The scratch directory may be shared by several processes (like the workers
+  of a parallel event loop): the size limit applies to their total, and a file
+  in use by any of them is not removed by the others.
+  Files which can't be copied (e.g. remote URLs) are used from their original
+  location.
+  
+  Example:
+      
+      stager = FileStager("/scratch/myjob", readAhead=3, maxSize=50 * 2**30)
+      eventLoop(inputFiles, process, options={ 'staging': stager })
+      
+  """
+  def __init__(self,
+   scratchDir: "directory for the local copies (default: in cache area)" = None,
+   readAhead: "number of files to be copied in advance" = 2,
+   maxSize: "maximum size of the scratch directory content [bytes]" = None,
+   ):
+    import threading
+    self.scratchDir = scratchDir if scratchDir else cacheDirectory('staging')
+    os.makedirs(self.scratchDir, exist_ok=True)
+    self.readAhead = readAhead
+    self.maxSize = maxSize
+    self.lock = threading.Lock()
+    self.thread = None
+    self.queue = None
+    self.order = []
+    self.ready = {}  # original path -> threading.Event, set when staged
+    self.staged = {} # original path -> local path (or original path)
+    self.protected = set() # local paths pinned by this stager
+  # __init__()
+  
+  def localPath(self, path: "original path") -> "path of the local copy":
+    import hashlib
+    pathHash = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return os.path.join(
+      self.scratchDir, pathHash[:16] + '_' + os.path.basename(path)
+      )
+  # localPath()
+  
+  @staticmethod
+  def isStageable(path): return '://' not in path and os.path.isfile(path)
+  
+  def start(self, files: "original paths of the files, in order of use"):
+    """Declares the files going to be used, in order (repetitions are ignored)."""
+    self.order = list(dict.fromkeys(files))
+  
+  def get(self, path: "original path of the file") -> "path to be read":
+    """Returns the path of the local copy of `path`, waiting for it if needed.
+    
+    The staging of the next files is also requested.
+    """
+    import time
+    try: iFile = self.order.index(path)
+    except ValueError:
+      self.order.append(path)
+      iFile = len(self.order) - 1
+    # try ... except
+    for upcoming in self.order[iFile:iFile + 1 + self.readAhead]:
+      self._request(upcoming)
+    self.ready[path].wait()
+    localPath = self.staged[path]
+    if localPath == path: return path
+    # the access time marks the use (the modification time is the original one)
+    try: os.utime(localPath, ns=( time.time_ns(), os.stat(localPath).st_mtime_ns ))
+    except FileNotFoundError: return path # removed by someone else meanwhile
+    return localPath
+  # get()
+  
+  def release(self, path: "original path of the file"):
+    """Declares that `path` is not being used any more.
+    
+    If the scratch directory is over its size limit, its copy may be removed.
+    """
+    localPath = self.staged.get(path, None)
+    with self._sharedLock():
+      if localPath in self.protected: self._unpin(localPath)
+      self._makeRoom(0)
+    # with
+  # release()
+  
+  def close(self):
+    """Stops the background staging."""
+    if self.thread is None: return
+    self.queue.put(None)
+    self.thread.join()
+    self.thread = None
+  # close()
+  
+  def _request(self, path):
+    import threading, queue
+    if path in self.ready: return
+    self.ready[path] = threading.Event()
+    if self.thread is None:
+      self.queue = queue.Queue()
+      self.thread = threading.Thread(target=self._stagingLoop, daemon=True)
+      self.thread.start()
+    # if
+    self.queue.put(path)
+  # _request()
+  
+  def _stagingLoop(self):
+    import logging
+    while True:
+      path = self.queue.get()
+      if path is None: break
+      try: self.staged[path] = self._stage(path)
+      except Exception as e:
+        logging.warning("Staging of '%s' failed (%s): using it directly.", path, e)
+        self.staged[path] = path
+      self.ready[path].set()
+    # while
+  # _stagingLoop()
+  
+  def _stage(self, path):
+    import shutil, tempfile, time
+    if not self.isStageable(path): return path
+    localPath = self.localPath(path)
+    stat = os.stat(path)
+    size = stat.st_size
+    with self._sharedLock():
+      self._pin(localPath)
+      if self._isCopyOf(localPath, stat): return localPath
+      self._makeRoom(size)
+      # the name of the copy in progress carries its size (see `_scratchContent()`)
+      fd, tempPath = tempfile.mkstemp(dir=self.scratchDir,
+        prefix='%d-%d-' % ( os.getpid(), size ), suffix='.tmp',
+        )
+      os.close(fd)
+    # with
+    try:
+      shutil.copyfile(path, tempPath)
+      # the copy carries the modification time of the original (see `_isCopyOf()`)
+      os.utime(tempPath, ns=( time.time_ns(), stat.st_mtime_ns ))
+      os.replace(tempPath, localPath)
+    except BaseException:
+      os.unlink(tempPath)
+      raise
+    # try ... except
+    return localPath
+  # _stage()
+  
+  @staticmethod
+  def _isCopyOf(localPath, stat):
+    """Returns whether `localPath` is a copy of a file with the given `stat`."""
+    try: localStat = os.stat(localPath)
+    except OSError: return False
+    return localStat.st_size == stat.st_size \
+      and localStat.st_mtime_ns == stat.st_mtime_ns
+  # _isCopyOf()
+  
+  def _sharedLock(self):
+    """Returns a context manager holding the lock on the scratch directory.
+    
+    The lock is also held against the other processes using the directory.
+    """
+    import fcntl, contextlib
+    @contextlib.contextmanager
+    def lock():
+      with self.lock, open(os.path.join(self.scratchDir, '.lock'), 'w') as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(lockFile, fcntl.LOCK_UN)
+      # with
+    # lock()
+    return lock()
+  # _sharedLock()
+  
+  def _pinPath(self, localPath):
+    # one pin per stager: several may share a process
+    return '%s.%d_%x.pin' % ( localPath, os.getpid(), id(self) )
+  
+  def _pin(self, localPath):
+    """Protects `localPath` from eviction by any process (locked)."""
+    if localPath in self.protected: return
+    open(self._pinPath(localPath), 'w').close()
+    self.protected.add(localPath)
+  # _pin()
+  
+  def _unpin(self, localPath):
+    """Lifts the protection of `localPath` by this stager (locked)."""
+    try: os.unlink(self._pinPath(localPath))
+    except FileNotFoundError: pass
+    self.protected.discard(localPath)
+  # _unpin()
+  
+  @staticmethod
+  def _isAlive(pid):
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: pass
+    return True
+  # _isAlive()
+  
+  def _scratchContent(self):
+    """Returns the content of the scratch directory, from all processes (locked).
+    
+    The result is a list of local copies ( path, size, access time ), the size
+    of the copies in progress and the set of pinned copies. Pins and partial
+    copies left behind by terminated processes are removed.
+    """
+    copies, reserved, pinned = [], 0, set()
+    for name in os.listdir(self.scratchDir):
+      path = os.path.join(self.scratchDir, name)
+      if name == '.lock': continue
+      elif name.endswith('.pin'):
+        localPath, owner = path[:-len('.pin')].rsplit('.', 1)
+        if self._isAlive(int(owner.split('_')[0])): pinned.add(localPath)
+        else: os.unlink(path)
+      elif name.endswith('.tmp'):
+        pid, size = name.split('-')[:2]
+        if self._isAlive(int(pid)): reserved += int(size)
+        else: os.unlink(path)
+      else:
+        try: stat = os.stat(path)
+        except FileNotFoundError: continue
+        copies.append(( path, stat.st_size, stat.st_atime_ns ))
+      # if ... else
+    # for
+    return copies, reserved, pinned
+  # _scratchContent()
+  
+  def _makeRoom(self, size):
+    """Removes least recently used copies until `size` bytes fit (locked)."""
+    import logging
+    if self.maxSize is None: return
+    copies, total, pinned = self._scratchContent()
+    total += sum(copySize for _, copySize, _ in copies)
+    for localPath, copySize, _ in sorted(copies, key=lambda copy: copy[2]):
+      if total + size <= self.maxSize: break
+      if localPath in pinned: continue
+      logging.debug("Evicting staged file '%s'", localPath)
+      try: os.unlink(localPath)
+      except FileNotFoundError: pass
+      total -= copySize
+    # for
+  # _makeRoom()
+  
+# class FileStager
+
+
+class staging:
+  """Context manager closing a file stager at the end (`None` is accepted)."""
+  def __init__(self, stager): self.stager = stager
+  def __enter__(self): return self.stager
+  def __exit__(self, exc_type, exc_value, traceback):
+    if self.stager: self.stager.close()
+# class staging
+
+
+def _makeStager(options):
+  """Returns the file stager requested by `eventLoop()` options (or `None`)."""
+  stager = options.get('staging', None)
+  if not stager or isinstance(stager, FileStager): return stager or None
+  return FileStager(**stager) if isinstance(stager, dict) else FileStager()
+# _makeStager()
+
+
+################################################################################
+### parallel event loop
+###
+
+
+def _fileEventOffsets(counts):
+  """Returns the global index of the first event of each file, plus the total."""
+  offsets = [ 0 ]
+  for count in counts: offsets.append(offsets[-1] + count)
+  return offsets
+# _fileEventOffsets()
+
+
+def _splitEventRange(begin, end, nShards):
+  """Splits the global event range [`begin`, `end`[ in up to `nShards` parts.
+  
+  The parts are contiguous, non-empty and differ in size by at most one event.
+  """
+  nShards = max(1, min(nShards, end - begin))
+  return [
+    ( begin + ((end - begin) * i) // nShards,
+      begin + ((end - begin) * (i + 1)) // nShards,
+      )
+    for i in range(nShards)
+    ]
+# _splitEventRange()
+
+
+def _chunkEventRange(begin, end, boundaries, chunkSize):
+  """Splits the range [`begin`, `end`[ in chunks of up to `chunkSize` events.
+  
+  `boundaries` are the sorted indices of the first event of each file (and
+  of the end of the last one); chunks do not cross them, and the chunks from
+  the same file differ in size by at most one event.
+  """
+  chunks = []
+  for fileBegin, fileEnd in zip(boundaries[:-1], boundaries[1:]):
+    chunkBegin, chunkEnd = max(begin, fileBegin), min(end, fileEnd)
+    if chunkEnd <= chunkBegin: continue
+    nChunks = -(-(chunkEnd - chunkBegin) // chunkSize)
+    chunks.extend(_splitEventRange(chunkBegin, chunkEnd, nChunks))
+  # for
+  return chunks
+# _chunkEventRange()
+
+
+def _positionBoundaries(positions):
+  """Returns the indices in `positions` where a new file starts, and the end."""
+  return [
+    i for i, ( iFile, _ ) in enumerate(positions)
+    if i == 0 or iFile != positions[i-1][0]
+    ] + [ len(positions) ]
+# _positionBoundaries()
+
+
+def _runEventRange(files, offsets, process, begin, end, profiler = None,
+ stager = None,
+ ):
+  """Processes the global event range [`begin`, `end`[ of `files`.
+  
+  The `offsets` are the global indices of the first event of each file
+  (see `_fileEventOffsets()`).
+  """
+  import bisect
+  iFirstFile = bisect.bisect_right(offsets, begin) - 1
+  iEndFile = bisect.bisect_left(offsets, end)
+  return _sequentialEventLoop(
+    files[iFirstFile:iEndFile], process,
+    nSkip=begin - offsets[iFirstFile], nEvents=end - begin,
+    iFirstEvent=offsets[iFirstFile], profiler=profiler, stager=stager,
+    )
+# _runEventRange()
+
+
+class _ParallelLoopContext:
+  """State shared with the worker processes (inherited via `fork`)."""
+  runShard = None
+  collect = None
+  profile = False
+  batcher = None
+  stager = None
+# class _ParallelLoopContext
+
+
+def _eventLoopWorker(shard):
+  """Processes the range `shard`; runs in a worker process."""
+  import time
+  context = _ParallelLoopContext
+  start = time.perf_counter()
+  profiler = EventLoopProfiler() if context.profile else None
+  with profiling(profiler), staging(context.stager):
+    nErrors, nProcessedEvents = context.runShard(*shard, profiler=profiler)
+    if context.batcher and context.batcher.flush() is False: nErrors += 1
+  result = context.collect() if context.collect else None
+  busy = ( os.getpid(), time.perf_counter() - start )
+  return nErrors, nProcessedEvents, result, profiler, busy
+# _eventLoopWorker()
+
+
+class WorkerUtilization:
+  """
+  Statistics of the use of the worker processes of a parallel event loop.
+  
+  For each worker process, the number of shards (or chunks) and of events it
+  processed and the time it spent on them are recorded. The utilization of a
+  worker is the fraction of the duration of the loop it spent processing:
+  a low utilization of some of the workers means that they were left idle
+  waiting for the others, and that smaller chunks would balance the load
+  better (at the cost of more overhead, e.g. for reopening files).
+  """
+  def __init__(self):
+    self.workers = {} # process ID -> [ shards, events, busy time [s] ]
+    self.duration = 0.0
+    self.startTime = None
+  # __init__()
+  
+  def start(self):
+    import time
+    self.startTime = time.perf_counter()
+  
+  def stop(self):
+    import time
+    self.duration += time.perf_counter() - self.startTime
+  
+  def record(self, pid, nEvents, busy):
+    stats = self.workers.setdefault(pid, [ 0, 0, 0.0 ])
+    stats[0] += 1
+    stats[1] += nEvents
+    stats[2] += busy
+  # record()
+  
+  def report(self) -> "a dictionary with the statistics":
+    workers = {
+      pid: {
+        'shards': nShards, 'events': nEvents, 'busy': busy,
+        'utilization': busy / self.duration if self.duration > 0.0 else 0.0,
+      }
+      for pid, ( nShards, nEvents, busy ) in self.workers.items()
+      }
+    return {
+      'duration': self.duration,
+      'workers': workers,
+      'utilization': (
+        sum(stats['utilization'] for stats in workers.values()) / len(workers)
+        if workers else 0.0
+        ),
+      }
+  # report()
+  
+  def summary(self) -> "a string with a table of the statistics":
+    report = self.report()
+    lines = [ "%8s  %6s  %8s  %8s  %11s"
+      % ( 'worker', 'shards', 'events', 'busy [s]', 'utilization' ) ]
+    for pid, stats in sorted(report['workers'].items()):
+      lines.append("%8d  %6d  %8d  %8.3f  %10.1f%%" % (
+        pid, stats['shards'], stats['events'], stats['busy'],
+        stats['utilization'] * 100.0,
+        ))
+    # for
+    lines.append("%d workers over %.3f s, mean utilization %.1f%%" % (
+      len(report['workers']), report['duration'], report['utilization'] * 100.0
+      ))
+    return "\n".join(lines)
+  # summary()
+  
+# class WorkerUtilization
+
+
+def parallelEventLoop(inputFiles,
+ process,
+ options = {},
+ ):
+  """
+  Applies the `process` function to all the events from the specified input
+  files, splitting them among `options['nWorkers']` processes.
+  
+  The events selected by `nSkip` and `nEvents` options (which have the same
+  global meaning as in `eventLoop()`) are split in contiguous shards of about
+  the same size, each processed by a worker process with its own
+  `gallery::Event`. The index of the event passed to `process` is the global
+  one. To split the sample, the number of events in each file is read first
+  (via `countEvents()`). The `progress` option reports completed shards.
+  If an event selection is requested (`select` option), it is the list of
+  selected events that is split instead.
+  
+  With the `chunkSize` option, the events of each file are split instead in
+  chunks of up to that size, and each worker pulls the next chunk as soon as
+  it is done with the previous one, so that files of very different size do
+  not leave workers idle at the end of the job; the `collect` callable is
+  then called at the end of each chunk. The utilization of each worker is
+  reported at the end (see `WorkerUtilization`).
+  
+  The workers are created by forking this process, so `process` and the
+  other callables do not need to be picklable, but any change they make to
+  the state of the program is lost unless returned by the `collect` option
+  callable: the value it returns in each worker is shipped back and passed to
+  the `reduce` option callable, which can merge it into the accumulators of
+  this process.
+  
+  The total error counter is returned at the end of the execution.
+  """
+  import multiprocessing
+  
+  if options.get('checkpoint', None):
+    raise RuntimeError("Checkpointing is not supported in parallel event loops.")
+  
+  nWorkers = options.get('nWorkers', multiprocessing.cpu_count())
+  nSkip = options.get('nSkip', 0)
+  nEvents = options.get('nEvents', None)
+  reduce = options.get('reduce', None)
+  chunkSize = options.get('chunkSize', None)
+  batcher = _makeBatcher(process, options)
+  if batcher: process = batcher
+  
+  if _selectionOption(options) is None:
+    files = list(map(str, _makeFileVector(inputFiles)))
+    offsets = _fileEventOffsets(countEvents(files, nWorkers=nWorkers))
+    nPlanned = offsets[-1]
+    boundaries = offsets
+    runShard = lambda begin, end, profiler: _runEventRange(
+      files, offsets, process, begin, end, profiler=profiler,
+      stager=_ParallelLoopContext.stager,
+      )
+  else:
+    files, positions = _selectedPositions(inputFiles, options)
+    nPlanned = len(positions)
+    boundaries = _positionBoundaries(positions)
+    runShard = lambda begin, end, profiler: _entryListEventLoop(
+      files, process, positions[begin:end], iFirstEvent=begin,
+      profiler=profiler, stager=_ParallelLoopContext.stager,
+      )
+  # if ... else
+  
+  begin = min(nSkip, nPlanned)
+  end = nPlanned if nEvents is None else min(begin + nEvents, nPlanned)
+  if end <= begin: shards = []
+  elif chunkSize: shards = _chunkEventRange(begin, end, boundaries, chunkSize)
+  else: shards = _splitEventRange(begin, end, nWorkers)
+  
+  progressInterval = options.get('progress', None)
+  progress = None if progressInterval is None \
+    else ProgressReporter(end - begin, interval=progressInterval)
+  
+  profiler = _makeProfiler(options)
+  workerStats = options.get('workerStats', None)
+  utilization = workerStats if isinstance(workerStats, WorkerUtilization) \
+    else WorkerUtilization()
+  
+  _ParallelLoopContext.runShard = runShard
+  _ParallelLoopContext.collect = options.get('collect', None)
+  _ParallelLoopContext.profile = profiler is not None
+  _ParallelLoopContext.batcher = batcher
+  _ParallelLoopContext.stager = _makeStager(options)
+  
+  nErrors = 0
+  nProcessedEvents = 0
+  try:
+    utilization.start()
+    nProcesses = max(1, min(nWorkers, len(shards)))
+    with multiprocessing.get_context('fork').Pool(nProcesses) as pool:
+      for shardErrors, shardEvents, result, shardProfiler, ( pid, busy ) \
+       in pool.imap(_eventLoopWorker, shards):
+        nErrors += shardErrors
+        nProcessedEvents += shardEvents
+        utilization.record(pid, shardEvents, busy)
+        if profiler: profiler.merge(shardProfiler)
+        if reduce: reduce(result)
+        if progress: progress.update(nProcessedEvents)
+      # for
+    # with
+    utilization.stop()
+    if progress: progress.finish()
+  finally:
+    _ParallelLoopContext.runShard = None
+    _ParallelLoopContext.collect = None
+    _ParallelLoopContext.profile = False
+    _ParallelLoopContext.batcher = None
+    _ParallelLoopContext.stager = None
+  # try ... finally
+  if profiler: _reportProfile(profiler, options)
+  if workerStats or chunkSize: print(utilization.summary())
+  
   if nErrors > 0:
     print("Encountered %d/%d errors." % (nErrors, nProcessedEvents),file=sys.stderr)
   return nErrors
-# eventLoop()
-
+# parallelEventLoop()
 
 
 # this does not really work...
 # ROOT.gallery.Event.__iter__ = lambda self: EventIterator(self)
 
 
+################################################################################
+### event pipelines
+###
+class PipelineEvent:
+  """
+  An event flowing through a `Pipeline`, with its data products.
+  
+  The data products declared in the pipeline are available by name
+  (`item["hits"]`), and they are read only when first accessed.
+  Other attributes are forwarded to the `gallery::Event` (`item.eventAuxiliary()`),
+  which is valid only until the event loop moves to the next event:
+  `detach()` makes the item independent of it. Items reaching the end of a
+  pipeline without `reduce()` stage are detached.
+  """
+  _OwnAttributes = ( 'event', 'iEvent', 'productGetters', 'productCache', )
+  
+  def __init__(self, event, iEvent, products):
+    self.event = event
+    self.iEvent = iEvent
+    self.productGetters = products
+    self.productCache = {}
+  # __init__()
+  
+  def __getitem__(self, name):
+    try: return self.productCache[name]
+    except KeyError: pass
+    return self.productCache.setdefault(name, self.productGetters[name](self.event))
+  # __getitem__()
+  
+  def __contains__(self, name): return name in self.productGetters
+  
+  def __getattr__(self, name):
+    # protect against lookups on an object not initialized yet (e.g. unpickling)
+    if name.startswith('__') or name in PipelineEvent._OwnAttributes:
+      raise AttributeError(name)
+    return getattr(self.event, name)
+  # __getattr__()
+  
+  def detach(self) -> "this object":
+    """Reads all columnar products and the event ID, and forgets the event.
+    
+    Products declared without fields can't be copied and are not available
+    any more after this call. Detaching an item again has no effect.
+    """
+    if self.event is None: return self
+    for name, getter in self.productGetters.items():
+      if getter.fields is not None: self[name]
+    self.eventID = _eventIDkey(self.event.eventAuxiliary().id())
+    self.productGetters = {}
+    self.event = None
+    return self
+  # detach()
+  
+# class PipelineEvent
+
+
+class _ProductGetter:
+  """Reads a data product from an event (as NumPy array if `fields` are set)."""
+  def __init__(self, klass, tag, fields):
+    self.klass = klass
+    self.tag = tag
+    self.fields = None if fields is None else list(fields)
+  def __call__(self, event):
+    handle = make_getValidHandle(self.klass, event)(self.tag)
+    if self.fields is None: return handle.product()
+    return toArrays(handle, self.fields, klass=self.klass)
+  # __call__()
+# class _ProductGetter
+
+
+class Pipeline:
+  """
+  A chain of processing stages applied to each event of an event loop.
+  
+  Stages are added by chaining calls:
+  - `products(klass, tag, fields=None, name=None)` declares a data product,
+    available by `name` (default: the input tag) from the `PipelineEvent`
+    items; it is read only when a stage accesses it; if `fields` are
+    specified, the product is converted with `toArrays()`
+  - `select(pred)` passes on only the items for which `pred(item)` is true
+  - `map(fn)` passes on `fn(item)` instead of `item`
+  - `batch(n)` passes on lists of `n` items (the last one may be shorter);
+    `PipelineEvent` items are detached (see `PipelineEvent.detach()`), as
+    are the items returned by `run()` when there is no `reduce()` stage
+  - `reduce(acc, initial, combine=None)` accumulates the items with
+    `state = acc(state, item)`, starting from a copy of `initial`;
+    `combine(state1, state2)` merges the states of different workers
+    and is required in parallel mode; it must be the last stage
+  
+  The stages are fused into a single event processing function, so that
+  each event is visited once. `run()` executes the pipeline via `eventLoop()`
+  and returns the accumulated state, or the list of the items reaching the
+  end of the pipeline if there is no `reduce()` stage.
+  
+  Example:
+      
+      nHits = Pipeline() \
+        .products("std::vector<recob::Hit>", "gaushit", name="hits") \
+        .select(lambda item: item.eventAuxiliary().isRealData()) \
+        .map(lambda item: item["hits"].size()) \
+        .reduce(lambda total, n: total + n, 0, combine=lambda a, b: a + b) \
+        .run(inputFiles, options={ 'nWorkers': 4 })
+      
+  With the `batchSize` option of `eventLoop()`, the items entering the
+  pipeline are `EventBatch` objects; all products must then have `fields`.
+  With the `nWorkers` option, each worker runs its own copy of the pipeline
+  (`batch()` stages don't cross shard boundaries), and the results are merged.
+  """
+  def __init__(self):
+    self.productList = {} # name -> _ProductGetter
+    self.stages = [] # ( kind, arguments )
+  
+  def products(self, klass, tag, fields = None, name = None):
+    if any(kind in ( 'map', 'batch' ) for kind, _ in self.stages):
+      raise RuntimeError("Pipeline products must be declared before map() and batch() stages.")
+    if name is None: name = _inputTagString(tag)
+    self.productList[name] = _ProductGetter(klass, tag, fields)
+    return self
+  # products()
+  
+  def select(self, pred): return self._addStage('select', pred)
+  
+  def map(self, fn): return self._addStage('map', fn)
+  
+  def batch(self, n): return self._addStage('batch', n)
+  
+  def reduce(self, acc, initial = None, combine = None):
+    return self._addStage('reduce', acc, initial, combine)
+  
+  def run(self,
+   inputFiles: "list of input files, as supported by `eventLoop()`",
+   options: "options for `eventLoop()`" = {},
+   ) -> "the accumulated state, or the list of the output items":
+    """Runs the pipeline on the events from `inputFiles`."""
+    import copy, functools
+    options = dict(options)
+    batchMode = bool(options.get('batchSize', None))
+    if batchMode:
+      if any(getter.fields is None for getter in self.productList.values()):
+        raise RuntimeError("Pipeline products need fields in batch mode.")
+      options['products'] = {
+        name: ( getter.klass, getter.tag, getter.fields )
+        for name, getter in self.productList.items()
+        }
+    # if batch mode
+    
+    runner = _PipelineRun(self, batchMode)
+    if options.get('checkpoint', None):
+      if runner.flushers:
+        raise RuntimeError("Checkpointing is not supported in pipelines with batch() stages.")
+      options['saveState'] = lambda: runner.state
+      options['restoreState'] = runner.setState
+    # if
+    
+    nWorkers = options.get('nWorkers', 1)
+    if nWorkers is None or nWorkers <= 1:
+      eventLoop(inputFiles, runner, options)
+      runner.flush()
+      return runner.state
+    # if sequential
+    
+    reduceStage = self._reduceStage()
+    if reduceStage and reduceStage[3] is None:
+      raise RuntimeError("Pipeline reduce() needs a combine function in parallel mode.")
+    def collect():
+      runner.flush()
+      return runner.takeState()
+    # collect()
+    partials = []
+    options['collect'] = collect
+    options['reduce'] = partials.append
+    eventLoop(inputFiles, runner, options)
+    if reduceStage is None: return sum(partials, [])
+    if not partials: return copy.deepcopy(reduceStage[2])
+    return functools.reduce(reduceStage[3], partials)
+  # run()
+  
+  def _addStage(self, kind, *args):
+    if self._reduceStage():
+      raise RuntimeError("No pipeline stage can follow reduce().")
+    self.stages.append(( kind, args ))
+    return self
+  # _addStage()
+  
+  def _reduceStage(self):
+    return next((
+      ( kind, ) + args for kind, args in self.stages if kind == 'reduce'
+      ), None)
+  # _reduceStage()
+  
+# class Pipeline
+
+
+class _PipelineRun:
+  """The fused stages of a `Pipeline`, acting as event processing function."""
+  def __init__(self, pipeline, batchMode):
+    import copy
+    self.batchMode = batchMode
+    self.products = pipeline.productList
+    self.flushers = []
+    reduceStage = pipeline._reduceStage()
+    self.initialState = [] if reduceStage is None else reduceStage[2]
+    self.state = copy.deepcopy(self.initialState)
+    push = self._store if reduceStage is None else None
+    for kind, args in reversed(pipeline.stages):
+      push = getattr(self, '_' + kind)(push, *args)
+    self.flushers.reverse() # upstream batches are flushed first
+    self.push = push
+  # __init__()
+  
+  def __call__(self, event, iEvent):
+    self.push(event if self.batchMode
+      else PipelineEvent(event, iEvent, self.products))
+  # __call__()
+  
+  def flush(self):
+    for flush in self.flushers: flush()
+  
+  def _store(self, item):
+    # the gallery event is going to move on: output items can't refer to it
+    self.state.append(item.detach() if isinstance(item, PipelineEvent) else item)
+  # _store()
+  
+  def setState(self, state): self.state = state
+  
+  def takeState(self):
+    """Returns the current state, and starts over from the initial one."""
+    import copy
+    state = self.state
+    self.state = copy.deepcopy(self.initialState)
+    return state
+  # takeState()
+  
+  def _select(self, push, pred):
+    def select(item):
+      if pred(item): push(item)
+    return select
+  # _select()
+  
+  def _map(self, push, fn): return lambda item: push(fn(item))
+  
+  def _batch(self, push, n):
+    buffer = []
+    def flush():
+      if not buffer: return
+      items = buffer[:]
+      del buffer[:]
+      push(items)
+    # flush()
+    def batch(item):
+      buffer.append(item.detach() if isinstance(item, PipelineEvent) else item)
+      if len(buffer) >= n: flush()
+    # batch()
+    self.flushers.append(flush)
+    return batch
+  # _batch()
+  
+  def _reduce(self, push, acc, initial, combine):
+    def reduce(item): self.state = acc(self.state, item)
+    return reduce
+  # _reduce()
+  
+# class _PipelineRun
+
+
+################################################################################
+### event index
+###
+def _fileSignature(path: "path of the file") -> "(size, mtime), or None":
+  """Returns size and modification time of `path`, `None` if not a local file."""
+  try: stat = os.stat(path)
+  except OSError: return None
+  return ( stat.st_size, stat.st_mtime_ns )
+# _fileSignature()
+
+
+def _atomicWrite(path, write):
+  """Calls `write(outFile)` and moves the result into `path` once complete."""
+  import tempfile
+  outDir = os.path.dirname(os.path.abspath(path))
+  os.makedirs(outDir, exist_ok=True)
+  fd, tempPath = tempfile.mkstemp(dir=outDir, suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as outFile: write(outFile)
+    os.replace(tempPath, path)
+  except BaseException:
+    os.unlink(tempPath)
+    raise
+  # try ... except
+# _atomicWrite()
+
+
+def _atomicPickleDump(obj, path):
+  """Pickles `obj` into `path`, replacing the file only once fully written."""
+  import pickle
+  _atomicWrite(path,
+    lambda outFile: pickle.dump(obj, outFile, protocol=pickle.HIGHEST_PROTOCOL)
+    )
+# _atomicPickleDump()
+
+
+def _loadPickle(path, default = None):
+  """Returns the object pickled in `path`, or `default` if it can't be read."""
+  import pickle, logging
+  try:
+    with open(path, 'rb') as inFile: return pickle.load(inFile)
+  except FileNotFoundError: pass
+  except Exception as e:
+    logging.warning("Can't read cache file '%s' (%s): ignored.", path, e)
+  return default
+# _loadPickle()
+
+
+def _eventIDkey(eventID):
+  """Returns `(run, subrun, event)` out of an `art::EventID` or a sequence."""
+  try: return ( eventID.run(), eventID.subRun(), eventID.event() )
+  except AttributeError: return tuple(eventID)
+# _eventIDkey()
+
+
+class EventIndex:
+  """
+  Index of the position of each event in a list of input files.
+  
+  The index maps each event ID `(run, subrun, event)` into its position
+  `(file index, entry)` in the input files, so that events can be loaded
+  directly with `forEachEntry()` (or `gallery::Event::goToEntry()`).
+  
+  The index is built by reading the event ID (from `eventAuxiliary()`) of all
+  the events in the input files, which is done once: the index of each file is
+  then saved into its own record file in the index directory (by default, in
+  the cache area), and when an index is requested again for a list including
+  any of the same files, the stored record of that file is reused as long as
+  the size and modification time of the file are unchanged. Records are
+  identified by the absolute path of the file. Files that can't be checked
+  that way (e.g. remote ones) are always scanned.
+  Besides the ID, the time stamp and the real data flag of each event are also
+  stored, so that an event selection can be resolved via `select()` without
+  opening any input file.
+  
+  Example:
+      
+      index = galleryUtils.EventIndex("sample.list")
+      for event in galleryUtils.forEachEntry
+       (index.files, index.positions([ ( 1, 5, 231 ), ( 1, 7, 1004 ) ])):
+        ...
+      
+  """
+  IndexVersion = 3
+  
+  def __init__(self,
+   inputFiles: "input files, as supported by `eventLoop()`",
+   indexDir: "directory of the index records (default: in the cache area)" = None,
+   ):
+    self.files = list(map(str, _makeFileVector(inputFiles)))
+    self.indexDir = indexDir if indexDir else cacheDirectory('eventindex')
+    self.fileEvents = [] # event ID keys in each file, in entry order
+    self.fileAuxiliary = [] # (time stamp, real data flag) in each file
+    self.eventPositions = {}
+    self.build()
+  # __init__()
+  
+  def build(self):
+    """Fills the index, reusing the stored records where possible."""
+    import logging
+    self.fileEvents = []
+    self.fileAuxiliary = []
+    for path in self.files:
+      fullPath = os.path.abspath(path)
+      signature = _fileSignature(fullPath)
+      record = None if signature is None else self.loadRecord(fullPath, signature)
+      if record is None:
+        logging.debug("Indexing events in '%s'", path)
+        record = self.scanFile(path)
+        if signature is not None: self.saveRecord(fullPath, signature, record)
+      # if
+      self.fileEvents.append(record[0])
+      self.fileAuxiliary.append(record[1])
+    # for
+    
+    self.eventPositions = {}
+    for iFile, eventKeys in enumerate(self.fileEvents):
+      for entry, eventKey in enumerate(eventKeys):
+        if self.eventPositions.setdefault(eventKey, ( iFile, entry )) \
+         != ( iFile, entry ):
+          logging.warning("Event R:%d S:%d E:%d appears more than once"
+            " (first occurrence used).", *eventKey)
+        # if
+      # for entries
+    # for files
+  # build()
+  
+  def recordPath(self, fullPath: "absolute path of the input file") -> "path of its record":
+    import hashlib
+    return os.path.join(self.indexDir,
+      hashlib.sha1(fullPath.encode('utf-8')).hexdigest()[:20] + '.pickle')
+  # recordPath()
+  
+  def loadRecord(self, fullPath, signature) -> "stored record, `None` if not valid":
+    stored = _loadPickle(self.recordPath(fullPath), default={})
+    if stored.get('version', None) != EventIndex.IndexVersion: return None
+    if stored.get('path', None) != fullPath: return None # hash collision
+    if stored.get('signature', None) != signature: return None
+    return stored['record']
+  # loadRecord()
+  
+  def saveRecord(self, fullPath, signature, record):
+    _atomicPickleDump({
+        'version': EventIndex.IndexVersion,
+        'path': fullPath,
+        'signature': signature,
+        'record': record,
+      },
+      self.recordPath(fullPath)
+      )
+  # saveRecord()
+  
+  @staticmethod
+  def scanFile(path: "path of the input file") \
+   -> "lists of event ID keys and of (time stamp, real data flag)":
+    """Returns the `(run, subrun, event)` and more of all events in the file."""
+    eventKeys = []
+    auxInfo = []
+    for event in forEach(ROOT.gallery.Event(_makeFileVector([ path ]))):
+      aux = event.eventAuxiliary()
+      eventKeys.append(_eventIDkey(aux.id()))
+      auxInfo.append(( aux.time().value(), bool(aux.isRealData()) ))
+    # for
+    return eventKeys, auxInfo
+  # scanFile()
+  
+  def position(self, eventID) -> "`(file index, entry)` or `None`":
+    """Returns the position of the event with the specified ID."""
+    return self.eventPositions.get(_eventIDkey(eventID), None)
+  
+  def positions(self,
+   eventIDs: "IDs of the events to locate",
+   sort: "whether to sort the positions in storage order" = True,
+   ) -> "list of `(file index, entry)` of the events found":
+    """Returns the positions of the specified events.
+    
+    Events which are not in the index are skipped, with a warning.
+    """
+    import logging
+    positions = []
+    nMissing = 0
+    for eventID in eventIDs:
+      position = self.position(eventID)
+      if position is None:
+        logging.debug("Event %s not found.", eventID)
+        nMissing += 1
+      else: positions.append(position)
+    # for
+    if nMissing > 0:
+      logging.warning("%d/%d requested events not found in the input files.",
+        nMissing, nMissing + len(positions))
+    # if
+    if sort: positions.sort()
+    return positions
+  # positions()
+  
+  def select(self,
+   selection: "event IDs, run ranges or predicate on `EventAuxiliary`",
+   ) -> "sorted list of `(file index, entry)` of the selected events":
+    """Returns the positions of the selected events.
+    
+    The `selection` may be:
+    * a callable: it is called for each event with an `EventAuxiliaryRecord`
+      (which supports `id()`, `run()`, `subRun()`, `event()`, `time()` and
+      `isRealData()` like `art::EventAuxiliary`) and the event is selected if
+      the result is true;
+    * a `RunRange` object, or a string with run ranges (see
+      `RunRange.parse()`), or a list of `RunRange` objects: the events in any
+      of the ranges are selected;
+    * a list of event IDs (see `positions()`).
+    
+    No input file is opened in the process.
+    """
+    if callable(selection):
+      return [
+        ( iFile, entry )
+        for iFile, ( eventKeys, auxInfo )
+         in enumerate(zip(self.fileEvents, self.fileAuxiliary))
+        for entry, ( eventKey, ( timeValue, isRealData ) )
+         in enumerate(zip(eventKeys, auxInfo))
+        if selection(EventAuxiliaryRecord(eventKey, timeValue, isRealData))
+        ]
+    # if predicate
+    
+    if isinstance(selection, str): selection = RunRange.parse(selection)
+    elif isinstance(selection, RunRange): selection = [ selection ]
+    else: selection = list(selection)
+    
+    if not all(isinstance(runRange, RunRange) for runRange in selection):
+      return self.positions(selection)
+    
+    return [
+      ( iFile, entry )
+      for iFile, eventKeys in enumerate(self.fileEvents)
+      if eventKeys and any(
+        runRange.overlaps(min(eventKeys), max(eventKeys))
+        for runRange in selection
+        ) # skip files with no chance
+      for entry, eventKey in enumerate(eventKeys)
+      if any(eventKey in runRange for runRange in selection)
+      ]
+  # select()
+  
+  def nEventsInFile(self, iFile): return len(self.fileEvents[iFile])
+  
+  def __len__(self): return len(self.eventPositions)
+  
+  def __contains__(self, eventID): return self.position(eventID) is not None
+  
+  def __getitem__(self, eventID):
+    position = self.position(eventID)
+    if position is None: raise KeyError(_eventIDkey(eventID))
+    return position
+  # __getitem__()
+  
+# class EventIndex
+
+
+class EventAuxiliaryRecord:
+  """Event information stored in `EventIndex`, in `art::EventAuxiliary` style."""
+  __slots__ = [ 'eventKey', 'timeValue', 'isRealData_' ]
+  
+  def __init__(self, eventKey, timeValue, isRealData):
+    self.eventKey = eventKey
+    self.timeValue = timeValue
+    self.isRealData_ = isRealData
+  # __init__()
+  
+  def id(self): return ROOT.art.EventID(*self.eventKey)
+  def run(self): return self.eventKey[0]
+  def subRun(self): return self.eventKey[1]
+  def event(self): return self.eventKey[2]
+  def time(self): return ROOT.art.Timestamp(self.timeValue)
+  def isRealData(self): return self.isRealData_
+  
+  def __str__(self): return "R:%d S:%d E:%d" % self.eventKey
+  
+# class EventAuxiliaryRecord
+
+
+class RunRange:
+  """
+  An inclusive range of runs, or of subruns.
+  
+  The range goes from `(firstRun, firstSubRun)` to `(lastRun, lastSubRun)`,
+  both included. A `None` subrun means no limit within the run, a `None`
+  run means no limit at all.
+  """
+  __slots__ = [ 'first', 'last' ]
+  
+  def __init__(self, firstRun = None, firstSubRun = None,
+   lastRun = None, lastSubRun = None,
+   ):
+    self.first = ( firstRun, firstSubRun )
+    self.last = ( lastRun, lastSubRun )
+  # __init__()
+  
+  def afterStart(self, eventKey):
+    """Returns whether the event is not before the start of the range."""
+    firstRun, firstSubRun = self.first
+    if firstRun is None or eventKey[0] > firstRun: return True
+    if eventKey[0] < firstRun: return False
+    return firstSubRun is None or eventKey[1] >= firstSubRun
+  # afterStart()
+  
+  def beforeEnd(self, eventKey):
+    """Returns whether the event is not after the end of the range."""
+    lastRun, lastSubRun = self.last
+    if lastRun is None or eventKey[0] < lastRun: return True
+    if eventKey[0] > lastRun: return False
+    return lastSubRun is None or eventKey[1] <= lastSubRun
+  # beforeEnd()
+  
+  def __contains__(self, eventKey):
+    eventKey = _eventIDkey(eventKey)
+    return self.afterStart(eventKey) and self.beforeEnd(eventKey)
+  
+  def overlaps(self, firstKey, lastKey):
+    """Returns whether any event between `firstKey` and `lastKey` may be in range."""
+    return self.beforeEnd(firstKey) and self.afterStart(lastKey)
+  
+  def __str__(self):
+    def boundary(run, subRun):
+      if run is None: return ""
+      return str(run) if subRun is None else "%d:%d" % (run, subRun)
+    first, last = boundary(*self.first), boundary(*self.last)
+    return first if first == last else first + "-" + last
+  # __str__()
+  
+  @staticmethod
+  def parse(spec: "run range specification string") -> "list of `RunRange`":
+    """Parses a comma-separated list of run ranges.
+    
+    Each range is in the form `R[:S][-R[:S]]`, e.g. `"5000-5010,5012:3-5012:8"`;
+    a single boundary (e.g. `"5012"`) selects just that run (or subrun), while
+    the start or the end of a range may be omitted to leave it unbounded
+    (e.g. `"5012-"`).
+    """
+    def parseBoundary(s):
+      if not s.strip(): return None, None
+      run, sep, subRun = s.partition(':')
+      return int(run), (int(subRun) if sep else None)
+    # parseBoundary()
+    
+    runRanges = []
+    for rangeSpec in spec.split(','):
+      if not rangeSpec.strip(): continue
+      first, sep, last = rangeSpec.partition('-')
+      if not sep: last = first
+      try:
+        runRanges.append(RunRange(*parseBoundary(first), *parseBoundary(last)))
+      except ValueError:
+        raise RuntimeError("Invalid run range specification: '{}'".format(rangeSpec))
+    # for
+    return runRanges
+  # parse()
+  
+# class RunRange
+
+
+################################################################################
+### columnar export of data products
+###
+_ColumnHelperCode = """
+#include <type_traits>
+#include <utility> // std::declval()
+#include <cstddef> // offsetof()
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace galleryUtils_details {
+  
+  template <typename T, typename = void>
+  struct Column { using type = std::decay_t<T>; };
+  
+  template <typename T>
+  struct Column<T, std::enable_if_t<std::is_enum_v<std::decay_t<T>>>>
+    { using type = std::underlying_type_t<std::decay_t<T>>; };
+  
+  /// Type used to store a value of type `T` in a NumPy column.
+  template <typename T>
+  using column_t = typename Column<T>::type;
+  
+  /// NumPy type kind of the type `T`.
+  template <typename T>
+  constexpr char columnKind() {
+    static_assert(std::is_arithmetic_v<T>,
+      "Only arithmetic and enumeration types can be stored in columns.");
+    if constexpr (std::is_same_v<T, bool>) return '?';
+    else if constexpr (std::is_floating_point_v<T>) return 'f';
+    else if constexpr (std::is_signed_v<T>) return 'i';
+    else return 'u';
+  } // columnKind()
+  
+} // namespace galleryUtils_details
+"""
+
+
+class ProductArrayConverter:
+  """
+  Copies selected fields of a collection data product into a NumPy array.
+  
+  The collection (e.g. a `std::vector<recob::Hit>`) is converted into a
+  structured NumPy array with one record per element, and one field per
+  requested quantity. Each field is specified either by the name of a method
+  of the element class taking no argument (e.g. `"PeakTime"`), or by a pair
+  `(name, expression)` where `expression` is a C++ expression of the element
+  `obj` (e.g. `("startX", "obj.Vx(0)")`). The values must be of arithmetic or
+  enumeration type.
+  
+  The copy is performed by a C++ function compiled on construction, which
+  fills the memory of the NumPy array directly in a single call. Conversion
+  objects are best obtained via `toArrays()`, which reuses them.
+  """
+  NConverters = 0
+  HelpersDeclared = False
+  
+  def __init__(self,
+   klass: "C++ name of the collection class (e.g. `std::vector<recob::Hit>`)",
+   fields: "list of method names or `(name, C++ expression)` pairs",
+   ):
+    import numpy
+    self.klass = klass
+    self.fields = [
+      ( field, "obj.%s()" % field ) if isinstance(field, str) else tuple(field)
+      for field in fields
+      ]
+    self.namespace = "galleryUtils_columns_%d" % ProductArrayConverter.NConverters
+    ProductArrayConverter.NConverters += 1
+    
+    if not ProductArrayConverter.HelpersDeclared:
+      ProductArrayConverter.HelpersDeclared \
+        = ROOT.gInterpreter.Declare(_ColumnHelperCode)
+    # if
+    if not ROOT.gInterpreter.Declare(self._kernelCode()):
+      raise RuntimeError("Failed to compile the conversion of {} fields {}"
+        .format(klass, ", ".join(name for name, _ in self.fields)))
+    # if
+    kernel = getattr(ROOT, self.namespace)
+    self._fill = kernel.fill
+    self.dtype = numpy.dtype({
+      'names': [ name for name, _ in self.fields ],
+      'formats': [
+        kind if kind == '?' else "%s%d" % (kind, size)
+        for kind, size in zip(str(kernel.kinds), kernel.sizes)
+        ],
+      'offsets': list(kernel.offsets),
+      'itemsize': kernel.recordSize,
+      })
+  # __init__()
+  
+  def _kernelCode(self):
+    getters = "\n".join(
+      "  inline auto get_{name}(Object_t const& obj) {{ return {expr}; }}"
+        .format(name=name, expr=expr)
+      for name, expr in self.fields
+      )
+    members = "\n".join(
+      "    galleryUtils_details::column_t"
+      "<decltype(get_{name}(std::declval<Object_t const&>()))> {name};"
+        .format(name=name)
+      for name, _ in self.fields
+      )
+    copies = "\n".join(
+      "      out->{name} = static_cast<decltype(out->{name})>(get_{name}(obj));"
+        .format(name=name)
+      for name, _ in self.fields
+      )
+    fieldList = lambda pattern: ", ".join(
+      pattern.format(name=name) for name, _ in self.fields
+      )
+    return f"""
+namespace {self.namespace} {{
+  using Collection_t = {self.klass};
+  using Object_t = Collection_t::value_type;
+  
+{getters}
+  
+  struct Record {{
+{members}
+  }};
+  
+  std::size_t fill(Collection_t const& coll, std::uintptr_t buffer) {{
+    Record* out = reinterpret_cast<Record*>(buffer);
+    for (Object_t const& obj: coll) {{
+{copies}
+      ++out;
+    }}
+    return coll.size();
+  }}
+  
+  std::size_t const recordSize = sizeof(Record);
+  std::vector<std::size_t> const offsets
+    {{ {fieldList("offsetof(Record, {name})")} }};
+  std::vector<std::size_t> const sizes
+    {{ {fieldList("sizeof(Record::{name})")} }};
+  std::string const kinds {{
+    {fieldList("galleryUtils_details::columnKind<decltype(Record::{name})>()")}
+  }};
+}} // namespace {self.namespace}
+"""
+  # _kernelCode()
+  
+  def __call__(self,
+   product: "the collection data product (or a handle to it)",
+   out: "(optional) NumPy array to be filled, with enough room" = None,
+   ) -> "a NumPy structured array with one record per collection element":
+    """Returns the values of the fields from all the elements of `product`.
+    
+    If `out` is specified, it is filled and the part of it with the data is
+    returned; it must have the `dtype` of this converter.
+    """
+    import numpy
+    if hasattr(product, 'product'): product = product.product()
+    n = product.size()
+    if out is None: out = numpy.empty(n, dtype=self.dtype)
+    elif out.dtype != self.dtype or len(out) < n or not out.flags.c_contiguous:
+      raise RuntimeError("Output array not suitable for {} records of {}"
+        .format(n, self.dtype))
+    self._fill(product, out.ctypes.data)
+    return out[:n]
+  # __call__()
+  
+# class ProductArrayConverter
+
+
+_ProductArrayConverters = {}
+
+def toArrays(
+ product: "the collection data product (or a handle to it)",
+ fields: "list of method names or `(name, C++ expression)` pairs",
+ klass: "C++ name of the collection class (default: from `product`)" = None,
+ out: "(optional) NumPy array to be filled" = None,
+ ) -> "a NumPy structured array with one record per collection element":
+  """Copies the specified fields of all elements of `product` into NumPy.
+  
+  The conversion code is compiled the first time a class and field list
+  combination is requested, and reused afterwards.
+  See `ProductArrayConverter` for the details.
+  
+  Example:
+      
+      getHits = make_getValidHandle("std::vector<recob::Hit>", event)
+      hits = toArrays(getHits(hitTag),
+        [ "Channel", "PeakTime", "Integral", ("plane", "obj.WireID().Plane") ])
+      goodHits = hits[hits["Integral"] > 50.0]
+      
+  """
+  if hasattr(product, 'product'): product = product.product()
+  if klass is None: klass = type(product).__cpp_name__
+  key = ( klass, tuple(f if isinstance(f, str) else tuple(f) for f in fields) )
+  try: converter = _ProductArrayConverters[key]
+  except KeyError:
+    converter = _ProductArrayConverters.setdefault \
+      (key, ProductArrayConverter(klass, fields))
+  # try ... except
+  return converter(product, out=out)
+# toArrays()
+
+
+################################################################################
+### memoization of per-event results
+###
+_FileContentHashes = {} # path -> ( signature, digest )
+
+def _fileContentHash(
+ path: "absolute path of the file",
+ signature: "file signature (see `_fileSignature()`)",
+ ) -> "SHA1 hex digest of the content":
+  """Returns the digest of `path`, reading the file only if `signature` changed."""
+  import hashlib
+  try:
+    cachedSignature, hexDigest = _FileContentHashes[path]
+    if cachedSignature == signature: return hexDigest
+  except KeyError: pass
+  digest = hashlib.sha1()
+  with open(path, 'rb') as inFile:
+    for block in iter(lambda: inFile.read(2**24), b''): digest.update(block)
+  hexDigest = digest.hexdigest()
+  _FileContentHashes[path] = ( signature, hexDigest )
+  return hexDigest
+# _fileContentHash()
+
+
+def _resultColumns(result):
+  """Returns a dictionary of named values out of a per-event result."""
+  if isinstance(result, dict): return result
+  if isinstance(result, (tuple, list)):
+    return { 'value%d' % i: value for i, value in enumerate(result) }
+  return { 'value': result }
+# _resultColumns()
+
+
+class EventMemo:
+  """
+  A function of the event with its results cached on disk, file by file.
+  
+  The results of `function(event)` on all the events of an input file are
+  stored in a compressed NumPy (`.npz`) file, one column per value plus the
+  `entry` of the event in the file. The cache file is identified by the path
+  of the input file, its size and modification time (or its content, if
+  `contentHash` is set), and the name and `version` of the function: the
+  version must be changed whenever the function changes its results.
+  Content digests are computed once per file size and modification time.
+  The total size of the cache directory can be capped with `maxSize` (bytes):
+  the least recently used files are then removed first.
+  
+  The function may return a number, a tuple of numbers (columns `value0`,
+  `value1`, ...) or a dictionary of numbers keyed by column name.
+  
+  `run()` returns the results for a list of input files, running the event
+  loop only on the files which are not cached yet: a rerun on cached files
+  does not open any of them. Calling the object just calls `function`.
+  
+  Example:
+      
+      @memoizeEvents(version=2, maxSize=2**30)
+      def nHits(event):
+        return getHits(event, hitTag).product().size()
+      
+      results = nHits.run(inputFiles, options={ 'nWorkers': 4 })
+      print(results['value'].mean())
+      
+  """
+  def __init__(self,
+   function: "function of the event returning the values to be cached",
+   version: "version of the function (part of the cache key)" = 0,
+   name: "name of the function in the cache key (default: qualified name)" = None,
+   cacheDir: "cache directory (default: in the cache area)" = None,
+   maxSize: "maximum size of the cache directory [bytes]" = None,
+   contentHash: "identify input files by content rather than size and time" = False,
+   ):
+    self.function = function
+    self.version = version
+    self.name = name if name else \
+      getattr(function, '__module__', '') + '.' + function.__qualname__
+    self.cacheDir = cacheDir if cacheDir else cacheDirectory('memo')
+    self.maxSize = maxSize
+    self.contentHash = contentHash
+    self.__doc__ = function.__doc__
+  # __init__()
+  
+  def __call__(self, event): return self.function(event)
+  
+  def cachePath(self, path: "path of the input file") -> "path of its cache file (None if not cacheable)":
+    import hashlib
+    path = os.path.abspath(path)
+    signature = _fileSignature(path)
+    if signature is None: return None
+    if self.contentHash: signature = _fileContentHash(path, signature)
+    key = repr(( path, signature, self.name, self.version ))
+    return os.path.join(self.cacheDir, "%s-v%s-%s.npz" % (
+      self.name.rsplit('.', 1)[-1], self.version,
+      hashlib.sha1(key.encode('utf-8')).hexdigest()[:20],
+      ))
+  # cachePath()
+  
+  def load(self, path: "path of the input file") -> "dictionary of columns, or `None`":
+    import numpy, logging
+    cachePath = self.cachePath(path)
+    if cachePath is None: return None
+    try:
+      with numpy.load(cachePath) as cached:
+        columns = { name: cached[name] for name in cached.files }
+    except FileNotFoundError: return None
+    except Exception as e:
+      logging.warning("Can't read cache file '%s' (%s): ignored.", cachePath, e)
+      return None
+    # try ... except
+    os.utime(cachePath) # mark as recently used
+    return columns
+  # load()
+  
+  def store(self, path: "path of the input file", columns: "dictionary of arrays"):
+    import numpy
+    cachePath = self.cachePath(path)
+    if cachePath is None: return
+    _atomicWrite(cachePath,
+      lambda outFile: numpy.savez_compressed(outFile, **columns))
+    self.evict()
+  # store()
+  
+  def evict(self):
+    """Removes the least recently used cache files exceeding `maxSize`."""
+    if self.maxSize is None: return
+    entries = []
+    for name in os.listdir(self.cacheDir):
+      if not name.endswith('.npz'): continue
+      try: stat = os.stat(os.path.join(self.cacheDir, name))
+      except FileNotFoundError: continue
+      entries.append(( stat.st_mtime, stat.st_size, name ))
+    # for
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in entries:
+      if total <= self.maxSize: break
+      try: os.unlink(os.path.join(self.cacheDir, name))
+      except FileNotFoundError: pass
+      total -= size
+    # for
+  # evict()
+  
+  def run(self,
+   inputFiles: "list of input files, as supported by `eventLoop()`",
+   options: "options for `eventLoop()` on the files not cached yet" = {},
+   ) -> "dictionary of arrays with one entry per event":
+    """Returns the results on all events of all `inputFiles`.
+    
+    The result has one array per column, and the `file` (index in the input
+    file list) and `entry` columns.
+    All the events of each file are processed (the options `nSkip`, `nEvents`
+    and event selections are not supported).
+    """
+    import numpy, bisect
+    for option in ( 'nSkip', 'nEvents', 'select', 'events', 'batchSize' ):
+      if options.get(option, None):
+        raise RuntimeError("Option '%s' is not supported by EventMemo." % option)
+    # for
+    
+    files = list(map(str, _makeFileVector(inputFiles)))
+    perFile = [ self.load(path) for path in files ]
+    missing = [ iFile for iFile, columns in enumerate(perFile) if columns is None ]
+    
+    if missing:
+      missingFiles = [ files[iFile] for iFile in missing ]
+      offsets = _fileEventOffsets(countEvents(missingFiles))
+      rows = []
+      def process(event, iEvent):
+        rows.append(( iEvent, _resultColumns(self.function(event)) ))
+      def collect():
+        collected = rows[:]
+        del rows[:]
+        return collected
+      # collect()
+      loopOptions = dict(options)
+      loopOptions['collect'] = collect
+      loopOptions['reduce'] = rows.extend
+      eventLoop(missingFiles, process, loopOptions)
+      rows.sort(key=lambda row: row[0])
+      
+      fileRows = [ [] for _ in missingFiles ]
+      for iEvent, values in rows:
+        iMissing = bisect.bisect_right(offsets, iEvent) - 1
+        fileRows[iMissing].append(( iEvent - offsets[iMissing], values ))
+      # for
+      for iFile, path, thisFileRows in zip(missing, missingFiles, fileRows):
+        columns = { 'entry': numpy.array(
+          [ entry for entry, _ in thisFileRows ], dtype=numpy.int64) }
+        for name in (thisFileRows[0][1] if thisFileRows else {}):
+          columns[name] = numpy.array(
+            [ values[name] for _, values in thisFileRows ])
+        # for
+        self.store(path, columns)
+        perFile[iFile] = columns
+      # for
+    # if missing
+    
+    results = {}
+    filled = [ ( iFile, columns ) for iFile, columns in enumerate(perFile)
+      if len(columns['entry']) > 0 ]
+    if not filled: return { 'file': numpy.zeros(0, dtype=numpy.int64),
+      'entry': numpy.zeros(0, dtype=numpy.int64) }
+    results['file'] = numpy.concatenate([
+      numpy.full(len(columns['entry']), iFile, dtype=numpy.int64)
+      for iFile, columns in filled
+      ])
+    for name in filled[0][1]:
+      results[name] = numpy.concatenate([ columns[name] for _, columns in filled ])
+    return results
+  # run()
+  
+# class EventMemo
+
+
+def memoizeEvents(
+ version: "version of the function (part of the cache key)" = 0,
+ **kwargs
+ ) -> "a decorator turning a function of the event into an `EventMemo`":
+  """Decorator caching per-event results on disk (see `EventMemo`)."""
+  return lambda function: EventMemo(function, version=version, **kwargs)
+# memoizeEvents()
+
+
 ################################################################################
 ### Infrastructure
 ################################################################################
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+#
+# Test of `galleryUtils.RunRange` and of `galleryUtils.EventIndex`, with the
+# scan of the input files replaced by a table of events.
+#
+# It does not need ROOT.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import galleryUtils
+from galleryUtils import RunRange
+
+
+class TableEventIndex(galleryUtils.EventIndex):
+  """`EventIndex` with the content of each input file taken from a table."""
+  Events = {} # file name -> list of ( ( run, subrun, event ), time, real data )
+
+  def __init__(self, files, indexDir):
+    # no `gallery::Event` file list: the file paths are used directly
+    self.files = list(files)
+    self.indexDir = indexDir
+    self.scanned = []
+    self.build()
+  # __init__()
+
+  def scanFile(self, path):
+    self.scanned.append(os.path.basename(path))
+    events = self.Events[os.path.basename(path)]
+    return (
+      [ eventKey for eventKey, _, _ in events ],
+      [ ( timeValue, isRealData ) for _, timeValue, isRealData in events ],
+      )
+  # scanFile()
+
+# class TableEventIndex
+
+
+class RunRangeTest(unittest.TestCase):
+
+  def test_parse(self):
+    ranges = RunRange.parse("5000-5010, 5012:3-5012:8,5020,6000-")
+    self.assertEqual(
+      [ ( runRange.first, runRange.last ) for runRange in ranges ],
+      [
+        ( ( 5000, None ), ( 5010, None ) ),
+        ( ( 5012, 3 ), ( 5012, 8 ) ),
+        ( ( 5020, None ), ( 5020, None ) ),
+        ( ( 6000, None ), ( None, None ) ),
+      ])
+    self.assertEqual(
+      list(map(str, ranges)), [ "5000-5010", "5012:3-5012:8", "5020", "6000-" ]
+      )
+    self.assertEqual(RunRange.parse(""), [])
+  # test_parse()
+
+  def test_invalid(self):
+    with self.assertRaises(RuntimeError): RunRange.parse("5000-abc")
+    with self.assertRaises(RuntimeError): RunRange.parse("5000:1:2")
+  # test_invalid()
+
+  def test_contains(self):
+    runRange, = RunRange.parse("5012:3-5014:2")
+    self.assertNotIn(( 5012, 2, 9 ), runRange)
+    self.assertIn(( 5012, 3, 1 ), runRange)
+    self.assertIn(( 5013, 0, 1 ), runRange)
+    self.assertIn(( 5014, 2, 1 ), runRange)
+    self.assertNotIn(( 5014, 3, 1 ), runRange)
+    openRange, = RunRange.parse("-5012")
+    self.assertIn(( 1, 1, 1 ), openRange)
+    self.assertIn(( 5012, 100, 1 ), openRange)
+    self.assertNotIn(( 5013, 0, 1 ), openRange)
+  # test_contains()
+
+  def test_overlaps(self):
+    runRange, = RunRange.parse("5012:3-5014:2")
+    self.assertTrue(runRange.overlaps(( 5010, 0, 0 ), ( 5012, 3, 0 )))
+    self.assertFalse(runRange.overlaps(( 5010, 0, 0 ), ( 5012, 2, 9 )))
+    self.assertFalse(runRange.overlaps(( 5014, 3, 0 ), ( 5020, 0, 0 )))
+  # test_overlaps()
+
+# class RunRangeTest
+
+
+class EventIndexTest(unittest.TestCase):
+
+  Events = {
+    'f0.root': [
+      ( ( 5000, 1, 1 ), 100, True ), ( ( 5000, 1, 2 ), 101, True ),
+      ( ( 5000, 2, 5 ), 102, False ),
+      ],
+    'f1.root': [],
+    'f2.root': [
+      ( ( 5012, 3, 7 ), 200, True ), ( ( 5012, 4, 8 ), 201, True ),
+      ( ( 5000, 1, 2 ), 202, True ), # duplicate
+      ],
+    }
+
+  def setUp(self):
+    self.baseDir = tempfile.mkdtemp(prefix='EventIndex_test_')
+    self.indexDir = os.path.join(self.baseDir, 'index')
+    self.files = []
+    for name in sorted(self.Events):
+      path = os.path.join(self.baseDir, name)
+      open(path, 'w').close()
+      self.files.append(path)
+    # for
+    TableEventIndex.Events = self.Events
+  # setUp()
+
+  def tearDown(self): shutil.rmtree(self.baseDir)
+
+  def makeIndex(self, files = None):
+    return TableEventIndex(self.files if files is None else files, self.indexDir)
+
+  def test_positions(self):
+    index = self.makeIndex()
+    self.assertEqual(len(index), 5)
+    self.assertEqual(index[( 5012, 4, 8 )], ( 2, 1 ))
+    self.assertEqual(index[( 5000, 1, 2 )], ( 0, 1 )) # first occurrence
+    self.assertNotIn(( 5000, 1, 3 ), index)
+    self.assertEqual(
+      index.positions([ ( 5012, 3, 7 ), ( 5000, 9, 9 ), ( 5000, 1, 1 ) ]),
+      [ ( 0, 0 ), ( 2, 0 ) ]
+      )
+    self.assertEqual(index.nEventsInFile(1), 0)
+  # test_positions()
+
+  def test_selectRunRanges(self):
+    index = self.makeIndex()
+    self.assertEqual(index.select("5000:2,5012:4-"), [ ( 0, 2 ), ( 2, 1 ) ])
+    self.assertEqual(
+      index.select(RunRange(5000, None, 5000)),
+      [ ( 0, 0 ), ( 0, 1 ), ( 0, 2 ), ( 2, 2 ) ]
+      )
+    self.assertEqual(index.select("6000"), [])
+  # test_selectRunRanges()
+
+  def test_selectPredicate(self):
+    index = self.makeIndex()
+    self.assertEqual(
+      index.select(lambda aux: not aux.isRealData() or aux.event() == 8),
+      [ ( 0, 2 ), ( 2, 1 ) ]
+      )
+  # test_selectPredicate()
+
+  def test_reuse(self):
+    first = self.makeIndex(self.files[:2])
+    self.assertEqual(first.scanned, [ 'f0.root', 'f1.root' ])
+    # a different list, with a relative path to a file already indexed
+    cwd = os.getcwd()
+    try:
+      os.chdir(self.baseDir)
+      second = self.makeIndex([ 'f0.root', self.files[2] ])
+    finally: os.chdir(cwd)
+    self.assertEqual(second.scanned, [ 'f2.root' ])
+    self.assertEqual(second[( 5012, 3, 7 )], ( 1, 0 ))
+    # a modified file is scanned again
+    stat = os.stat(self.files[0])
+    os.utime(self.files[0], ns=( stat.st_atime_ns, stat.st_mtime_ns + 10**9 ))
+    self.assertEqual(self.makeIndex().scanned, [ 'f0.root' ])
+  # test_reuse()
+
+# class EventIndexTest
+
+
+if __name__ == "__main__": unittest.main()
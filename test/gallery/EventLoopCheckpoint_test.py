@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Test of `galleryUtils.EventLoopCheckpoint` and of the checkpoint setup of
+# `galleryUtils.eventLoop()` options.
+#
+# It does not need ROOT.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import galleryUtils
+
+
+class EventID:
+  """Stand-in for `art::EventID`, with the default (address-based) `repr()`."""
+  def __init__(self, run, subRun, event):
+    self.run_, self.subRun_, self.event_ = run, subRun, event
+  def run(self): return self.run_
+  def subRun(self): return self.subRun_
+  def event(self): return self.event_
+# class EventID
+
+
+class EventLoopCheckpointTest(unittest.TestCase):
+
+  Files = [ 'f0.root', 'f1.root', 'f2.root' ]
+
+  def setUp(self):
+    self.baseDir = tempfile.mkdtemp(prefix='EventLoopCheckpoint_test_')
+    self.path = os.path.join(self.baseDir, 'checkpoint.pickle')
+  # setUp()
+
+  def tearDown(self): shutil.rmtree(self.baseDir)
+
+  def options(self, **options):
+    return dict(options, checkpoint=self.path)
+
+  def saveAndResume(self, saveOptions, resumeOptions):
+    """Writes a checkpoint with `saveOptions`, resumes it with `resumeOptions`."""
+    checkpoint, resumePoint = galleryUtils._setupCheckpoint \
+      (self.Files, self.options(**saveOptions))
+    self.assertIsNone(resumePoint)
+    checkpoint.update(1, 4, 9, nProcessed=8, nErrors=1)
+    checkpoint.write()
+    return galleryUtils._setupCheckpoint \
+      (self.Files, self.options(resume=True, **resumeOptions))
+  # saveAndResume()
+
+  def test_resumeEventIDselection(self):
+    makeEvents = lambda: [ EventID(1, 5, 231), EventID(1, 7, 1004) ]
+    checkpoint, resumePoint = self.saveAndResume \
+      ({ 'events': makeEvents() }, { 'events': makeEvents() })
+    self.assertEqual(
+      ( resumePoint['iFile'], resumePoint['entry'], resumePoint['iEvent'] ),
+      ( 1, 4, 9 )
+      )
+    self.assertEqual(checkpoint.baseProcessed, 8)
+    self.assertEqual(checkpoint.baseErrors, 1)
+  # test_resumeEventIDselection()
+
+  def test_resumeEquivalentSelections(self):
+    # event IDs as objects or as tuples, run ranges as objects or as text
+    self.saveAndResume(
+      { 'events': [ EventID(1, 5, 231) ] }, { 'events': [ ( 1, 5, 231 ) ] }
+      )
+    self.saveAndResume(
+      { 'select': galleryUtils.RunRange.parse('1:5-2') },
+      { 'select': galleryUtils.RunRange.parse('1:5-2') },
+      )
+  # test_resumeEquivalentSelections()
+
+  def test_differentSelection(self):
+    with self.assertRaises(RuntimeError):
+      self.saveAndResume(
+        { 'events': [ EventID(1, 5, 231) ] },
+        { 'events': [ EventID(1, 5, 232) ] },
+        )
+    # with
+  # test_differentSelection()
+
+  def test_longArraySelection(self):
+    # the text representation of long arrays is abbreviated
+    try: import numpy
+    except ImportError: self.skipTest("NumPy not available")
+    events = numpy.zeros((5000, 3), dtype=int)
+    events[:, 2] = numpy.arange(5000)
+    otherEvents = events.copy()
+    otherEvents[2500, 2] = -1
+    with self.assertRaises(RuntimeError):
+      self.saveAndResume({ 'events': events }, { 'events': otherEvents })
+  # test_longArraySelection()
+
+  def test_completed(self):
+    checkpoint, _ = galleryUtils._setupCheckpoint(self.Files, self.options())
+    checkpoint.update(2, 3, 11, nProcessed=12, nErrors=0)
+    self.assertEqual(checkpoint.finish(), ( 0, 12 ))
+    _, resumePoint = galleryUtils._setupCheckpoint \
+      (self.Files, self.options(resume=True))
+    self.assertTrue(resumePoint['completed'])
+    self.assertEqual(resumePoint['nProcessed'], 12)
+  # test_completed()
+
+# class EventLoopCheckpointTest
+
+
+if __name__ == "__main__": unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Test of the cache files of `galleryUtils.EventMemo`: their identification
+# and their eviction.
+#
+# It does not need ROOT (but it needs NumPy).
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import galleryUtils
+
+try: import numpy
+except ImportError: numpy = None
+
+
+def nHits(event): return 0
+
+
+@unittest.skipIf(numpy is None, "NumPy not available")
+class EventMemoTest(unittest.TestCase):
+
+  def setUp(self):
+    self.baseDir = tempfile.mkdtemp(prefix='EventMemo_test_')
+    self.cacheDir = os.path.join(self.baseDir, 'cache')
+    os.makedirs(self.cacheDir)
+    self.inputPath = self.writeInput('input.root', "events")
+  # setUp()
+
+  def tearDown(self): shutil.rmtree(self.baseDir)
+
+  def writeInput(self, name, content):
+    path = os.path.join(self.baseDir, name)
+    with open(path, 'w') as outFile: outFile.write(content)
+    return path
+  # writeInput()
+
+  def touch(self, path, shift):
+    stat = os.stat(path)
+    os.utime(path, ns=( stat.st_atime_ns, stat.st_mtime_ns + shift * 10**9 ))
+
+  def makeMemo(self, **kwargs):
+    return galleryUtils.EventMemo(nHits, cacheDir=self.cacheDir, **kwargs)
+
+  def test_cachePath(self):
+    memo = self.makeMemo(version=1)
+    cachePath = memo.cachePath(self.inputPath)
+    self.assertTrue(cachePath.startswith(self.cacheDir))
+    self.assertTrue(os.path.basename(cachePath).startswith('nHits-v1-'))
+    self.assertEqual(memo.cachePath(self.inputPath), cachePath)
+    cwd = os.getcwd()
+    try:
+      os.chdir(self.baseDir)
+      self.assertEqual(memo.cachePath('input.root'), cachePath)
+    finally: os.chdir(cwd)
+    # a different version or function name, or a modified file: another entry
+    self.assertNotEqual(self.makeMemo(version=2).cachePath(self.inputPath), cachePath)
+    self.assertNotEqual(
+      self.makeMemo(version=1, name='other').cachePath(self.inputPath), cachePath)
+    self.touch(self.inputPath, 1)
+    self.assertNotEqual(memo.cachePath(self.inputPath), cachePath)
+    # non-local files are not cached
+    self.assertIsNone(memo.cachePath('root://server//data/input.root'))
+  # test_cachePath()
+
+  def test_contentHash(self):
+    memo = self.makeMemo(contentHash=True)
+    cachePath = memo.cachePath(self.inputPath)
+    # only the content matters...
+    self.touch(self.inputPath, 1)
+    self.assertEqual(memo.cachePath(self.inputPath), cachePath)
+    # ... and the digest is recomputed only when the file changes
+    fullPath = os.path.abspath(self.inputPath)
+    signature, digest = galleryUtils._FileContentHashes[fullPath]
+    self.assertEqual(signature, galleryUtils._fileSignature(fullPath))
+    galleryUtils._FileContentHashes[fullPath] = ( signature, 'memoized' )
+    self.assertNotEqual(memo.cachePath(self.inputPath), cachePath)
+    galleryUtils._FileContentHashes[fullPath] = ( signature, digest )
+    self.writeInput('input.root', "other events")
+    self.assertNotEqual(memo.cachePath(self.inputPath), cachePath)
+  # test_contentHash()
+
+  def test_storeLoad(self):
+    memo = self.makeMemo()
+    self.assertIsNone(memo.load(self.inputPath))
+    columns = {
+      'entry': numpy.arange(4, dtype=numpy.int64),
+      'value': numpy.array([ 1.5, 2.5, 0.0, 4.0 ]),
+      }
+    memo.store(self.inputPath, columns)
+    loaded = memo.load(self.inputPath)
+    self.assertEqual(sorted(loaded), [ 'entry', 'value' ])
+    for name, values in columns.items():
+      self.assertTrue(numpy.array_equal(loaded[name], values))
+  # test_storeLoad()
+
+  def test_eviction(self):
+    columns = { 'entry': numpy.arange(1000, dtype=numpy.int64) }
+    inputs = [ self.writeInput('input%d.root' % i, str(i)) for i in range(4) ]
+    memo = self.makeMemo()
+    for path in inputs: memo.store(path, columns)
+    entrySize = os.path.getsize(memo.cachePath(inputs[0]))
+
+    # entries used in order, then the first one is used again (by loading it)
+    for i, path in enumerate(inputs):
+      os.utime(memo.cachePath(path), ( 1000 + i, 1000 + i ))
+    self.assertIsNotNone(memo.load(inputs[0]))
+
+    memo.maxSize = 2 * entrySize
+    memo.evict()
+    self.assertIsNotNone(memo.load(inputs[0]))
+    self.assertIsNotNone(memo.load(inputs[3])) # the next most recent
+    self.assertIsNone(memo.load(inputs[1]))
+    self.assertIsNone(memo.load(inputs[2]))
+  # test_eviction()
+
+# class EventMemoTest
+
+
+if __name__ == "__main__": unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#
+# Test of the splitting of the global event range of the parallel event loop
+# of `galleryUtils` in shards and chunks, and of the mapping of the ranges
+# back to files and entries.
+#
+# It does not need ROOT.
+#
+
+import unittest
+
+import galleryUtils
+
+
+class EventRangeTest(unittest.TestCase):
+
+  Counts = [ 5, 0, 7, 3, 10 ] # events in each file
+
+  def setUp(self):
+    self.offsets = galleryUtils._fileEventOffsets(self.Counts)
+
+  def assertPartition(self, ranges, begin, end):
+    """Checks that `ranges` are contiguous, non-empty and cover [begin, end[."""
+    self.assertEqual(ranges[0][0], begin)
+    self.assertEqual(ranges[-1][1], end)
+    for ( _, prevEnd ), ( nextBegin, _ ) in zip(ranges[:-1], ranges[1:]):
+      self.assertEqual(prevEnd, nextBegin)
+    for rangeBegin, rangeEnd in ranges: self.assertLess(rangeBegin, rangeEnd)
+  # assertPartition()
+
+  def test_offsets(self):
+    self.assertEqual(self.offsets, [ 0, 5, 5, 12, 15, 25 ])
+    self.assertEqual(galleryUtils._fileEventOffsets([]), [ 0 ])
+  # test_offsets()
+
+  def test_split(self):
+    shards = galleryUtils._splitEventRange(3, 25, 4)
+    self.assertPartition(shards, 3, 25)
+    self.assertEqual(len(shards), 4)
+    sizes = [ end - begin for begin, end in shards ]
+    self.assertLessEqual(max(sizes) - min(sizes), 1)
+    # more shards than events
+    self.assertEqual(galleryUtils._splitEventRange(7, 9, 5), [ ( 7, 8 ), ( 8, 9 ) ])
+  # test_split()
+
+  def test_chunks(self):
+    chunks = galleryUtils._chunkEventRange(3, 22, self.offsets, 4)
+    self.assertPartition(chunks, 3, 22)
+    self.assertEqual(chunks, [
+      ( 3, 5 ),                     # end of the first file
+      ( 5, 8 ), ( 8, 12 ),          # 7 events: 2 chunks (3 + 4)
+      ( 12, 15 ),                   # 3 events
+      ( 15, 18 ), ( 18, 22 ),       # 7 events of the last file (3 + 4)
+      ])
+    for begin, end in chunks:
+      self.assertLessEqual(end - begin, 4)
+      # no chunk crosses a file boundary
+      self.assertFalse(any(begin < offset < end for offset in self.offsets))
+    # for
+  # test_chunks()
+
+  def test_positionBoundaries(self):
+    positions = [ ( 0, 1 ), ( 0, 4 ), ( 2, 0 ), ( 4, 3 ), ( 4, 5 ) ]
+    self.assertEqual(galleryUtils._positionBoundaries(positions), [ 0, 2, 3, 5 ])
+  # test_positionBoundaries()
+
+  def test_runEventRange(self):
+    files = [ 'f%d.root' % i for i in range(len(self.Counts)) ]
+    calls = []
+    def sequentialEventLoop(files, process, nSkip, nEvents, iFirstEvent, **kwargs):
+      calls.append(( files, nSkip, nEvents, iFirstEvent ))
+      return 0, nEvents
+    # sequentialEventLoop()
+    original = galleryUtils._sequentialEventLoop
+    galleryUtils._sequentialEventLoop = sequentialEventLoop
+    try:
+      for begin, end in galleryUtils._chunkEventRange(0, 25, self.offsets, 4):
+        galleryUtils._runEventRange(files, self.offsets, None, begin, end)
+      # the range across files too
+      galleryUtils._runEventRange(files, self.offsets, None, 3, 13)
+    finally: galleryUtils._sequentialEventLoop = original
+
+    # each call starts from the first file containing the range, skipping the
+    # entries before it; the first event index of that file is passed along
+    for ( callFiles, nSkip, nEvents, iFirstEvent ) in calls:
+      iFile = files.index(callFiles[0])
+      self.assertEqual(iFirstEvent, self.offsets[iFile])
+      self.assertLess(nSkip, self.Counts[iFile])
+    # for
+    self.assertEqual(sum(nEvents for _, _, nEvents, _ in calls[:-1]), 25)
+    self.assertEqual(
+      calls[-1], ( [ 'f0.root', 'f1.root', 'f2.root', 'f3.root' ], 3, 10, 0 )
+      )
+  # test_runEventRange()
+
+# class EventRangeTest
+
+
+if __name__ == "__main__": unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Test of the file list expansion in `ROOTutils` (`iterFileList()`,
+# `expandFileList()` and `FileListCache`).
+#
+# It does not need ROOT.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ROOTutils
+
+
+class FileListTest(unittest.TestCase):
+
+  def setUp(self):
+    self.baseDir = tempfile.mkdtemp(prefix='FileList_test_')
+    ROOTutils.fileListCache.clear()
+
+  def tearDown(self): shutil.rmtree(self.baseDir)
+
+  def writeList(self, name, lines):
+    path = os.path.join(self.baseDir, name)
+    with open(path, 'w') as outFile: outFile.write("\n".join(lines) + "\n")
+    return path
+  # writeList()
+
+  def test_comments(self):
+    path = self.writeList('files.list', [
+      "# header comment", "", "a.root", "b.root  # trailing comment", "  c.root",
+      ])
+    self.assertEqual(ROOTutils.expandFileList(path), [ 'a.root', 'b.root', 'c.root' ])
+    self.assertEqual(
+      ROOTutils.expandFileList(path, comment=None)[-2:],
+      [ 'b.root  # trailing comment', 'c.root' ]
+      )
+  # test_comments()
+
+  def test_nested(self):
+    inner = self.writeList('inner.list', [ "b.root", "c.root" ])
+    outer = self.writeList('outer.list', [ "a.root", inner, "d.root" ])
+    self.assertEqual(
+      list(ROOTutils.iterFileList(outer, fileListSuffixes=[ '.list' ])),
+      [ 'a.root', 'b.root', 'c.root', 'd.root' ]
+      )
+    # without suffixes, the inner list is just an entry
+    self.assertEqual(ROOTutils.expandFileList(outer), [ 'a.root', inner, 'd.root' ])
+  # test_nested()
+
+  def test_repeatedInclusion(self):
+    inner = self.writeList('inner.list', [ "b.root" ])
+    outer = self.writeList('outer.list', [ inner, "a.root", inner ])
+    self.assertEqual(
+      ROOTutils.expandFileList(outer, fileListSuffixes=[ '.list' ]),
+      [ 'b.root', 'a.root', 'b.root' ]
+      )
+  # test_repeatedInclusion()
+
+  def test_cycle(self):
+    first = os.path.join(self.baseDir, 'first.list')
+    second = self.writeList('second.list', [ "b.root", first ])
+    self.writeList('first.list', [ "a.root", second ])
+    with self.assertRaises(RuntimeError):
+      ROOTutils.expandFileList(first, fileListSuffixes=[ '.list' ])
+  # test_cycle()
+
+  def test_cache(self):
+    path = self.writeList('files.list', [ "a.root", "b.root" ])
+    self.assertEqual(ROOTutils.expandFileList(path, cache=True), [ 'a.root', 'b.root' ])
+    self.assertEqual(len(ROOTutils.fileListCache.lists), 1)
+    # the cached content is used while the file is unchanged...
+    stat = os.stat(path)
+    with open(path, 'w') as outFile: outFile.write("c.root\nd.root\n")
+    os.utime(path, ns=( stat.st_atime_ns, stat.st_mtime_ns ))
+    self.assertEqual(ROOTutils.expandFileList(path, cache=True), [ 'a.root', 'b.root' ])
+    # ... and it's read again after a change
+    os.utime(path, ns=( stat.st_atime_ns, stat.st_mtime_ns + 10**9 ))
+    self.assertEqual(ROOTutils.expandFileList(path, cache=True), [ 'c.root', 'd.root' ])
+  # test_cache()
+
+  def test_partialReadNotCached(self):
+    path = self.writeList('files.list', [ "a.root", "b.root" ])
+    next(ROOTutils.iterFileList(path, cache=True))
+    self.assertEqual(len(ROOTutils.fileListCache.lists), 0)
+  # test_partialReadNotCached()
+
+  def test_cacheBound(self):
+    cache = ROOTutils.FileListCache(maxBytes=40)
+    paths = [
+      self.writeList('list%d.list' % i, [ "file%d.root" % i ]) for i in range(4)
+      ] # 11 bytes each
+    large = self.writeList('large.list', [ "file%02d.root" % i for i in range(10) ])
+    for path in paths: list(cache.lines(path, '#'))
+    self.assertLessEqual(cache.nBytes, cache.maxBytes)
+    self.assertEqual(len(cache.lists), 3) # the oldest was dropped
+    self.assertNotIn(( paths[0], '#' ), cache.lists)
+    self.assertEqual(len(list(cache.lines(large, '#'))), 10)
+    self.assertNotIn(( large, '#' ), cache.lists) # too large
+    self.assertEqual(len(cache.lists), 3)
+  # test_cacheBound()
+
+# class FileListTest
+
+
+if __name__ == "__main__": unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Test of `galleryUtils.FileStager`, using local directories as stand-in for
+# both the shared input storage and the scratch area.
+# 
+# It does not need ROOT.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import galleryUtils
+
+
+class FileStagerTest(unittest.TestCase):
+  
+  FileSize = 30
+  
+  def setUp(self):
+    self.baseDir = tempfile.mkdtemp(prefix='FileStager_test_')
+    self.inputDir = os.path.join(self.baseDir, 'input')
+    self.scratchDir = os.path.join(self.baseDir, 'scratch')
+    os.makedirs(self.inputDir)
+    self.files = [ self.writeInput("f%d.root" % i, str(i)) for i in range(5) ]
+  # setUp()
+  
+  def tearDown(self): shutil.rmtree(self.baseDir)
+  
+  def writeInput(self, name, content):
+    path = os.path.join(self.inputDir, name)
+    with open(path, 'w') as outFile:
+      outFile.write((content * self.FileSize)[:self.FileSize])
+    return path
+  # writeInput()
+  
+  @staticmethod
+  def readFile(path):
+    with open(path) as inputFile: return inputFile.read()
+  
+  def scratchSize(self):
+    return sum(
+      os.path.getsize(os.path.join(self.scratchDir, name))
+      for name in os.listdir(self.scratchDir)
+      )
+  # scratchSize()
+  
+  def readAll(self, stager, files):
+    """Reads the files in sequence like an event loop, returns the contents."""
+    contents = []
+    stager.start(files)
+    for path in files:
+      localPath = stager.get(path)
+      self.assertTrue(localPath.startswith(self.scratchDir))
+      contents.append(self.readFile(localPath))
+      stager.release(path)
+    # for
+    return contents
+  # readAll()
+  
+  def testStaging(self):
+    with galleryUtils.staging(galleryUtils.FileStager(self.scratchDir)) as stager:
+      contents = self.readAll(stager, self.files)
+    expected = list(map(self.readFile, self.files))
+    self.assertEqual(contents, expected)
+  # testStaging()
+  
+  def testReadAheadWithRepeatedFiles(self):
+    # an entry list gives the same file once per selected event
+    order = [ self.files[0] ] * 5 + [ self.files[1] ] * 2
+    with galleryUtils.staging \
+     (galleryUtils.FileStager(self.scratchDir, readAhead=1)) as stager \
+    :
+      stager.start(order)
+      stager.get(self.files[0])
+      self.assertIn(self.files[1], stager.ready)
+      self.assertTrue(stager.ready[self.files[1]].wait(timeout=10))
+    # with
+  # testReadAheadWithRepeatedFiles()
+  
+  def testSizeLimit(self):
+    maxSize = 2 * self.FileSize
+    with galleryUtils.staging(galleryUtils.FileStager(
+     self.scratchDir, readAhead=0, maxSize=maxSize,
+     )) as stager:
+      self.readAll(stager, self.files)
+    # with
+    self.assertLessEqual(self.scratchSize(), maxSize)
+  # testSizeLimit()
+  
+  def testSharedScratch(self):
+    # two stagers (like two parallel workers) using the same scratch directory
+    maxSize = 2 * self.FileSize
+    first = galleryUtils.FileStager(self.scratchDir, readAhead=0, maxSize=maxSize)
+    second = galleryUtils.FileStager(self.scratchDir, readAhead=0, maxSize=maxSize)
+    with galleryUtils.staging(first), galleryUtils.staging(second):
+      first.start(self.files[:1])
+      inUse = first.get(self.files[0])
+      contents = self.readAll(second, self.files[1:])
+      # the file in use by the first stager was not evicted by the second one
+      self.assertEqual(self.readFile(inUse), self.readFile(self.files[0]))
+      first.release(self.files[0])
+    # with
+    self.assertEqual(contents, list(map(self.readFile, self.files[1:])))
+    self.assertLessEqual(self.scratchSize(), maxSize)
+  # testSharedScratch()
+  
+  def testModifiedInput(self):
+    with galleryUtils.staging(galleryUtils.FileStager(self.scratchDir)) as stager:
+      self.readAll(stager, self.files[:1])
+    # a new job sees the same file, modified but with the same size
+    stat = os.stat(self.files[0])
+    self.writeInput(os.path.basename(self.files[0]), 'x')
+    os.utime(self.files[0], ns=( stat.st_atime_ns, stat.st_mtime_ns + 10**9 ))
+    with galleryUtils.staging(galleryUtils.FileStager(self.scratchDir)) as stager:
+      contents = self.readAll(stager, self.files[:1])
+    self.assertEqual(contents, [ 'x' * self.FileSize ])
+  # testModifiedInput()
+  
+  def testUnstageable(self):
+    url = "root://example.org//data/f0.root"
+    with galleryUtils.staging(galleryUtils.FileStager(self.scratchDir)) as stager:
+      stager.start([ url ])
+      self.assertEqual(stager.get(url), url)
+    # with
+  # testUnstageable()
+  
+# class FileStagerTest
+
+
+if __name__ == "__main__": unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Test of `cppUtils.PathIndex`, the index of search directory content.
+#
+# It does not need ROOT.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cppUtils
+
+
+class PathIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.baseDir = tempfile.mkdtemp(prefix='PathIndex_test_')
+    self.dirs = []
+    for name in ( 'first', 'second', 'third' ):
+      path = os.path.join(self.baseDir, name)
+      os.makedirs(os.path.join(path, 'pkg'))
+      self.dirs.append(path)
+    # for
+    self.touch(self.dirs[0], 'pkg/a.h')
+    self.touch(self.dirs[1], 'pkg/a.h')
+    self.touch(self.dirs[2], 'pkg/b.h')
+  # setUp()
+
+  def tearDown(self): shutil.rmtree(self.baseDir)
+
+  @staticmethod
+  def touch(directory, relPath):
+    path = os.path.join(directory, relPath)
+    open(path, 'w').close()
+    return path
+  # touch()
+
+  def test_find(self):
+    index = cppUtils.PathIndex()
+    # the first search directory has priority
+    self.assertEqual(index.find('pkg/a.h', self.dirs),
+      os.path.join(self.dirs[0], 'pkg', 'a.h'))
+    self.assertEqual(index.find('pkg/a.h', self.dirs[::-1]),
+      os.path.join(self.dirs[1], 'pkg', 'a.h'))
+    self.assertEqual(index.find('pkg/b.h', self.dirs),
+      os.path.join(self.dirs[2], 'pkg', 'b.h'))
+    self.assertIsNone(index.find('pkg/c.h', self.dirs))
+    self.assertIsNone(index.find('missing/c.h', self.dirs))
+    absPath = os.path.join(self.dirs[2], 'pkg', 'b.h')
+    self.assertEqual(index.find(absPath, self.dirs[:1]), absPath)
+  # test_find()
+
+  def test_stats(self):
+    index = cppUtils.PathIndex()
+    for _ in range(3): index.find('pkg/b.h', self.dirs)
+    stats = index.stats()
+    self.assertEqual(stats['listings'], 3) # each `pkg` directory listed once
+    self.assertEqual(stats['plainChecks'], 9) # 3 existence checks per lookup
+    self.assertEqual(stats['saved'], 6)
+  # test_stats()
+
+  def test_invalidate(self):
+    index = cppUtils.PathIndex()
+    self.assertIsNone(index.find('pkg/c.h', self.dirs))
+    newPath = self.touch(self.dirs[1], 'pkg/c.h')
+    self.assertIsNone(index.find('pkg/c.h', self.dirs)) # not noticed...
+    index.invalidate()
+    self.assertEqual(index.find('pkg/c.h', self.dirs), newPath) # ... until now
+  # test_invalidate()
+
+# class PathIndexTest
+
+
+if __name__ == "__main__": unittest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# Benchmarks of `ROOTutils`: the time to import the python helper modules
+# (and to load ROOT afterwards), and the overlap of `AsyncROOTwriter` writing
+# with the Python processing.
+#
+# They need ROOT, and they are meant to be run by hand:
+#     
+#     python ROOTutils_benchmarks.py import [module ...]
+#     python ROOTutils_benchmarks.py writer
+#     
+#
+
+import ROOTutils
+from ROOTutils import ROOT
+
+
+def importBenchmark(
+ modules: "names of the modules to be imported" = ( 'ROOTutils', 'galleryUtils', ),
+ repeat: "number of measurements for each module" = 3,
+ ) -> "dictionary: module -> ( import time [s], time to load ROOT [s] )":
+  """Measures the time needed to import each module, and then to load ROOT.
+  
+  Each measurement is performed in a new python process, and the best time of
+  `repeat` measurements is reported.
+  The import time should not include the initialization of the ROOT
+  interpreter, which is deferred to its first use.
+  The result is also printed.
+  
+  Example: `python ROOTutils_benchmarks.py import LArSoftUtils ICARUSservices`.
+  """
+  import sys, subprocess
+  code = """
+import sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+import ROOTutils
+ROOTutils.ROOT.load()
+loaded = time.perf_counter()
+print(imported - start, loaded - imported)
+"""
+  timings = {}
+  for module in modules:
+    measurements = [
+      tuple(map(float, subprocess.check_output(
+        [ sys.executable, '-c', code.format(module=module) ],
+        universal_newlines=True,
+        ).split()[-2:]))
+      for _ in range(repeat)
+      ]
+    timings[module] = tuple(map(min, zip(*measurements)))
+    print("%-20s  import: %7.3f s   ROOT loading: %7.3f s"
+      % (( module, ) + timings[module]))
+  # for
+  return timings
+# importBenchmark()
+
+
+def asyncWriterBenchmark(
+ nObjects: "number of histograms to be written" = 200,
+ nBins: "number of bins of each histogram" = 100000,
+ compressionLevel: "compression level of the output file" = 9,
+ ) -> "fraction of the Python processing rate kept while writing":
+  """Measures how much Python work proceeds while `AsyncROOTwriter` writes.
+  
+  A pure Python loop is timed alone, and then while the writer is writing
+  and compressing `nObjects` histograms into a temporary file. The ratio of
+  the two rates is `1` for full overlap, and close to `0` if the writer
+  blocks the Python thread. The result is also printed.
+  
+  Example: `python ROOTutils_benchmarks.py writer`.
+  """
+  import os, time, tempfile
+  
+  def spin(keepGoing, minTime = 0.0):
+    nIterations = 0
+    start = time.perf_counter()
+    while keepGoing() or time.perf_counter() - start < minTime:
+      nIterations += 1
+    return nIterations / (time.perf_counter() - start)
+  # spin()
+  
+  histograms = []
+  for iObject in range(nObjects):
+    hist = ROOT.TH1D("H%d" % iObject, "", nBins, -5.0, 5.0)
+    hist.SetDirectory(ROOT.nullptr)
+    hist.FillRandom("gaus", nBins)
+    histograms.append(hist)
+  # for
+  
+  aloneRate = spin(lambda: False, minTime=1.0)
+  
+  fd, outputPath = tempfile.mkstemp(suffix='.root')
+  os.close(fd)
+  try:
+    writer = ROOTutils.AsyncROOTwriter(
+      compressionLevel=compressionLevel, fileMode="RECREATE", report=False,
+      maxQueued=nObjects, enableThreadSafety=True,
+      )
+    for hist in histograms: writer.write(outputPath + ":", hist, clone=False)
+    writingRate = spin(lambda: writer.nObjects < nObjects)
+    stats = writer.close()
+  finally:
+    os.unlink(outputPath)
+  # try ... finally
+  
+  overlap = writingRate / aloneRate
+  print("Python loop rate while writing %d objects (%.1f MiB in %.3f s):"
+    " %.0f%% of the rate alone" % (
+      stats['objects'], stats['bytes'] / 2**20, stats['writeTime'],
+      overlap * 100.0,
+    ))
+  return overlap
+# asyncWriterBenchmark()
+
+
+################################################################################
+if __name__ == "__main__":
+  import sys
+  benchmarks = { 'import': importBenchmark, 'writer': asyncWriterBenchmark, }
+  if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+    raise SystemExit(
+      "Usage: %s {%s} [arguments]" % (sys.argv[0], "|".join(benchmarks)))
+  # if
+  if sys.argv[1] == 'import' and len(sys.argv) > 2: importBenchmark(sys.argv[2:])
+  else: benchmarks[sys.argv[1]]()
+# main